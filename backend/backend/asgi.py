@@ -14,3 +14,13 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# Load mechanics and sentiment in the background so the first request does not pay for it
+if os.getenv('RECOMMENDER_WARMUP', '1') == '1':
+    from mech_recommend.recommendation import recommender
+    recommender.warm_up()
+
+# Cancels expired broadcast requests, including ones left over from before a restart
+if os.getenv('REQUEST_EXPIRY_SWEEPER', '1') == '1':
+    from mech_recommend.views import expiry_sweeper
+    expiry_sweeper.start()
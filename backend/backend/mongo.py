@@ -0,0 +1,254 @@
+import bisect
+import os
+import threading
+from collections import defaultdict
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, monitoring
+
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+
+# ---------------------------
+# Connection Settings
+# ---------------------------
+MONGO_URL = os.getenv('MONGO_URL')
+MONGO_DB_NAME = os.getenv('MONGO_DB_NAME')
+
+# Connections per process. Every gunicorn/uvicorn worker has its own pool, so
+# the server sees up to workers x MONGO_MAX_POOL_SIZE (plus monitor sockets).
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 300000))
+
+# How long a request waits for a free pooled connection before failing, rather
+# than queueing forever when the pool is too small for the load
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+# 0 = no socket timeout; long aggregations (rebuild_daily_counters) and change streams rely on it
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 0))
+
+# primary | primaryPreferred | secondary | secondaryPreferred | nearest. Writes
+# (and find_one_and_update) always go to the primary.
+MONGO_READ_PREFERENCE = os.getenv('MONGO_READ_PREFERENCE', 'primary')
+MONGO_APP_NAME = os.getenv('MONGO_APP_NAME', 'mechafix')
+
+
+def client_options():
+    return {
+        'maxPoolSize': MONGO_MAX_POOL_SIZE,
+        'minPoolSize': MONGO_MIN_POOL_SIZE,
+        'maxIdleTimeMS': MONGO_MAX_IDLE_TIME_MS,
+        'waitQueueTimeoutMS': MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        'connectTimeoutMS': MONGO_CONNECT_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        'socketTimeoutMS': MONGO_SOCKET_TIMEOUT_MS or None,
+        'readPreference': MONGO_READ_PREFERENCE,
+        'appname': MONGO_APP_NAME,
+    }
+
+
+# ---------------------------
+# Metrics
+# ---------------------------
+# Upper bounds (ms) of the latency histogram buckets; percentiles are reported
+# as the bound of the bucket they fall in
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+
+class LatencyStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+
+    def observe(self, ms):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+
+    def percentile(self, p):
+        if not self.count:
+            return None
+        rank, seen = p * self.count, 0
+        for bound, n in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(bound, round(self.max_ms, 3))
+        return round(self.max_ms, 3)
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total_ms / self.count, 3) if self.count else None,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max_ms, 3),
+        }
+
+
+class MongoMetrics(monitoring.ConnectionPoolListener, monitoring.CommandListener):
+    """
+    Pool and command events of this process's client: how long requests wait
+    for a pooled connection, how many are in use, and per-command latency.
+    When pool wait grows while the server's own latency does not, the pool is
+    too small for the worker's concurrency.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pool_wait = LatencyStats()
+        self.checkout_failures = defaultdict(int)
+        self.connections_open = 0
+        self.connections_in_use = 0
+        self.max_in_use = 0
+        self.pool_clears = 0
+        self.commands = defaultdict(LatencyStats)
+        self.command_failures = defaultdict(int)
+
+    # Connection pool events
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.pool_wait.observe(event.duration * 1000)
+            self.connections_in_use += 1
+            self.max_in_use = max(self.max_in_use, self.connections_in_use)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.pool_wait.observe(event.duration * 1000)
+            self.checkout_failures[str(event.reason)] += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.connections_in_use -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_open += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_open -= 1
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pool_clears += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    # Command events
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        with self._lock:
+            self.commands[event.command_name].observe(event.duration_micros / 1000)
+
+    def failed(self, event):
+        with self._lock:
+            self.commands[event.command_name].observe(event.duration_micros / 1000)
+            self.command_failures[event.command_name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pool': {
+                    'max_size': MONGO_MAX_POOL_SIZE,
+                    'connections_open': self.connections_open,
+                    'connections_in_use': self.connections_in_use,
+                    'max_in_use': self.max_in_use,
+                    'cleared': self.pool_clears,
+                    'wait': self.pool_wait.snapshot(),
+                    'checkout_failures': dict(self.checkout_failures),
+                },
+                'commands': {name: stats.snapshot() for name, stats in sorted(self.commands.items())},
+                'command_failures': dict(self.command_failures),
+            }
+
+
+metrics = MongoMetrics()
+
+
+# ---------------------------
+# Shared Client
+# ---------------------------
+_lock = threading.Lock()
+_client = None
+_pid = None
+
+
+def get_client():
+    """
+    The process-wide MongoClient, created on first use. A forked worker gets
+    a fresh client (and pool) of its own; the parent's sockets and monitor
+    threads are never used across a fork.
+    """
+    global _client, _pid
+    if _client is None or _pid != os.getpid():
+        with _lock:
+            if _client is None or _pid != os.getpid():
+                _client = MongoClient(MONGO_URL, event_listeners=[metrics], **client_options())
+                _pid = os.getpid()
+                print(f"🔌 MongoDB pool ready in pid {_pid} (maxPoolSize={MONGO_MAX_POOL_SIZE}, "
+                      f"readPreference={MONGO_READ_PREFERENCE})")
+    return _client
+
+
+def get_db(name=None):
+    return get_client()[name or MONGO_DB_NAME]
+
+
+def _after_fork_in_child():
+    global _lock, _client, _pid
+    # The locks may have been held by another thread at fork time
+    _lock = threading.Lock()
+    _client, _pid = None, None
+    metrics._lock = threading.Lock()
+    metrics.reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+class _Lazy:
+    """Resolves to the current process's database/collection on every access, so module globals survive forks."""
+
+    def __init__(self, resolve):
+        self._resolve = resolve
+
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+
+    def __getitem__(self, name):
+        return self._resolve()[name]
+
+    def __repr__(self):
+        return f"<lazy {self._resolve()!r}>"
+
+
+def collection(name):
+    return _Lazy(lambda: get_db()[name])
+
+
+# `from backend.mongo import db` for module globals; db.<collection> / db[...] use the current client
+db = _Lazy(get_db)
@@ -143,9 +143,23 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 
-# CACHES = {
-#     'default': {
-#         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-#         'LOCATION': 'unique-otp-cache',
-#     }
-# }
\ No newline at end of file
+# OTPs, signup state and recommendation cursors live in the cache, so with
+# more than one worker process it has to be shared between them: set
+# CACHE_REDIS_URL (e.g. redis://localhost:6379/1, needs the redis package).
+# Unset, each process keeps its own LocMemCache, which is only correct for a
+# single worker.
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-otp-cache',
+        }
+    }
\ No newline at end of file
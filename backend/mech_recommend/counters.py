@@ -0,0 +1,131 @@
+from collections import defaultdict
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+
+# Per-mechanic, per-day request counts behind the mechanic dashboard. One
+# document per (mech_id, day), kept current with $inc as requests change
+# state, so the overview is a single point read. The day is the UTC date the
+# request was created, like the overview's "today".
+COUNTERS_COLLECTION = 'mech_daily_counters'
+COUNTER_FIELDS = ['total', 'pending', 'completed', 'cancelled', 'rejected']
+
+# mechanics_list status -> counter. Accepted/assigned requests are still open
+# work, so the dashboard shows them as pending.
+STATUS_COUNTER = {
+    'pending': 'pending',
+    'accepted': 'pending',
+    'assigned': 'pending',
+    'completed': 'completed',
+    'cancelled': 'cancelled',
+    'rejected': 'rejected',
+}
+
+# Projection a transition needs from the request as it was before the update
+TRANSITION_FIELDS = {'created_at': 1, 'mechanics_list.mech_id': 1, 'mechanics_list.status': 1}
+
+
+def day_key(created_at):
+    return (created_at or datetime.utcnow()).strftime('%Y-%m-%d')
+
+
+def status_deltas(request, new_statuses, created=False):
+    """
+    {(mech_id, day): {counter: delta}} for a request whose mechanics_list
+    entries change to new_statuses ({mech_id: status}). request is the
+    document before the change; created counts it as new for every mechanic.
+    """
+    day = day_key(request.get('created_at'))
+    deltas = defaultdict(lambda: defaultdict(int))
+    for m in request.get('mechanics_list', []):
+        if not m.get('mech_id'):
+            continue
+        mech_id = str(m['mech_id'])
+        before = None if created else STATUS_COUNTER.get(m.get('status'))
+        after = STATUS_COUNTER.get(new_statuses.get(mech_id, m.get('status')))
+        if created:
+            deltas[(mech_id, day)]['total'] += 1
+        if before != after:
+            if before:
+                deltas[(mech_id, day)][before] -= 1
+            if after:
+                deltas[(mech_id, day)][after] += 1
+    return deltas
+
+
+def transition(request, mech_id=None, status=None, cancel_pending=False):
+    """
+    Deltas for the transitions the views make: mech_id's entry moves to
+    status, and with cancel_pending every other pending entry is cancelled.
+    mech_id=None with cancel_pending cancels every pending entry (expiry).
+    """
+    new_statuses = {}
+    for m in request.get('mechanics_list', []):
+        if not m.get('mech_id'):
+            continue
+        if mech_id is not None and str(m['mech_id']) == str(mech_id):
+            new_statuses[str(m['mech_id'])] = status
+        elif cancel_pending and m.get('status') == 'pending':
+            new_statuses[str(m['mech_id'])] = 'cancelled'
+    return status_deltas(request, new_statuses)
+
+
+def record(collection, *deltas):
+    """
+    Applies deltas as one unordered bulk_write of $inc upserts. Counters are
+    a derived view (rebuild_daily_counters repairs them), so a failure here
+    is logged and never fails the request that caused it.
+    """
+    merged = defaultdict(lambda: defaultdict(int))
+    for delta in deltas:
+        for key, fields in delta.items():
+            for field, n in fields.items():
+                merged[key][field] += n
+    ops = [
+        UpdateOne({'mech_id': mech_id, 'day': day}, {'$inc': {f: n for f, n in fields.items() if n}}, upsert=True)
+        for (mech_id, day), fields in merged.items() if any(fields.values())
+    ]
+    if not ops:
+        return
+    try:
+        collection.bulk_write(ops, ordered=False)
+    except PyMongoError as e:
+        print(f"⚠️ Daily counter update failed: {e}")
+
+
+def rebuild_pipeline(since=None, rebuilt_at=None):
+    """
+    Recomputes counters from service_requests and $merges them into
+    mech_daily_counters. Every document it writes is stamped with
+    rebuilt_at, so counters it did not touch can be removed afterwards.
+    """
+    match = {'created_at': {'$gte': since}} if since else {}
+    return [
+        {'$match': match},
+        {'$unwind': '$mechanics_list'},
+        {'$match': {'mechanics_list.mech_id': {'$nin': [None, '']}}},
+        {'$group': {
+            '_id': {
+                'mech_id': {'$toString': '$mechanics_list.mech_id'},
+                'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$created_at'}},
+            },
+            'total': {'$sum': 1},
+            **{
+                counter: {'$sum': {'$cond': [
+                    {'$in': ['$mechanics_list.status', [s for s, c in STATUS_COUNTER.items() if c == counter]]}, 1, 0,
+                ]}}
+                for counter in COUNTER_FIELDS if counter != 'total'
+            },
+        }},
+        {'$match': {'_id.day': {'$ne': None}}},
+        {'$project': {
+            '_id': 0,
+            'mech_id': '$_id.mech_id',
+            'day': '$_id.day',
+            **{counter: 1 for counter in COUNTER_FIELDS},
+            'rebuilt_at': {'$literal': rebuilt_at},
+        }},
+        {'$merge': {'into': COUNTERS_COLLECTION, 'on': ['mech_id', 'day'],
+                    'whenMatched': 'replace', 'whenNotMatched': 'insert'}},
+    ]
@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+from pymongo.errors import PyMongoError
+
+from . import counters
+
+# A broadcast request nobody has acted on is cancelled this long after it was created
+REQUEST_EXPIRY_SECONDS = float(os.getenv('REQUEST_EXPIRY_SECONDS', 120))
+
+# How often the sweeper looks for overdue requests, so a request is cancelled
+# at most this late. 0 disables the in-process sweeper (e.g. when
+# `manage.py expire_requests --loop` runs as its own process instead).
+EXPIRY_SWEEP_INTERVAL = float(os.getenv('EXPIRY_SWEEP_INTERVAL', 5))
+
+
+def expires_at(created_at):
+    return created_at + timedelta(seconds=REQUEST_EXPIRY_SECONDS)
+
+
+def ensure_expiry_index(collection):
+    # Sparse: only requests still waiting to expire carry expires_at, so the index stays small
+    collection.create_index([('expires_at', ASCENDING)], name='expires_at_sparse', sparse=True)
+
+
+def cancel_expired(collection, now=None, batch_size=1000):
+    """
+    Cancels every overdue request whose mechanics are all still pending,
+    batch_size at a time with update_many, and drops expires_at from overdue
+    requests that someone already acted on. The updates are conditional, so
+    any number of processes can sweep at the same time; the requests a sweep
+    cancelled are the ones stamped with its cancelled_at, and only those are
+    counted in mech_daily_counters. Returns the number cancelled.
+    """
+    now = now or datetime.utcnow()
+    overdue = {
+        'expires_at': {'$lte': now},
+        'mechanics_list': {'$not': {'$elemMatch': {'status': {'$ne': 'pending'}}}},
+    }
+    total = 0
+    while True:
+        batch = {doc['_id']: doc for doc in collection.find(overdue, counters.TRANSITION_FIELDS).limit(batch_size)}
+        if not batch:
+            break
+        collection.update_many(
+            {'_id': {'$in': list(batch)}, **overdue},
+            {
+                '$set': {'mechanics_list.$[].status': 'cancelled', 'cancelled_at': now},
+                '$unset': {'expires_at': ''},
+            },
+        )
+        cancelled = [batch[doc['_id']] for doc in collection.find({'_id': {'$in': list(batch)}, 'cancelled_at': now}, {'_id': 1})]
+        counters.record(collection.database[counters.COUNTERS_COLLECTION],
+                        *(counters.transition(doc, cancel_pending=True) for doc in cancelled))
+        total += len(cancelled)
+        if len(batch) < batch_size:
+            break
+    collection.update_many({'expires_at': {'$lte': now}}, {'$unset': {'expires_at': ''}})
+    return total
+
+
+# ---------------------------
+# Expiry Sweeper
+# ---------------------------
+class ExpirySweeper:
+    """
+    One background thread per process that cancels overdue broadcast requests,
+    replacing a sleeping Timer thread per request. The deadline lives on the
+    request itself (expires_at), so requests created before a restart are
+    still cancelled afterwards: the first sweep catches up on them.
+    """
+
+    def __init__(self, collection, interval=EXPIRY_SWEEP_INTERVAL):
+        self.collection = collection
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.swept_at = None
+        self.cancelled = 0
+        self.error = None
+
+    def start(self):
+        """Starts the sweeper thread once per process; safe to call on every request."""
+        if not self.interval or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._lock:
+            # A forked worker inherits the attributes but not the thread
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='request-expiry', daemon=True)
+            self._thread.start()
+
+    def sweep(self):
+        cancelled = cancel_expired(self.collection)
+        self.swept_at = time.time()
+        self.cancelled += cancelled
+        if cancelled:
+            print(f"⏰ Auto-cancelled {cancelled} unaccepted service requests")
+        return cancelled
+
+    def _run(self):
+        try:
+            ensure_expiry_index(self.collection)
+        except PyMongoError as e:
+            print(f"expires_at index could not be created: {e}")
+        while True:
+            try:
+                self.sweep()
+                self.error = None
+            except Exception as e:
+                self.error = str(e)
+                print(f"Request expiry sweep failed: {e}")
+            time.sleep(self.interval)
+
+    def status(self):
+        return {
+            'interval': self.interval,
+            'running': self._thread is not None and self._pid == os.getpid(),
+            'swept_at': self.swept_at,
+            'cancelled': self.cancelled,
+            'error': self.error,
+        }
@@ -0,0 +1,126 @@
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+# ---------------------------
+# Index Registry
+# ---------------------------
+# Every index the service request views rely on, per collection. Created by
+# `manage.py ensure_indexes`; create_indexes is a no-op for ones that exist.
+INDEXES = {
+    'service_requests': [
+        # A mechanic's queue: $elemMatch on mech_id + status (multikey, same array), in feed order
+        IndexModel([('mechanics_list.mech_id', ASCENDING), ('mechanics_list.status', ASCENDING),
+                    ('created_at', DESCENDING), ('_id', DESCENDING)], name='mechanic_status_created_at'),
+        # Requests pending for anyone, newest first (pending-requests without a mech_id)
+        IndexModel([('mechanics_list.status', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+                   name='status_created_at'),
+        # A mechanic's completed requests, most recently completed first
+        IndexModel([('mechanics_list.mech_id', ASCENDING), ('mechanics_list.status', ASCENDING),
+                    ('completed_at', DESCENDING), ('_id', DESCENDING)], name='mechanic_status_completed_at'),
+        # Every request a mechanic was offered, in feed order
+        IndexModel([('mechanics_list.mech_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+                   name='mechanic_created_at'),
+        # A customer's requests, newest first
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING)], name='user_created_at'),
+        # Requests a garage accepted / a worker was assigned, newest assignment first
+        IndexModel([('accepted_by', ASCENDING), ('worker_assigned_at', DESCENDING)],
+                   name='accepted_by_assigned_at'),
+        IndexModel([('assigned_worker.worker_id', ASCENDING), ('worker_assigned_at', DESCENDING)],
+                   name='worker_assigned_at'),
+        IndexModel([('assigned_worker.worker_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)],
+                   name='worker_created_at'),
+        # Broadcast requests still waiting to expire (see expiry.py)
+        IndexModel([('expires_at', ASCENDING)], name='expires_at_sparse', sparse=True),
+    ],
+    'auth_mech': [
+        IndexModel([('username', ASCENDING)], name='username'),
+        IndexModel([('garage_name', ASCENDING)], name='garage_name'),
+    ],
+    # One counter document per mechanic and day (see counters.py); unique so
+    # concurrent $inc upserts and rebuild_daily_counters' $merge never duplicate it
+    'mech_daily_counters': [
+        IndexModel([('mech_id', ASCENDING), ('day', ASCENDING)], name='mech_day', unique=True),
+    ],
+}
+
+
+def ensure_indexes(db):
+    """Creates every registered index; returns {collection: [index names]}."""
+    return {name: db[name].create_indexes(models) for name, models in INDEXES.items()}
+
+
+# ---------------------------
+# Query Builders
+# ---------------------------
+# Each returns (filter, sort) shaped so one of the indexes above can serve it.
+
+def mech_id_values(mech_id):
+    """Values a mechanics_list.mech_id can hold for mech_id; older requests stored ObjectIds."""
+    ids = [str(mech_id)]
+    if ObjectId.is_valid(ids[0]):
+        ids.append(ObjectId(ids[0]))
+    return ids
+
+
+def pending_requests_query(mech_id=None):
+    """Requests still pending for mech_id, or pending for anyone without one, newest first."""
+    if mech_id:
+        query = {'mechanics_list': {'$elemMatch': {'mech_id': {'$in': mech_id_values(mech_id)}, 'status': 'pending'}}}
+    else:
+        query = {'mechanics_list.status': 'pending'}
+    return query, [('created_at', DESCENDING), ('_id', DESCENDING)]
+
+
+def assigned_requests_query(mech_id=None, worker_id=None):
+    """Requests accepted by mech_id and/or assigned to worker_id that the mechanic has not completed."""
+    query = {}
+    if mech_id:
+        query['accepted_by'] = str(mech_id)
+        query['mechanics_list'] = {
+            '$not': {'$elemMatch': {'mech_id': {'$in': mech_id_values(mech_id)}, 'status': 'completed'}}
+        }
+    if worker_id:
+        query['assigned_worker.worker_id'] = str(worker_id)
+    return query, [('worker_assigned_at', DESCENDING)]
+
+
+def user_active_request_query(user_id):
+    """A customer's requests that a mechanic or worker has taken on and nobody has completed."""
+    query = {
+        'user_id': str(user_id),
+        'mechanics_list.status': {'$ne': 'completed'},
+        '$or': [
+            {'assigned_worker': {'$nin': [None, {}]}},
+            {'mechanics_list.status': {'$in': ['accepted', 'assigned']}},
+        ],
+    }
+    return query, [('created_at', DESCENDING)]
+
+
+def mechanic_feed_query(mech_id, completed=False, after=None):
+    """
+    A mechanic's requests, newest first: every request they were offered or
+    assigned to by created_at, or only the ones they completed by
+    completed_at. after is the (sort value, _id) of the last request already
+    sent; requests without the sort field sort last.
+    """
+    ids = mech_id_values(mech_id)
+    if completed:
+        field = 'completed_at'
+        query = {'mechanics_list': {'$elemMatch': {'mech_id': {'$in': ids}, 'status': 'completed'}}}
+    else:
+        field = 'created_at'
+        query = {'$or': [{'mechanics_list.mech_id': {'$in': ids}}, {'assigned_worker.worker_id': str(mech_id)}]}
+
+    if after is not None:
+        value, last_id = after
+        if value is None:
+            page = {field: None, '_id': {'$lt': last_id}}
+        else:
+            page = {'$or': [
+                {field: {'$lt': value}},
+                {field: value, '_id': {'$lt': last_id}},
+                {field: None},
+            ]}
+        query = {'$and': [query, page]}
+    return query, [(field, DESCENDING), ('_id', DESCENDING)]
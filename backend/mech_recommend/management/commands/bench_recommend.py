@@ -0,0 +1,358 @@
+import gc
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from bson import ObjectId
+from django.core.management.base import BaseCommand, CommandError
+
+from mech_recommend.scoring import ScoringEngine, haversine_distance, top_k_unique
+from mech_recommend.store import MechanicStore
+
+
+def synthetic_mechanics(n, seed=0):
+    """Random mechanics scattered around Ahmedabad, shaped like find_mech rows."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'mech_name': [f'mech_{i}' for i in range(n)],
+        'mech_lat': 23.03 + rng.normal(0, 0.5, n),
+        'mech_long': 72.58 + rng.normal(0, 0.5, n),
+        'rating': rng.uniform(1, 5, n).round(1),
+        'sentiment_score': rng.uniform(-1, 1, n),
+        'breakdown_type': rng.choice(['engine', 'battery', 'tyre', 'brake'], n),
+    })
+
+
+def legacy_score(df, user_lat, user_long):
+    """The original row-wise pandas pipeline, kept as the baseline."""
+    filtered = df.copy()
+    filtered['distance_km'] = filtered.apply(
+        lambda row: haversine_distance(user_lat, user_long, row['mech_lat'], row['mech_long']), axis=1
+    )
+    filtered['norm_rating'] = (filtered['rating'] - filtered['rating'].min()) / (filtered['rating'].max() - filtered['rating'].min())
+    filtered['norm_sentiment'] = (filtered['sentiment_score'] - filtered['sentiment_score'].min()) / (filtered['sentiment_score'].max() - filtered['sentiment_score'].min())
+    filtered['inv_distance'] = 1 / (filtered['distance_km'] + 1)
+    filtered['norm_inv_distance'] = (filtered['inv_distance'] - filtered['inv_distance'].min()) / (filtered['inv_distance'].max() - filtered['inv_distance'].min())
+    filtered['score'] = (
+        0.5 * filtered['norm_inv_distance'] +
+        0.3 * filtered['norm_rating'] +
+        0.2 * filtered['norm_sentiment']
+    )
+    return filtered
+
+
+SAMPLE_COMMENTS = [
+    "good",
+    "Quick service, fixed my battery in ten minutes.",
+    "Mechanic arrived late and charged more than quoted, not happy.",
+    "Very polite team, explained the engine issue clearly and the price was fair. Would call again.",
+    "Terrible. Waited two hours on the highway, nobody picked up the phone, and the tyre "
+    "they fitted went flat again the next morning. Avoid this garage if you can.",
+]
+
+
+def synthetic_comments(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return [f"{SAMPLE_COMMENTS[i]} #{j}" for j, i in enumerate(rng.integers(0, len(SAMPLE_COMMENTS), n))]
+
+
+def synthetic_documents(n, seed=0):
+    """find_mech-shaped documents, as the loader receives them from Mongo."""
+    df = synthetic_mechanics(n, seed)
+    comments = synthetic_comments(n, seed)
+    return [
+        {'_id': ObjectId(), 'mech_name': name, 'mech_lat': lat, 'mech_long': lon, 'rating': rating,
+         'comment': comment.split(' #')[0], 'breakdown_type': breakdown_type}
+        for name, lat, lon, rating, breakdown_type, comment in zip(
+            df['mech_name'], df['mech_lat'], df['mech_long'], df['rating'], df['breakdown_type'], comments)
+    ]
+
+
+def traced(fn):
+    """(result, bytes still allocated, peak bytes) for one call, per tracemalloc."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = fn()
+        size, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, size, peak
+
+
+def current_rss_mb():
+    """Resident set size of this process (Linux /proc), or None elsewhere."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def smaps_mb():
+    """
+    (Rss, Pss, Anonymous) MB of this process from /proc/self/smaps_rollup
+    (Linux), or None. Anonymous is heap the process allocated itself; file
+    pages only it has touched so far count as private too, so Private_* would
+    charge a mapped table to whichever worker read it first.
+    """
+    values = {}
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                    values[parts[0][:-1]] = int(parts[1]) / 1024
+        return values['Rss'], values['Pss'], values['Anonymous']
+    except (OSError, KeyError):
+        return None
+
+
+def _store_worker(layout, store_dir, generation, arrays, tables, barrier, results):
+    """One forked worker: serve requests from a mapped generation or from its own copy, then report memory."""
+    from mech_recommend.recommendation import MechanicTable
+
+    before = smaps_mb()
+    if layout == 'mapped':
+        table = MechanicTable.open(store_dir, generation)
+    else:
+        # What every worker did before the shared store: build its own table
+        store = MechanicStore.from_arrays({k: np.array(v) for k, v in arrays.items()},
+                                          {k: list(v) for k, v in tables.items()})
+        table = MechanicTable(store, sentiment_ready=True)
+    opened = smaps_mb()
+    rng = np.random.default_rng()
+    for lat, lon in zip(23.03 + rng.normal(0, 0.5, 50), 72.58 + rng.normal(0, 0.5, 50)):
+        rows, _, _ = table.rank(lat, lon, 'engine', 10)
+        table.store.records(rows)
+    barrier.wait()  # every worker holds its table while the others measure
+    after = smaps_mb()
+    # (anonymous after opening the table, then RSS / PSS / anonymous after serving)
+    results.put((opened[2] - before[2],) + tuple(a - b for a, b in zip(after, before)))
+    barrier.wait()
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = "Benchmark recommendation scoring and sentiment inference on synthetic data."
+
+    # Benchmarks must not import the views (and with them the Mongo connection).
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suite', choices=['scoring', 'sentiment', 'backends', 'memory', 'shared-store'],
+                            default='scoring')
+        parser.add_argument('--sizes', default='1000,100000,1000000',
+                            help='Comma separated mechanic counts')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--legacy-max', type=int, default=100000,
+                            help='Largest size to also time with the row-wise apply baseline')
+        parser.add_argument('--comments', type=int, default=256,
+                            help='Number of comments for the sentiment suite')
+        parser.add_argument('--batch-sizes', default='8,32,64')
+        parser.add_argument('--workers', type=int, default=1)
+        parser.add_argument('--threads', type=int, default=0,
+                            help='Inference threads for the sentiment suites (0 = backend default)')
+        parser.add_argument('--backends', default='torch-int8,onnx',
+                            help='Sentiment backends to compare against fp32 torch')
+        parser.add_argument('--max-diff', type=float, default=0.1,
+                            help='Largest allowed |score - fp32 score| before the parity check fails')
+        parser.add_argument('--processes', type=int, default=4,
+                            help='Forked workers for the shared-store suite')
+
+    def handle(self, *args, **options):
+        if options['suite'] == 'sentiment':
+            return self.bench_sentiment(options)
+        if options['suite'] == 'backends':
+            return self.bench_backends(options)
+        if options['suite'] == 'memory':
+            return self.bench_memory(options)
+        if options['suite'] == 'shared-store':
+            return self.bench_shared_store(options)
+        return self.bench_scoring(options)
+
+    def bench_scoring(self, options):
+        user_lat, user_long = 23.0225, 72.5714
+        sizes = [int(s) for s in options['sizes'].split(',') if s]
+
+        self.stdout.write(f"{'mechanics':>10} {'vectorized ms':>14} {'apply ms':>10} {'speedup':>8}")
+        for n in sizes:
+            df = synthetic_mechanics(n)
+            engine = ScoringEngine.from_frame(df)
+            vec = best_of(lambda: engine.score(user_lat, user_long), options['repeat'])
+
+            if n <= options['legacy_max']:
+                legacy = best_of(lambda: legacy_score(df, user_lat, user_long), 1)
+                self.stdout.write(f"{n:>10} {vec * 1000:>14.2f} {legacy * 1000:>10.1f} {legacy / vec:>7.0f}x")
+            else:
+                self.stdout.write(f"{n:>10} {vec * 1000:>14.2f} {'-':>10} {'-':>8}")
+
+    def bench_sentiment(self, options):
+        from mech_recommend.sentiment import SentimentAnalyzer
+
+        analyzer = SentimentAnalyzer(num_threads=options['threads'], workers=options['workers'])
+        comments = synthetic_comments(options['comments'])
+        analyzer.score_batch(comments[:8])  # warm up
+
+        start = time.perf_counter()
+        for text in comments:
+            analyzer.score(text)
+        one_by_one = time.perf_counter() - start
+
+        self.stdout.write(f"{len(comments)} comments, workers={options['workers']}")
+        self.stdout.write(f"{'mode':>14} {'total s':>8} {'ms/comment':>11} {'speedup':>8}")
+        self.stdout.write(f"{'one-by-one':>14} {one_by_one:>8.2f} {one_by_one * 1000 / len(comments):>11.2f} {'1x':>8}")
+        for batch_size in [int(b) for b in options['batch_sizes'].split(',') if b]:
+            start = time.perf_counter()
+            analyzer.score_batch(comments, batch_size=batch_size, workers=options['workers'])
+            batched = time.perf_counter() - start
+            self.stdout.write(f"{'batch=' + str(batch_size):>14} {batched:>8.2f} "
+                              f"{batched * 1000 / len(comments):>11.2f} {one_by_one / batched:>7.1f}x")
+
+    def bench_backends(self, options):
+        from mech_recommend.sentiment import SentimentAnalyzer
+
+        comments = synthetic_comments(options['comments'])
+        names = ['torch'] + [b for b in options['backends'].split(',') if b and b != 'torch']
+
+        results = {}
+        for name in names:
+            gc.collect()
+            rss_before = current_rss_mb()
+            start = time.perf_counter()
+            analyzer = SentimentAnalyzer(num_threads=options['threads'], backend=name, workers=options['workers'])
+            load_s = time.perf_counter() - start
+            rss_after = current_rss_mb()
+
+            analyzer.score_batch(comments[:8])  # warm up
+            start = time.perf_counter()
+            scores = analyzer.score_batch(comments, workers=options['workers'])
+            infer_s = time.perf_counter() - start
+
+            rss_mb = rss_after - rss_before if rss_before is not None else float('nan')
+            results[name] = (scores, load_s, infer_s, rss_mb)
+            del analyzer
+
+        reference = results['torch'][0]
+        failed = []
+        self.stdout.write(f"{len(comments)} comments")
+        self.stdout.write(f"{'backend':>11} {'load s':>7} {'ms/comment':>11} {'+RSS MB':>8} "
+                          f"{'max diff':>9} {'mean diff':>10} {'rank corr':>10} {'sign agree':>11}")
+        for name, (scores, load_s, infer_s, rss_mb) in results.items():
+            diff = np.abs(scores - reference)
+            rank_corr = pd.Series(scores).rank().corr(pd.Series(reference).rank())  # Spearman
+            sign_agree = np.mean(np.sign(scores) == np.sign(reference))
+            self.stdout.write(f"{name:>11} {load_s:>7.1f} {infer_s * 1000 / len(comments):>11.2f} {rss_mb:>8.0f} "
+                              f"{diff.max():>9.4f} {diff.mean():>10.4f} {rank_corr:>10.4f} {sign_agree:>10.1%}")
+            if diff.max() > options['max_diff']:
+                failed.append(name)
+
+        if failed:
+            raise CommandError(f"Parity check failed (max diff > {options['max_diff']}): {', '.join(failed)}")
+
+    def bench_memory(self, options):
+        """Table footprint and per-request allocations: DataFrame table vs MechanicStore."""
+        user_lat, user_long, page = 23.0225, 72.5714, 10
+        sizes = [int(s) for s in options['sizes'].split(',') if s]
+
+        self.stdout.write(f"{'mechanics':>10} {'layout':>10} {'table MB':>9} {'+RSS MB':>8} "
+                          f"{'request KB':>11} {'request ms':>11}")
+        for n in sizes:
+            sentiment = np.random.default_rng(0).uniform(-1, 1, n)
+
+            # Documents are generated inside the traced call, so "table MB" is
+            # what each layout keeps alive once the documents are dropped
+            def frame_table():
+                df = pd.DataFrame(synthetic_documents(n))
+                df['sentiment_score'] = sentiment
+                return df
+
+            def store_table():
+                store = MechanicStore.from_documents(synthetic_documents(n))
+                return store._replace(sentiment=sentiment)
+
+            for layout, build in (('dataframe', frame_table), ('store', store_table)):
+                rss_before = current_rss_mb()
+                table, table_bytes, _ = traced(build)
+                rss_mb = current_rss_mb() - rss_before if rss_before is not None else float('nan')
+
+                if layout == 'dataframe':
+                    engine = ScoringEngine.from_frame(table)
+                    names = pd.factorize(table['mech_name'])[0]
+
+                    def request():
+                        distance_km, score = engine.score(user_lat, user_long)
+                        top = top_k_unique(score, names, page)
+                        ranked = table.iloc[top].copy()
+                        ranked['distance_km'] = distance_km[top]
+                        ranked['score'] = score[top]
+                        return ranked.where(pd.notnull(ranked), None).to_dict(orient='records')
+                else:
+                    engine = ScoringEngine.from_store(table)
+
+                    def request():
+                        distance_km, score = engine.score(user_lat, user_long)
+                        top = top_k_unique(score, table.name_codes, page)
+                        return table.records(top)
+
+                _, _, request_peak = traced(request)
+                request_s = best_of(request, options['repeat'])
+                self.stdout.write(f"{n:>10} {layout:>10} {table_bytes / 2**20:>9.1f} {rss_mb:>8.1f} "
+                                  f"{request_peak / 1024:>11.1f} {request_s * 1000:>11.2f}")
+                del table, engine
+
+    def bench_shared_store(self, options):
+        """
+        Memory each forked worker adds while serving requests: from a mapped
+        MECH_STORE_DIR generation vs from its own table. RSS counts shared
+        pages in full; PSS splits them between the processes mapping them, and
+        anonymous memory is what the worker allocated for itself. Request
+        scratch arrays (scores over a partition) stay in the allocator between
+        requests, so they show up in both layouts. Linux only.
+        """
+        import multiprocessing
+        import tempfile
+
+        from mech_recommend.recommendation import MechanicTable
+        from mech_recommend.store import StoreDirectory
+
+        if smaps_mb() is None:
+            raise CommandError("The shared-store suite needs /proc/self/smaps_rollup (Linux)")
+        context = multiprocessing.get_context('fork')
+        workers = options['processes']
+        sizes = [int(s) for s in options['sizes'].split(',') if s]
+
+        self.stdout.write(f"{workers} workers, MB added per worker (mean); 'table' is anonymous memory right "
+                          f"after opening the table, the rest is after serving 50 requests")
+        self.stdout.write(f"{'mechanics':>10} {'layout':>8} {'table':>8} {'+RSS':>8} {'+PSS':>8} {'+anon':>9}")
+        for n in sizes:
+            store = MechanicStore.from_documents(synthetic_documents(n))
+            store = store._replace(sentiment=np.random.default_rng(0).uniform(-1, 1, n))
+            arrays, tables = store.to_arrays()
+            with tempfile.TemporaryDirectory() as path:
+                store_dir = StoreDirectory(path)
+                generation = MechanicTable(store, sentiment_ready=True).publish(store_dir, 1)
+                for layout in ('copy', 'mapped'):
+                    barrier, results = context.Barrier(workers), context.Queue()
+                    procs = [context.Process(target=_store_worker, args=(layout, store_dir, generation, arrays,
+                                                                          tables, barrier, results))
+                             for _ in range(workers)]
+                    for proc in procs:
+                        proc.start()
+                    deltas = [results.get() for _ in procs]
+                    for proc in procs:
+                        proc.join()
+                    table, rss, pss, anon = np.mean(deltas, axis=0)
+                    self.stdout.write(f"{n:>10} {layout:>8} {table:>8.1f} {rss:>8.1f} {pss:>8.1f} {anon:>9.1f}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from mech_recommend.indexes import INDEXES, ensure_indexes
+from mech_recommend.recommendation import db
+
+
+class Command(BaseCommand):
+    help = "Create the MongoDB indexes the service request views rely on (see mech_recommend/indexes.py)."
+
+    requires_system_checks = []
+
+    def handle(self, *args, **options):
+        created = ensure_indexes(db)
+        for collection, names in created.items():
+            self.stdout.write(f"{collection}: {', '.join(names)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{sum(len(models) for models in INDEXES.values())} indexes in place on {len(INDEXES)} collections"
+        ))
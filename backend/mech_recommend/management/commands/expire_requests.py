@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mech_recommend.expiry import EXPIRY_SWEEP_INTERVAL, cancel_expired, ensure_expiry_index
+from mech_recommend.recommendation import db
+
+
+class Command(BaseCommand):
+    help = ("Cancel broadcast service requests past their expires_at. Runs one sweep, or keeps sweeping "
+            "with --loop (for deployments that set EXPIRY_SWEEP_INTERVAL=0 in the web workers).")
+
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping every --interval seconds')
+        parser.add_argument('--interval', type=float, default=EXPIRY_SWEEP_INTERVAL or 5)
+
+    def handle(self, *args, **options):
+        collection = db.service_requests
+        ensure_expiry_index(collection)
+        while True:
+            cancelled = cancel_expired(collection)
+            if cancelled or not options['loop']:
+                self.stdout.write(f"Cancelled {cancelled} expired requests")
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
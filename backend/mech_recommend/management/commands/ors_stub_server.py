@@ -0,0 +1,85 @@
+import json
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+from mech_recommend.scoring import haversine_distance
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers the two OpenRouteService endpoints the recommender uses with
+    haversine distances stretched by a detour factor.
+    """
+
+    detour = 1.3
+    latency = 0.0
+    fail_rate = 0.0
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _km(self, a, b):
+        # ORS coordinates are [lon, lat]
+        return self.detour * haversine_distance(a[1], a[0], b[1], b[0])
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.fail_rate:
+            return self._send(503, {'error': 'stub failure'})
+
+        if re.match(r'^/v2/directions/[^/]+/json', self.path):
+            start, end = body['coordinates'][0], body['coordinates'][-1]
+            meters = self._km(start, end) * 1000
+            return self._send(200, {'routes': [{'summary': {'distance': meters, 'duration': meters / 10}}]})
+
+        if re.match(r'^/v2/matrix/[^/]+', self.path):
+            locations = body['locations']
+            sources = body.get('sources') or range(len(locations))
+            destinations = body.get('destinations') or range(len(locations))
+            scale = 1.0 if body.get('units') == 'km' else 1000.0
+            distances = [[round(self._km(locations[s], locations[d]) * scale, 3) for d in destinations]
+                         for s in sources]
+            return self._send(200, {'distances': distances})
+
+        return self._send(404, {'error': f'unknown endpoint {self.path}'})
+
+
+class Command(BaseCommand):
+    help = ("Run a local OpenRouteService stand-in for offline testing. "
+            "Point ORS_BASE_URL at it, e.g. ORS_BASE_URL=http://127.0.0.1:8081")
+
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8081)
+        parser.add_argument('--detour', type=float, default=1.3,
+                            help='Road distance = haversine * detour')
+        parser.add_argument('--latency-ms', type=float, default=0,
+                            help='Artificial delay per request')
+        parser.add_argument('--fail-rate', type=float, default=0,
+                            help='Fraction of requests answered with HTTP 503')
+
+    def handle(self, *args, **options):
+        StubHandler.detour = options['detour']
+        StubHandler.latency = options['latency_ms'] / 1000
+        StubHandler.fail_rate = options['fail_rate']
+
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), StubHandler)
+        self.stdout.write(f"ORS stub listening on http://127.0.0.1:{options['port']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
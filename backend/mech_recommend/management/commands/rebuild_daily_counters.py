@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mech_recommend import counters
+from mech_recommend.indexes import INDEXES
+from mech_recommend.recommendation import db
+
+
+class Command(BaseCommand):
+    help = ("Recompute mech_daily_counters from service_requests with one $merge aggregation, e.g. after "
+            "a counter update failed or requests were edited by hand.")
+
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days from this date on (YYYY-MM-DD); default all days')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError("--since must be a date like 2024-01-31")
+
+        target = db[counters.COUNTERS_COLLECTION]
+        # $merge on (mech_id, day) needs the unique index to exist
+        target.create_indexes(INDEXES[counters.COUNTERS_COLLECTION])
+
+        rebuilt_at = datetime.utcnow()
+        list(db.service_requests.aggregate(counters.rebuild_pipeline(since, rebuilt_at), allowDiskUse=True))
+
+        # Days whose requests are all gone were not rewritten by the $merge. Only
+        # days before the rebuild started: requests created (or counted) since
+        # then $inc-upsert counters the aggregation never saw, and those are live.
+        stale = {'rebuilt_at': {'$ne': rebuilt_at}, 'day': {'$lt': counters.day_key(rebuilt_at)}}
+        if since:
+            stale['day']['$gte'] = counters.day_key(since)
+        removed = target.delete_many(stale).deleted_count
+
+        rebuilt = target.count_documents({'rebuilt_at': rebuilt_at})
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} daily counters, removed {removed} stale ones"))
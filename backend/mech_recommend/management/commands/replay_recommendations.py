@@ -0,0 +1,200 @@
+import contextlib
+import itertools
+import json
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from mech_recommend.recommendation import RESULT_CACHE_DEPTH, MechanicTable, db, load_mechanics, recommender
+from mech_recommend.scoring import top_k_unique
+from mech_recommend.sentiment import SentimentCache, score_comments
+
+# Set in the parent before the pool forks, so workers share the table copy-on-write
+_table = None
+_top = 5
+_max_cells = 4_000_000
+
+
+def _partition(breakdown_type):
+    """(rows, partitioned) for a breakdown type; unknown types rank against every mechanic."""
+    code, rows = _table.breakdown_partitions.get(str(breakdown_type or '').lower(), (None, None))
+    return (rows, True) if rows is not None else (_table.all_rows, False)
+
+
+def _line(req, records, distance_km, score):
+    mechanics = [
+        {'mech_name': record['mech_name'], 'distance_km': round(float(d), 4),
+         'score': None if np.isnan(s) else round(float(s), 6)}
+        for record, d, s in zip(records, distance_km, score)
+    ]
+    return json.dumps({'request_id': req['request_id'], 'lat': req['lat'], 'lon': req['lon'],
+                       'breakdown_type': req['breakdown_type'], 'mechanics': mechanics})
+
+
+def rank_chunk(requests):
+    """
+    Ranks a chunk of requests one by one through MechanicTable.rank, exactly
+    as a live request does: radius prefilter first, whole partition only when
+    too few distinct mechanics are nearby, ranked RESULT_CACHE_DEPTH deep.
+    """
+    depth = max(_top, RESULT_CACHE_DEPTH)
+    lines = []
+    for req in requests:
+        rows, distance_km, score = _table.rank(req['lat'], req['lon'], str(req['breakdown_type'] or ''), depth)
+        rows, distance_km, score = rows[:_top], distance_km[:_top], score[:_top]
+        lines.append(_line(req, _table.store.records(rows), distance_km, score))
+    return lines
+
+
+def score_chunk(requests):
+    """
+    Ranks a chunk of requests and returns their output lines. Requests for the
+    same breakdown partition are scored together as (users x mechanics)
+    matrices, split so no block exceeds _max_cells entries. Every mechanic in
+    the partition is scored (no radius prefilter), so where live requests rank
+    only nearby candidates the order can differ: use it to compare scoring
+    changes at scale, not to reproduce what was served.
+    """
+    lines = [None] * len(requests)
+    by_partition = {}
+    for i, req in enumerate(requests):
+        by_partition.setdefault(str(req['breakdown_type'] or '').lower(), []).append(i)
+
+    for key, positions in by_partition.items():
+        rows, partitioned = _partition(key)
+        step = max(1, _max_cells // max(len(rows), 1))
+        for start in range(0, len(positions), step):
+            block = positions[start:start + step]
+            lats = [requests[i]['lat'] for i in block]
+            lons = [requests[i]['lon'] for i in block]
+            distance_km, score = _table.scoring_engine.score_many(
+                lats, lons, rows, distance_only=not _table.sentiment_ready, partitioned=partitioned)
+            names = _table.name_codes[rows]
+            for b, i in enumerate(block):
+                top = top_k_unique(score[b], names, _top)
+                lines[i] = _line(requests[i], _table.store.records(rows[top]), distance_km[b, top], score[b, top])
+    return lines
+
+
+def _init_worker(table, top, max_cells):
+    # Only used when the pool cannot fork and the table has to be sent over
+    global _table, _top, _max_cells
+    _table, _top, _max_cells = table, top, max_cells
+    # A spawned worker starts with the real stdout; keep its prints out of the JSONL
+    sys.stdout = sys.stderr
+
+
+class Command(BaseCommand):
+    help = ("Replay historic service requests (from Mongo or a JSONL file) through the ranker on several "
+            "processes and write the rankings as JSONL. --mode rank (default) reproduces live rankings; "
+            "--mode matrix scores whole partitions in vectorized batches.")
+
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jsonl', help='Read requests from this JSONL file (lat, lon, breakdown_type per line) '
+                                            'instead of the service_requests collection')
+        parser.add_argument('--output', default='-', help="Output JSONL path, '-' for stdout")
+        parser.add_argument('--limit', type=int, default=0)
+        parser.add_argument('--top', type=int, default=5, help='Mechanics kept per request')
+        parser.add_argument('--mode', choices=['rank', 'matrix'], default='rank',
+                            help='rank: per request through MechanicTable.rank, as served live (the ranking '
+                                 'cache shares a geohash cell\'s ranking, replay ranks each request itself); '
+                                 'matrix: whole partitions in (users x mechanics) batches, faster but without '
+                                 'the radius prefilter')
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help='Worker processes; 1 ranks in this process')
+        parser.add_argument('--chunk-size', type=int, default=2048, help='Requests per task sent to a worker')
+        parser.add_argument('--max-cells', type=int, default=4_000_000,
+                            help='Largest users x mechanics block scored at once (8 bytes per cell)')
+
+    def load_table(self):
+        # A published shared store is used as-is; otherwise load and score like the server does
+        if recommender.store_dir is not None and recommender.store_dir.current():
+            return MechanicTable.open(recommender.store_dir, recommender.store_dir.current())
+        store = load_mechanics()
+        store = store.with_sentiment(score_comments(store.comments, SentimentCache()))
+        return MechanicTable(store, sentiment_ready=True)
+
+    def read_requests(self, options):
+        if options['jsonl']:
+            with open(options['jsonl']) as f:
+                for n, line in enumerate(f):
+                    if line.strip():
+                        doc = json.loads(line)
+                        yield doc.get('request_id', doc.get('_id', n)), doc
+        else:
+            cursor = db.service_requests.find(
+                {'lat': {'$ne': None}, 'lon': {'$ne': None}}, {'lat': 1, 'lon': 1, 'breakdown_type': 1}
+            ).batch_size(10000)
+            for doc in cursor:
+                yield str(doc['_id']), doc
+
+    def chunks(self, options):
+        requests = self.read_requests(options)
+        if options['limit']:
+            requests = itertools.islice(requests, options['limit'])
+        chunk = []
+        for request_id, doc in requests:
+            try:
+                lat, lon = float(doc['lat']), float(doc['lon'])
+            except (KeyError, TypeError, ValueError):
+                self.skipped += 1
+                continue
+            chunk.append({'request_id': request_id, 'lat': lat, 'lon': lon,
+                          'breakdown_type': doc.get('breakdown_type', 'engine')})
+            if len(chunk) == options['chunk_size']:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def handle(self, *args, **options):
+        # stdout carries only the JSONL: anything the loaders and the ranker print
+        # (here or in forked workers, which inherit sys.stdout) goes to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            self.replay(options)
+
+    def replay(self, options):
+        global _table, _top, _max_cells
+
+        started = time.perf_counter()
+        _table, _top, _max_cells = self.load_table(), options['top'], options['max_cells']
+        if not len(_table):
+            raise CommandError("No mechanics to rank against")
+        self.stderr.write(f"Loaded {len(_table)} mechanics in {time.perf_counter() - started:.1f}s")
+
+        if options['processes'] <= 1:
+            pool = None
+        elif 'fork' in multiprocessing.get_all_start_methods():
+            pool = multiprocessing.get_context('fork').Pool(options['processes'])
+        else:
+            pool = multiprocessing.Pool(options['processes'], _init_worker, (_table, _top, _max_cells))
+
+        self.skipped = 0
+        done = 0
+        out = self.stdout if options['output'] == '-' else open(options['output'], 'w')
+        started = last_report = time.perf_counter()
+        try:
+            with pool or contextlib.nullcontext():
+                ranker = rank_chunk if options['mode'] == 'rank' else score_chunk
+                results = map(ranker, self.chunks(options)) if pool is None else pool.imap(ranker, self.chunks(options))
+                for lines in results:
+                    out.write('\n'.join(lines) + '\n')
+                    done += len(lines)
+                    now = time.perf_counter()
+                    if now - last_report >= 10:
+                        self.stderr.write(f"{done} requests, {done / (now - started):.0f} req/s")
+                        last_report = now
+        finally:
+            if out is not self.stdout:
+                out.close()
+
+        elapsed = time.perf_counter() - started
+        self.stderr.write(self.style.SUCCESS(
+            f"Ranked {done} requests in {elapsed:.1f}s ({done / elapsed if elapsed else 0:.0f} req/s) "
+            f"on {options['processes']} processes; skipped {self.skipped} without coordinates"
+        ))
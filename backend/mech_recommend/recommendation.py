@@ -1,118 +1,527 @@
+import math
 import pandas as pd
 import numpy as np
-from math import radians, cos, sin, asin, sqrt
-import torch
-from transformers import AutoTokenizer, AutoModelForSequenceClassification
-import openrouteservice
-from openrouteservice.exceptions import ApiError
+import threading
+import time
 import warnings
-import pandas as pd
-from pymongo import MongoClient
+from datetime import timedelta
+from bson import ObjectId
+from pymongo.errors import PyMongoError
 import os
 from dotenv import load_dotenv
 
+from backend import mongo
+
+from .caching import TTLCache
+from .sentiment import SentimentAnalyzer, SentimentCache, score_comments
+from .scoring import SCORING_NORMALIZER, SCORING_WEIGHTS, ScoringEngine, haversine_distance, static_terms, top_k_unique
+from .spatial import GridIndex, geohash
+from .store import STORE_FIELDS, MechanicStore, StoreDirectory
+from .road_distance import ROAD_DISTANCE_PREFETCH, get_road_distance, road_distances
+
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
 
 warnings.filterwarnings("ignore")
 
 # ---------------------------
-# Haversine Distance Function
+# Load & Preprocess Data
 # ---------------------------
-def haversine_distance(lat1, lon1, lat2, lon2):
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-    c = 2 * asin(sqrt(a))
-    r = 6371  # Earth radius in km
-    return c * r
 
-# ---------------------------
-# Sentiment Analyzer
-# ---------------------------
-class SentimentAnalyzer:
+# Shared, fork-safe connection pool (see backend/mongo.py)
+db = mongo.db
+collection = mongo.collection('find_mech')
+
+# Only mechanics within this radius are scored, unless too few are found to fill the page
+MECH_SEARCH_RADIUS_KM = float(os.getenv('MECH_SEARCH_RADIUS_KM', 50))
+
+# How long a request waits for the first load before answering "not ready"
+RECOMMENDER_LOAD_TIMEOUT = float(os.getenv('RECOMMENDER_LOAD_TIMEOUT', 30))
+
+# Incremental refresh polls for new find_mech documents; a full reconcile also
+# picks up edits and deletes. 0 disables either.
+RECOMMENDER_REFRESH_INTERVAL = float(os.getenv('RECOMMENDER_REFRESH_INTERVAL', 60))
+RECOMMENDER_RECONCILE_INTERVAL = float(os.getenv('RECOMMENDER_RECONCILE_INTERVAL', 3600))
+
+# ObjectIds are generated client-side, so ids from concurrent writers can land
+# slightly below the high-water mark; re-read this window and skip known ids.
+REFRESH_OVERLAP = timedelta(seconds=30)
+
+# Rankings are shared by requests from the same geohash cell with the same
+# breakdown type, computed RESULT_CACHE_DEPTH deep so later pages reuse them.
+# A size of 0 disables the cache.
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 2048))
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', 300))
+RESULT_CACHE_DEPTH = int(os.getenv('RESULT_CACHE_DEPTH', 50))
+RESULT_CACHE_PRECISION = int(os.getenv('RESULT_CACHE_PRECISION', 6))
+
+# With a store directory, one process (the builder) loads from Mongo and
+# publishes the table there; every other worker maps it read-only and checks
+# for a new generation every MECH_STORE_POLL_INTERVAL seconds. Unset, each
+# process loads its own copy.
+MECH_STORE_DIR = os.getenv('MECH_STORE_DIR', '')
+MECH_STORE_POLL_INTERVAL = float(os.getenv('MECH_STORE_POLL_INTERVAL', 2))
+
+
+def load_mechanics(query=None, rating_fill=None):
+    # Fetch all documents from the collection (or just those matching query),
+    # streamed straight into column arrays
+    return MechanicStore.from_documents(collection.find(query or {}, STORE_FIELDS), rating_fill=rating_fill)
+
+
+# Per-breakdown_type partitions, keyed by the case-folded type
+def build_partitions(codes, keys, order=None):
+    if order is None:
+        order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(keys) + 1))
+    return {key: (i, order[bounds[i]:bounds[i + 1]]) for i, key in enumerate(keys) if key is not None}
+
+
+class MechanicTable:
+    """
+    Immutable snapshot of find_mech (a MechanicStore) plus everything
+    derived from it for scoring. Refreshes build a new table and swap the
+    reference.
+
+    The per-row derived arrays can be passed in, e.g. memory-mapped from a
+    StoreDirectory generation, so a worker that opens a published table
+    allocates nothing per row.
+    """
+
+    DERIVED = ['lat_rad', 'lon_rad', 'grid_order', 'grid_cells', 'partition_codes', 'partition_order',
+               'global_static', 'partition_static']
+    # Scoring settings baked into global_static / partition_static
+    SCORING = {'weights': SCORING_WEIGHTS, 'normalizer': SCORING_NORMALIZER}
+
+    def __init__(self, store, sentiment_ready, derived=None):
+        self.store = store
+        self.sentiment_ready = sentiment_ready
+        self.version = 0  # set by MechanicRecommender when the table is published
+        self.derived = derived if derived is not None else self.derive(store)
+        derived = self.derived
+
+        # Contiguous arrays used by the vectorized scorer
+        self.scoring_engine = ScoringEngine(derived['lat_rad'], derived['lon_rad'], store.rating, store.sentiment,
+                                            in_radians=True,
+                                            static=(derived['global_static'], derived['partition_static']))
+        # Spatial index for candidate pruning
+        self.spatial_index = GridIndex(store.mech_lat, store.mech_long,
+                                       lat_rad=derived['lat_rad'], lon_rad=derived['lon_rad'],
+                                       order=derived['grid_order'], sorted_cells=derived['grid_cells'])
+        self.name_codes = store.name_codes
+        self.partition_codes = derived['partition_codes']
+        self.breakdown_partitions = build_partitions(self.partition_codes, store.breakdown_key_table()[1],
+                                                     derived['partition_order'])
+        self.max_id = store.max_id
+
+    @staticmethod
+    def derive(store):
+        index = GridIndex(store.mech_lat, store.mech_long)
+        partition_codes = store.breakdown_keys()[0]
+        global_static, partition_static = static_terms(store.rating, store.sentiment, partition_codes)
+        return {
+            'lat_rad': index.lat_rad,
+            'lon_rad': index.lon_rad,
+            'grid_order': index.order,
+            'grid_cells': index.sorted_cells,
+            'partition_codes': partition_codes,
+            'partition_order': np.argsort(partition_codes, kind='stable'),
+            'global_static': global_static,
+            'partition_static': partition_static,
+        }
+
+    @property
+    def all_rows(self):
+        return np.arange(len(self.store))
+
+    def __len__(self):
+        return len(self.store)
+
+    def publish(self, store_dir, version):
+        """Writes this table as a new generation of store_dir; returns the generation name."""
+        arrays, tables = self.store.to_arrays()
+        arrays.update(self.derived)
+        meta = {'sentiment_ready': self.sentiment_ready, 'version': version, 'scoring': self.SCORING}
+        return store_dir.publish(arrays, tables, meta)
+
+    @classmethod
+    def open(cls, store_dir, name):
+        """A table over a published generation, with every array memory-mapped."""
+        arrays, tables, meta = store_dir.open(name)
+        store = MechanicStore.from_arrays(arrays, tables)
+        derived = {key: arrays[key] for key in cls.DERIVED}
+        if meta.get('scoring') != cls.SCORING:
+            # Published with other weights: recompute this worker's own terms
+            derived['global_static'], derived['partition_static'] = static_terms(
+                store.rating, store.sentiment, derived['partition_codes'])
+        return cls(store, meta['sentiment_ready'], derived)
+
+    def append(self, new_store):
+        """
+        New table with new_store's rows (already sentiment-scored) after the
+        existing ones. Radians, grid cells and partition codes are computed for
+        the new rows only and merged into the existing sort orders. The static
+        terms are renormalized over every row, since one new rating can move a
+        partition's min/max (or mean/std).
+        """
+        store = self.store.concat(new_store)
+        old, n = self.derived, len(self.store)
+        new_rows = np.arange(n, len(store))
+
+        # Breakdown keys are numbered by first appearance, so existing rows keep their codes
+        type_codes, _ = store.breakdown_key_table()
+        new_codes = type_codes[store.breakdown_codes[n:]]
+
+        def merge_sorted(order, sorted_keys, keys):
+            # New rows go after existing rows with the same key, like a stable argsort of everything
+            by_key = np.argsort(keys, kind='stable')
+            at = np.searchsorted(sorted_keys, keys[by_key], side='right')
+            return np.insert(order, at, new_rows[by_key]), np.insert(sorted_keys, at, keys[by_key])
+
+        grid_order, grid_cells = merge_sorted(old['grid_order'], old['grid_cells'],
+                                              self.spatial_index._cell_ids(new_store.mech_lat, new_store.mech_long))
+        partition_codes = np.concatenate([old['partition_codes'], new_codes])
+        partition_order, _ = merge_sorted(old['partition_order'], old['partition_codes'][old['partition_order']],
+                                          new_codes)
+        global_static, partition_static = static_terms(store.rating, store.sentiment, partition_codes)
+        derived = {
+            'lat_rad': np.concatenate([old['lat_rad'], np.radians(new_store.mech_lat)]),
+            'lon_rad': np.concatenate([old['lon_rad'], np.radians(new_store.mech_long)]),
+            'grid_order': grid_order,
+            'grid_cells': grid_cells,
+            'partition_codes': partition_codes,
+            'partition_order': partition_order,
+            'global_static': global_static,
+            'partition_static': partition_static,
+        }
+        return MechanicTable(store, self.sentiment_ready, derived)
+
+    def _score(self, user_lat, user_long, rows, partitioned):
+        # Until sentiment is available, rank on haversine distance alone
+        return self.scoring_engine.score(user_lat, user_long, rows, distance_only=not self.sentiment_ready,
+                                         partitioned=partitioned)
+
+    def rank(self, user_lat, user_long, breakdown_type, k=None):
+        """
+        Row positions, distances and scores of the k best distinct mechanics
+        (all of them if k is None), best first. Rating and sentiment are
+        normalized over the breakdown partition in both paths, but the distance
+        term is normalized over the rows actually scored, so the nearby
+        candidates and the whole-partition fallback can order the same
+        mechanics differently: a deeper rank does not always extend a
+        shallower one.
+        """
+        code, partition = self.breakdown_partitions.get(breakdown_type.lower(), (None, None))
+
+        if partition is None:
+            print(f"No exact match for breakdown_type '{breakdown_type}', using all data.")
+            partition = self.all_rows
+
+        if k is not None:
+            rows = self.spatial_index.query_radius(user_lat, user_long, MECH_SEARCH_RADIUS_KM)
+            if code is not None:
+                rows = rows[self.partition_codes[rows] == code]
+            distance_km, score = self._score(user_lat, user_long, rows, code is not None)
+            top = top_k_unique(score, self.name_codes[rows], k)
+            if top.size == k:
+                return rows[top], distance_km[top], score[top]
+
+        # No page size, or too few distinct mechanics nearby: score the whole partition
+        rows = partition
+        distance_km, score = self._score(user_lat, user_long, rows, code is not None)
+        top = top_k_unique(score, self.name_codes[rows], k)
+        return rows[top], distance_km[top], score[top]
+
+
+class RecommenderNotReady(Exception):
+    pass
+
+
+class MechanicRecommender:
+    """
+    Loads the mechanic table on first use (or from warm_up()) instead of at
+    import time. The table is served as soon as it is loaded; sentiment is
+    scored afterwards on the same background thread, and until it finishes
+    requests are ranked on haversine distance only.
+
+    With MECH_STORE_DIR set, only the process holding the store's builder
+    lock does that work. The others follow the published generations and
+    take over the lock if the builder goes away; a takeover publishes only
+    the fully scored table, so nobody drops back to distance-only rankings.
+    """
+
+    BUILDER = 'builder'
+    READER = 'reader'
+
+    COLD = 'cold'
+    LOADING = 'loading'
+    DEGRADED = 'degraded'  # table loaded, sentiment still being scored
+    READY = 'ready'
+    FAILED = 'failed'
+
     def __init__(self):
-        self.tokenizer = AutoTokenizer.from_pretrained("cardiffnlp/twitter-roberta-base-sentiment")
-        self.model = AutoModelForSequenceClassification.from_pretrained("cardiffnlp/twitter-roberta-base-sentiment")
-        self.model.eval()
+        self._lock = threading.Lock()
+        self._table_loaded = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.table = None
+        self.version = 0
+        self.state = self.COLD
+        self.error = None
+        self.started_at = None
+        self.ready_at = None
+        self.refreshed_at = None
+        self.reconciled_at = None
+        self._refresh_wanted = threading.Event()
+        self._refresher = None
+        self.store_dir = StoreDirectory(MECH_STORE_DIR) if MECH_STORE_DIR else None
+        self.role = None
+        self.generation = None
 
-    def score(self, text):
-        inputs = self.tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=128)
-        with torch.no_grad():
-            output = self.model(**inputs)
-        probs = torch.nn.functional.softmax(output.logits, dim=1).numpy().flatten()
-        return probs[2] - probs[0]  # pos - neg
+    def warm_up(self):
+        """Starts loading in a background thread; returns immediately."""
+        with self._lock:
+            # A forked worker inherits the attributes but not the loader thread
+            if self._thread is not None and self._pid == os.getpid() and self.state != self.FAILED:
+                return
+            self._pid = os.getpid()
+            self.state = self.LOADING
+            self.error = None
+            self.started_at = time.time()
+            self._table_loaded.clear()
+            target = self._load
+            if self.store_dir is not None:
+                self.role = self.BUILDER if self.store_dir.try_lock() else self.READER
+                if self.role == self.READER:
+                    target = self._follow
+            self._thread = threading.Thread(target=target, name='recommender-warm-up', daemon=True)
+            self._thread.start()
 
-# ---------------------------
-# Load & Preprocess Data
-# ---------------------------
+    def _load(self):
+        try:
+            store = load_mechanics()
+            if self.table is None:
+                self._swap(MechanicTable(store, sentiment_ready=False))
+                self.state = self.DEGRADED
+                self._table_loaded.set()
+                print(f"Recommender loaded {len(store)} mechanics, scoring sentiment in background")
+            else:
+                # Took over the builder lock: every worker keeps serving the generation it
+                # already maps, and only the fully scored table is published
+                print(f"Recommender loaded {len(store)} mechanics, scoring sentiment before publishing")
 
-# MongoDB connection (use your actual connection string)
-MONGO_URL = os.getenv('MONGO_URL')
-MONGO_DB_NAME = os.getenv('MONGO_DB_NAME')
+            # Cached across restarts; the model is loaded only for new comments.
+            # Each distinct comment is scored once, rows pick up their comment's score.
+            store = store.with_sentiment(score_comments(store.comments, SentimentCache()))
+            self._swap(MechanicTable(store, sentiment_ready=True))
+            self.state = self.READY
+            self.ready_at = self.reconciled_at = time.time()
+            print(f"Recommender ready in {self.ready_at - self.started_at:.1f}s")
+            self._start_refresher()
+        except Exception as e:
+            self.error = str(e)
+            if self.table is None:
+                self.state = self.FAILED
+            print(f"Recommender load failed: {e}")
+        finally:
+            self._table_loaded.set()
 
-client = MongoClient(MONGO_URL)
-db = client[MONGO_DB_NAME]
-collection = db['find_mech']
+    def _swap(self, table):
+        if self.role == self.BUILDER:
+            # Serve the mapped copy too, so the builder's pages are shared as well
+            self.generation = table.publish(self.store_dir, self.version + 1)
+            table = MechanicTable.open(self.store_dir, self.generation)
+        table.version = self.version + 1
+        self.table = table
+        self.version = table.version
+        # Entries are keyed by version, so stale ones could never hit again
+        ranking_cache.clear()
 
-# Fetch all documents from the collection
-data = list(collection.find({}))
+    # ---------------------------
+    # Shared Store Readers
+    # ---------------------------
+    def _follow(self):
+        """Maps each generation the builder publishes; becomes the builder if its lock frees up."""
+        while True:
+            try:
+                if self.store_dir.try_lock():
+                    print("Recommender store builder lock acquired, loading from Mongo")
+                    self.role = self.BUILDER
+                    self._load()
+                    return
+                self._remap()
+            except Exception as e:
+                self.error = str(e)
+                print(f"Recommender store remap failed: {e}")
+            time.sleep(MECH_STORE_POLL_INTERVAL)
 
-# Convert to DataFrame
-df = pd.DataFrame(data)
-# print(df.head())
+    def _remap(self):
+        name = self.store_dir.current()
+        if name is None or name == self.generation:
+            return
+        table = MechanicTable.open(self.store_dir, name)
+        self._swap(table)
+        self.generation = name
+        self.state = self.READY if table.sentiment_ready else self.DEGRADED
+        self.refreshed_at = time.time()
+        if self.ready_at is None and table.sentiment_ready:
+            self.ready_at = self.refreshed_at
+        self._table_loaded.set()
 
-df = df.dropna(subset=['mech_lat', 'mech_long'])
-df['comment'] = df['comment'].fillna('')
-df['rating'] = df['rating'].fillna(df['rating'].median())
+    # ---------------------------
+    # Refresh
+    # ---------------------------
+    def refresh(self):
+        """
+        Pulls find_mech documents newer than the table's high-water _id, scores
+        only their comments and appends them. Returns the number of rows added.
+        """
+        table = self.table
+        if table is None or not table.sentiment_ready:
+            return 0
 
-# Compute sentiment scores
-sentiment_analyzer = SentimentAnalyzer()
-df['sentiment_score'] = df['comment'].apply(sentiment_analyzer.score)
+        query = {}
+        if table.max_id is not None:
+            since = ObjectId.from_datetime(table.max_id.generation_time - REFRESH_OVERLAP)
+            query = {'_id': {'$gt': since}}
+        new_store = load_mechanics(query, rating_fill=np.median(table.store.rating))
+        if table.max_id is not None and len(new_store):
+            known = table.store.ids_after(since)
+            new_store = new_store.take(np.array([i not in known for i in new_store.ids.tolist()], dtype=bool))
+        if not len(new_store):
+            return 0
 
-# ---------------------------
-# OpenRouteService Setup
-# ---------------------------
-ORS_API_KEY_model = os.getenv('ORS_API_KEY_model')
-ors_client = openrouteservice.Client(key=ORS_API_KEY_model)
+        new_store = new_store.with_sentiment(score_comments(new_store.comments, SentimentCache()))
+        self._swap(table.append(new_store))
+        self.refreshed_at = time.time()
+        print(f"Recommender appended {len(new_store)} mechanics (now {len(self.table)})")
+        return len(new_store)
+
+    def reconcile(self):
+        """Full reload, picking up edited and deleted documents too."""
+        store = load_mechanics()
+        store = store.with_sentiment(score_comments(store.comments, SentimentCache()))
+        self._swap(MechanicTable(store, sentiment_ready=True))
+        self.reconciled_at = self.refreshed_at = time.time()
+        print(f"Recommender reconciled {len(store)} mechanics")
 
-def get_road_distance(user_lat, user_long, mech_lat, mech_long):
-    try:
-        coords = ((user_long, user_lat), (mech_long, mech_lat))  # (lon, lat)
-        result = ors_client.directions(coords)
-        return result['routes'][0]['summary']['distance'] / 1000  # in km
-    except ApiError:
-        return haversine_distance(user_lat, user_long, mech_lat, mech_long)
+    def request_refresh(self):
+        """Wakes the refresher now instead of at the next poll (e.g. after a new rating)."""
+        self._refresh_wanted.set()
+
+    def _start_refresher(self):
+        if not RECOMMENDER_REFRESH_INTERVAL and not RECOMMENDER_RECONCILE_INTERVAL:
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name='recommender-refresh', daemon=True)
+        self._refresher.start()
+        threading.Thread(target=self._watch_inserts, name='recommender-watch', daemon=True).start()
+
+    def _refresh_loop(self):
+        poll = RECOMMENDER_REFRESH_INTERVAL or RECOMMENDER_RECONCILE_INTERVAL
+        while True:
+            self._refresh_wanted.wait(poll)
+            self._refresh_wanted.clear()
+            try:
+                if RECOMMENDER_RECONCILE_INTERVAL and time.time() - self.reconciled_at >= RECOMMENDER_RECONCILE_INTERVAL:
+                    self.reconcile()
+                else:
+                    self.refresh()
+            except Exception as e:
+                self.error = str(e)
+                print(f"Recommender refresh failed: {e}")
+
+    def _watch_inserts(self):
+        # Change streams need a replica set; on a standalone server polling alone is used
+        try:
+            with collection.watch([{'$match': {'operationType': 'insert'}}]) as stream:
+                for _ in stream:
+                    self._refresh_wanted.set()
+        except PyMongoError as e:
+            print(f"find_mech change stream unavailable, polling every {RECOMMENDER_REFRESH_INTERVAL:.0f}s: {e}")
+
+    def get_table(self, timeout=RECOMMENDER_LOAD_TIMEOUT):
+        table = self.table
+        if table is not None:
+            return table
+        self.warm_up()
+        self._table_loaded.wait(timeout)
+        if self.table is None:
+            if self.state == self.FAILED:
+                raise RecommenderNotReady(f"Recommender failed to load: {self.error}")
+            raise RecommenderNotReady("Recommender is still loading, try again shortly")
+        return self.table
+
+    def status(self):
+        table = self.table
+        return {
+            'state': self.state,
+            'mechanics': len(table) if table is not None else 0,
+            'sentiment_ready': bool(table is not None and table.sentiment_ready),
+            'version': self.version,
+            'refreshed_at': self.refreshed_at,
+            'reconciled_at': self.reconciled_at,
+            'error': self.error,
+            'result_cache': ranking_cache.stats(),
+            'store': {'dir': MECH_STORE_DIR or None, 'role': self.role, 'generation': self.generation},
+        }
+
+
+ranking_cache = TTLCache(maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL)
+recommender = MechanicRecommender()
 
 # ---------------------------
 # Recommendation Function
 # ---------------------------
 
-def recommend_mechanics(user_lat, user_long, breakdown_type):
-    filtered = df[df['breakdown_type'].str.lower() == breakdown_type.lower()].copy()
+def rank_mechanics(user_lat, user_long, breakdown_type, k=None):
+    return recommender.get_table().rank(user_lat, user_long, breakdown_type, k)
+
 
-    if filtered.empty:
-        print(f"No exact match for breakdown_type '{breakdown_type}', using all data.")
-        filtered = df.copy()
+def cached_rank(table, user_lat, user_long, breakdown_type, k):
+    """
+    Row positions and scores of the k best mechanics, shared by every request
+    from the same geohash cell and breakdown type against this table version.
+    """
+    if k is None or not RESULT_CACHE_SIZE:
+        rows, _, score = table.rank(user_lat, user_long, breakdown_type, k)
+        return rows, score
 
-    filtered['distance_km'] = filtered.apply(
-        lambda row: haversine_distance(user_lat, user_long, row['mech_lat'], row['mech_long']), axis=1
-    )
+    key = (geohash(user_lat, user_long, RESULT_CACHE_PRECISION), breakdown_type.lower(), table.version)
+    entry = ranking_cache.get(key)
+    if entry is not None:
+        depth, rows, score = entry
+        # Deep enough, or shorter than asked for because it already holds every match
+        if rows.size >= k or rows.size < depth:
+            return rows[:k], score[:k]
 
-    filtered['norm_rating'] = (filtered['rating'] - filtered['rating'].min()) / (filtered['rating'].max() - filtered['rating'].min())
-    filtered['norm_sentiment'] = (filtered['sentiment_score'] - filtered['sentiment_score'].min()) / (filtered['sentiment_score'].max() - filtered['sentiment_score'].min())
-    filtered['inv_distance'] = 1 / (filtered['distance_km'] + 1)
-    filtered['norm_inv_distance'] = (filtered['inv_distance'] - filtered['inv_distance'].min()) / (filtered['inv_distance'].max() - filtered['inv_distance'].min())
+    depth = max(k, RESULT_CACHE_DEPTH)
+    rows, _, score = table.rank(user_lat, user_long, breakdown_type, depth)
+    ranking_cache.set(key, (depth, rows, score))
+    return rows[:k], score[:k]
 
-    filtered['score'] = (
-        0.5 * filtered['norm_inv_distance'] +
-        0.3 * filtered['norm_rating'] +
-        0.2 * filtered['norm_sentiment']
-    )
 
-    filtered = filtered.sort_values(by='score', ascending=False)
-    filtered = filtered.drop_duplicates(subset='mech_name', keep='first')
-    return filtered
+RANKED_COLUMNS = ['mech_name', 'mech_lat', 'mech_long', 'rating', 'comment',
+                  'breakdown_type', 'distance_km', 'score']
+
+
+def ranked_records(user_lat, user_long, breakdown_type, depth=None):
+    """
+    The best depth mechanics (all if None) as plain dicts, without road
+    distances, and whether that is every matching mechanic. Read straight
+    from the store; no DataFrame is built per request.
+    """
+    table = recommender.get_table()
+    rows, score = cached_rank(table, user_lat, user_long, breakdown_type, depth)
+    records = table.store.records(rows)
+    # The ranking may come from a neighbour in the same cell; distances are this user's own
+    distance_km = table.scoring_engine.distances(user_lat, user_long, rows)
+    for record, km, s in zip(records, distance_km.tolist(), score.tolist()):
+        record['distance_km'] = km
+        record['score'] = None if math.isnan(s) else s
+    return records, depth is None or len(records) < depth
+
+
+def recommend_mechanics(user_lat, user_long, breakdown_type, limit=None):
+    return pd.DataFrame(ranked_records(user_lat, user_long, breakdown_type, limit)[0], columns=RANKED_COLUMNS)
 
 # ---------------------------
 # Example Usage
@@ -120,16 +529,36 @@ def recommend_mechanics(user_lat, user_long, breakdown_type):
 # def get_top_mechanics(user_lat, user_long, breakdown_type):
 #     return recommend_mechanics(user_lat, user_long, breakdown_type)
 
-def get_top_mechanics(user_lat, user_long, breakdown_type, offset=0, limit=5):
-    all_mechs = recommend_mechanics(user_lat, user_long, breakdown_type)
-    page = all_mechs.iloc[offset:offset+limit].copy()
 
-    page['road_distance_km'] = page.apply(
-        lambda row: get_road_distance(user_lat, user_long, row['mech_lat'], row['mech_long']),
-        axis=1
-    )
+def fill_road_distances(user_lat, user_long, records, known, start, end):
+    """
+    Adds road distances for records[start:end] to known, a {(mech_lat,
+    mech_long): km} dict, so they stay attached to the right mechanic however
+    the list is reordered; coordinates already in it are skipped. In matrix
+    mode the next ROAD_DISTANCE_PREFETCH records ride along in the same
+    request and are cached for the next page.
+    """
+    end = min(end, len(records))
+    missing = list(dict.fromkeys(
+        (m['mech_lat'], m['mech_long']) for m in records[start:end] if (m['mech_lat'], m['mech_long']) not in known
+    ))
+    if missing:
+        prefetch = []
+        if road_distances.mode == 'matrix':
+            prefetch = [(m['mech_lat'], m['mech_long']) for m in records[end:end + ROAD_DISTANCE_PREFETCH]]
+        known.update(zip(missing, road_distances.distances(user_lat, user_long, missing, prefetch)))
+    return known
+
+
+def get_top_mechanics(user_lat, user_long, breakdown_type, offset=0, limit=5):
+    """One page of ranked mechanics as dicts, with road_distance_km filled in."""
+    offset = max(offset, 0)
+    # Rank a little past the page so the next page's road distances ride along in the same matrix request
+    prefetch = ROAD_DISTANCE_PREFETCH if road_distances.mode == 'matrix' else 0
+    top_mechs, _ = ranked_records(user_lat, user_long, breakdown_type, offset + limit + prefetch)
+    road = fill_road_distances(user_lat, user_long, top_mechs, {}, offset, offset + limit)
+    page = [dict(m, road_distance_km=road[(m['mech_lat'], m['mech_long'])]) for m in top_mechs[offset:offset+limit]]
 
-    print("Total mechanics found:", len(all_mechs))
+    print("Top mechanics ranked:", len(top_mechs))
     print("Returning mechanics from", offset, "to", offset+limit)
-    return page[['mech_name', 'mech_lat', 'mech_long', 'rating', 'comment',
-                 'breakdown_type', 'distance_km', 'road_distance_km', 'score']]
\ No newline at end of file
+    return page
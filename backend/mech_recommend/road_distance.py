@@ -0,0 +1,214 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import openrouteservice
+from openrouteservice.exceptions import ApiError
+
+from .caching import TTLCache
+from .routing import ROAD_GRAPH_PATH, RoadGraph
+from .scoring import haversine_distance
+
+# "ors" asks OpenRouteService; "local" routes on an offline graph built with
+# `manage.py build_road_graph` and read from ROAD_GRAPH_PATH
+ROAD_DISTANCE_ENGINE = os.getenv('ROAD_DISTANCE_ENGINE', 'ors')
+
+# Page lookups run concurrently; each one falls back to haversine on its own
+ROAD_DISTANCE_WORKERS = int(os.getenv('ROAD_DISTANCE_WORKERS', 8))
+ROAD_DISTANCE_TIMEOUT = float(os.getenv('ROAD_DISTANCE_TIMEOUT', 3))
+
+# "matrix" fetches a whole page (plus the prefetch window) in one ORS matrix
+# request; "directions" issues one directions request per mechanic
+ROAD_DISTANCE_MODE = os.getenv('ROAD_DISTANCE_MODE', 'matrix')
+ROAD_DISTANCE_PREFETCH = int(os.getenv('ROAD_DISTANCE_PREFETCH', 5))
+
+# Cached by origin/destination rounded to 4 decimals (about 11 m)
+ROAD_DISTANCE_CACHE_SIZE = int(os.getenv('ROAD_DISTANCE_CACHE_SIZE', 10000))
+ROAD_DISTANCE_CACHE_TTL = float(os.getenv('ROAD_DISTANCE_CACHE_TTL', 3600))
+COORD_PRECISION = 4
+
+# ---------------------------
+# OpenRouteService Setup
+# ---------------------------
+ORS_API_KEY_model = os.getenv('ORS_API_KEY_model')
+# Point at `manage.py ors_stub_server` to run without the real API
+ORS_BASE_URL = os.getenv('ORS_BASE_URL', 'https://api.openrouteservice.org')
+_ors_client = None
+
+
+def get_ors_client():
+    # Built on first use, so the local engine (and tests) run without an API key
+    global _ors_client
+    if _ors_client is None:
+        # No retry loop on rate limits: a slow answer is worse than the haversine fallback
+        _ors_client = openrouteservice.Client(key=ORS_API_KEY_model, base_url=ORS_BASE_URL,
+                                              timeout=ROAD_DISTANCE_TIMEOUT, retry_over_query_limit=False)
+    return _ors_client
+
+
+_road_graphs = {}
+_road_graph_lock = threading.Lock()
+
+
+def get_road_graph(path=ROAD_GRAPH_PATH):
+    """The offline road graph at path, loaded once per process on first use."""
+    graph = _road_graphs.get(path)
+    if graph is None:
+        with _road_graph_lock:
+            graph = _road_graphs.get(path)
+            if graph is None:
+                started = time.perf_counter()
+                graph = _road_graphs[path] = RoadGraph.load(path)
+                print(f"🛣️ Loaded road graph ({graph.n_nodes} nodes, {graph.n_edges} edges) "
+                      f"in {time.perf_counter() - started:.1f}s")
+    return graph
+
+
+def get_road_distance(user_lat, user_long, mech_lat, mech_long):
+    if ROAD_DISTANCE_ENGINE == 'local':
+        km = get_road_graph().road_distance_km(user_lat, user_long, mech_lat, mech_long)
+        return haversine_distance(user_lat, user_long, mech_lat, mech_long) if km is None else km
+    try:
+        coords = ((user_long, user_lat), (mech_long, mech_lat))  # (lon, lat)
+        result = get_ors_client().directions(coords)
+        return result['routes'][0]['summary']['distance'] / 1000  # in km
+    except ApiError:
+        return haversine_distance(user_lat, user_long, mech_lat, mech_long)
+
+
+# ---------------------------
+# Concurrent, Cached Lookups
+# ---------------------------
+class RoadDistanceService:
+    def __init__(self, mode=ROAD_DISTANCE_MODE, workers=ROAD_DISTANCE_WORKERS, timeout=ROAD_DISTANCE_TIMEOUT,
+                 cache_size=ROAD_DISTANCE_CACHE_SIZE, cache_ttl=ROAD_DISTANCE_CACHE_TTL, engine=ROAD_DISTANCE_ENGINE,
+                 graph_path=ROAD_GRAPH_PATH):
+        if mode not in ('matrix', 'directions'):
+            raise ValueError(f"Unknown ROAD_DISTANCE_MODE '{mode}', expected 'matrix' or 'directions'")
+        if engine not in ('ors', 'local'):
+            raise ValueError(f"Unknown ROAD_DISTANCE_ENGINE '{engine}', expected 'ors' or 'local'")
+        self.mode = mode
+        self.engine = engine
+        self.graph_path = graph_path
+        self.timeout = timeout
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='road-distance')
+        self.fallbacks = 0
+        self.matrix_calls = 0
+        self.directions_calls = 0
+        self.local_calls = 0
+
+    @staticmethod
+    def key(user_lat, user_long, mech_lat, mech_long):
+        return tuple(round(float(v), COORD_PRECISION) for v in (user_lat, user_long, mech_lat, mech_long))
+
+    def fetch(self, user_lat, user_long, mech_lat, mech_long):
+        """One directions request; raises on any failure so the caller can fall back."""
+        self.directions_calls += 1
+        coords = ((user_long, user_lat), (mech_long, mech_lat))  # (lon, lat)
+        result = get_ors_client().directions(coords)
+        return result['routes'][0]['summary']['distance'] / 1000  # in km
+
+    def fetch_matrix(self, user_lat, user_long, mech_coords):
+        """One-to-many distances in km from a single matrix request; None where ORS found no route."""
+        self.matrix_calls += 1
+        locations = [[user_long, user_lat]] + [[mech_long, mech_lat] for mech_lat, mech_long in mech_coords]
+        result = get_ors_client().distance_matrix(
+            locations,
+            sources=[0],
+            destinations=list(range(1, len(locations))),
+            metrics=['distance'],
+            units='km',
+        )
+        return result['distances'][0]
+
+    def distances(self, user_lat, user_long, mech_coords, prefetch=()):
+        """
+        Road distance in km from the user to each (mech_lat, mech_long).
+
+        In matrix mode the cache misses, plus any prefetch coordinates (e.g. the
+        next page), go out as one matrix request; prefetched answers only land in
+        the cache. Whatever it does not answer for mech_coords is fetched per pair,
+        concurrently, within what is left of the same timeout. An item that fails
+        or is not back in time gets its haversine distance instead, and once the
+        timeout has passed no further request is sent.
+
+        With the local engine everything is answered from the offline graph in
+        one one-to-many search, and no network request is made.
+        """
+        results = [None] * len(mech_coords)
+        pending = {}
+        for i, (mech_lat, mech_long) in enumerate(mech_coords):
+            key = self.key(user_lat, user_long, mech_lat, mech_long)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[i] = cached
+            else:
+                pending.setdefault(key, []).append(i)
+
+        coords_for = {key: mech_coords[idx[0]] for key, idx in pending.items()}
+        deadline = time.monotonic() + self.timeout
+
+        if self.engine == 'local':
+            if pending:
+                self.local_calls += 1
+                keys = list(pending)
+                try:
+                    row = get_road_graph(self.graph_path).road_distances_km(user_lat, user_long, [coords_for[k] for k in keys])
+                except OSError as e:  # graph file missing or unreadable
+                    print(f"Road graph unavailable, using haversine distances: {e}")
+                    row = [None] * len(keys)
+                for key, km in zip(keys, row):
+                    if km is None:  # no route on the graph
+                        self.fallbacks += 1
+                        km = haversine_distance(user_lat, user_long, *coords_for[key])
+                    else:
+                        self.cache.set(key, km)
+                    for i in pending[key]:
+                        results[i] = km
+            return results
+
+        if self.mode == 'matrix' and pending:
+            for mech_lat, mech_long in prefetch:
+                key = self.key(user_lat, user_long, mech_lat, mech_long)
+                if key not in coords_for and self.cache.get(key) is None:
+                    coords_for[key] = (mech_lat, mech_long)
+            keys = list(coords_for)
+            future = self.pool.submit(self.fetch_matrix, user_lat, user_long, [coords_for[k] for k in keys])
+            try:
+                row = future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except Exception as e:  # timeout, ApiError, network error
+                print(f"ORS matrix request failed, falling back to per-pair lookups: {e}")
+                row = [None] * len(keys)
+            for key, km in zip(keys, row):
+                if km is None:
+                    continue
+                self.cache.set(key, km)
+                for i in pending.pop(key, ()):
+                    results[i] = km
+
+        # Per-pair fallback path (the only path in directions mode). A matrix
+        # request that timed out has used up the budget: answering with haversine
+        # right away beats sending requests whose answers could never be awaited.
+        futures = {}
+        if time.monotonic() < deadline:
+            futures = {key: self.pool.submit(self.fetch, user_lat, user_long, *coords_for[key]) for key in pending}
+        for key in pending:
+            mech_lat, mech_long = coords_for[key]
+            try:
+                km = futures[key].result(timeout=max(0.0, deadline - time.monotonic()))
+                self.cache.set(key, km)
+            except Exception:  # not sent, timeout, ApiError, network error
+                self.fallbacks += 1
+                km = haversine_distance(user_lat, user_long, mech_lat, mech_long)
+            for i in pending[key]:
+                results[i] = km
+        return results
+
+    def stats(self):
+        return dict(self.cache.stats(), engine=self.engine, fallbacks=self.fallbacks, matrix_calls=self.matrix_calls,
+                    directions_calls=self.directions_calls, local_calls=self.local_calls)
+
+
+road_distances = RoadDistanceService()
@@ -0,0 +1,145 @@
+import heapq
+import math
+import os
+
+import numpy as np
+
+from .scoring import haversine_distance
+from .spatial import GridIndex
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROAD_GRAPH_PATH = os.getenv('ROAD_GRAPH_PATH', os.path.join(BASE_DIR, 'road_graph.npz'))
+
+
+def build_csr(n_nodes, src, dst, weights):
+    order = np.lexsort((dst, src))
+    indptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n_nodes), out=indptr[1:])
+    return indptr, np.ascontiguousarray(dst[order], dtype=np.int64), np.ascontiguousarray(weights[order], dtype=np.float64)
+
+
+# ---------------------------
+# Road Graph
+# ---------------------------
+class RoadGraph:
+    """
+    Directed road network in CSR form (indptr / indices / edge lengths in
+    metres) with a reverse CSR for the backward half of bidirectional search.
+    Node coordinates feed a GridIndex used to snap points onto the graph.
+    """
+
+    def __init__(self, node_lat, node_lon, src, dst, length_m):
+        self.node_lat = np.ascontiguousarray(node_lat, dtype=np.float64)
+        self.node_lon = np.ascontiguousarray(node_lon, dtype=np.float64)
+        n = self.node_lat.shape[0]
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        length_m = np.asarray(length_m, dtype=np.float64)
+
+        self.indptr, self.indices, self.weights = build_csr(n, src, dst, length_m)
+        self.r_indptr, self.r_indices, self.r_weights = build_csr(n, dst, src, length_m)
+        self.node_index = GridIndex(self.node_lat, self.node_lon, cell_deg=0.05)
+
+        # memoryviews index straight into the arrays and hand back plain Python numbers
+        self._forward = (memoryview(self.indptr), memoryview(self.indices), memoryview(self.weights))
+        self._backward = (memoryview(self.r_indptr), memoryview(self.r_indices), memoryview(self.r_weights))
+
+    @property
+    def n_nodes(self):
+        return self.node_lat.shape[0]
+
+    @property
+    def n_edges(self):
+        return self.indices.shape[0]
+
+    @classmethod
+    def load(cls, path):
+        """Loads a graph saved by save() (see the build_road_graph command)."""
+        with np.load(path) as data:
+            return cls(data['node_lat'], data['node_lon'], data['edge_src'], data['edge_dst'], data['edge_length_m'])
+
+    def save(self, path):
+        src = np.repeat(np.arange(self.n_nodes), np.diff(self.indptr))
+        np.savez_compressed(path, node_lat=self.node_lat, node_lon=self.node_lon,
+                            edge_src=src, edge_dst=self.indices, edge_length_m=self.weights)
+
+    def nearest_node(self, lat, lon):
+        node = int(self.node_index.query_knn(lat, lon, 1)[0])
+        return node, haversine_distance(lat, lon, self.node_lat[node], self.node_lon[node])
+
+    # ---------------------------
+    # Shortest Paths
+    # ---------------------------
+    def shortest_path_m(self, source, target):
+        """Bidirectional Dijkstra; metres from source to target, or None if unreachable."""
+        if source == target:
+            return 0.0
+        graphs = (self._forward, self._backward)
+        dist = ({source: 0.0}, {target: 0.0})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        settled = (set(), set())
+        best = math.inf
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            d, u = heapq.heappop(heaps[side])
+            if u in settled[side]:
+                continue
+            settled[side].add(u)
+
+            indptr, indices, weights = graphs[side]
+            this_dist, other_dist = dist[side], dist[1 - side]
+            for e in range(indptr[u], indptr[u + 1]):
+                v = indices[e]
+                nd = d + weights[e]
+                if nd < this_dist.get(v, math.inf):
+                    this_dist[v] = nd
+                    heapq.heappush(heaps[side], (nd, v))
+                    if v in other_dist and nd + other_dist[v] < best:
+                        best = nd + other_dist[v]
+
+        return best if best < math.inf else None
+
+    def shortest_paths_m(self, source, targets):
+        """One-to-many Dijkstra that stops once every target is settled; {target: metres}."""
+        indptr, indices, weights = self._forward
+        remaining = set(targets)
+        found = {}
+        dist = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = set()
+
+        while heap and remaining:
+            d, u = heapq.heappop(heap)
+            if u in settled:
+                continue
+            settled.add(u)
+            if u in remaining:
+                found[u] = d
+                remaining.discard(u)
+            for e in range(indptr[u], indptr[u + 1]):
+                v = indices[e]
+                nd = d + weights[e]
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    heapq.heappush(heap, (nd, v))
+        return found
+
+    # ---------------------------
+    # Road Distance
+    # ---------------------------
+    def road_distance_km(self, lat1, lon1, lat2, lon2):
+        """Road distance between two points, including the straight hops onto the graph."""
+        source, snap_source = self.nearest_node(lat1, lon1)
+        target, snap_target = self.nearest_node(lat2, lon2)
+        metres = self.shortest_path_m(source, target)
+        return None if metres is None else snap_source + metres / 1000 + snap_target
+
+    def road_distances_km(self, lat, lon, coords):
+        """Road distance from one point to each (lat, lon) in coords; None where unreachable."""
+        source, snap_source = self.nearest_node(lat, lon)
+        snapped = [self.nearest_node(t_lat, t_lon) for t_lat, t_lon in coords]
+        found = self.shortest_paths_m(source, {node for node, _ in snapped})
+        return [snap_source + found[node] / 1000 + snap if node in found else None for node, snap in snapped]
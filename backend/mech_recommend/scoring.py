@@ -0,0 +1,238 @@
+import os
+from math import radians, cos, sin, asin, sqrt
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+DISTANCE_WEIGHT = 0.5
+RATING_WEIGHT = 0.3
+SENTIMENT_WEIGHT = 0.2
+DEFAULT_WEIGHTS = {'distance': DISTANCE_WEIGHT, 'rating': RATING_WEIGHT, 'sentiment': SENTIMENT_WEIGHT}
+
+
+def parse_weights(spec):
+    """'distance=0.6,rating=0.4' -> weights dict; terms left out keep their default."""
+    weights = dict(DEFAULT_WEIGHTS)
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        name, _, value = part.partition('=')
+        name = name.strip()
+        if name not in weights:
+            raise ValueError(f"Unknown scoring weight '{name}', expected one of {sorted(weights)}")
+        weights[name] = float(value)
+    return weights
+
+
+# e.g. RECOMMENDER_WEIGHTS="distance=0.6,rating=0.25,sentiment=0.15"
+SCORING_WEIGHTS = parse_weights(os.getenv('RECOMMENDER_WEIGHTS', ''))
+# "minmax" or "zscore"
+SCORING_NORMALIZER = os.getenv('RECOMMENDER_NORMALIZER', 'minmax')
+
+
+# ---------------------------
+# Haversine Distance Function
+# ---------------------------
+def haversine_distance(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
+    c = 2 * asin(sqrt(a))
+    r = 6371  # Earth radius in km
+    return c * r
+
+
+# ---------------------------
+# Vectorized Haversine
+# ---------------------------
+def haversine_vec(lat1_rad, lon1_rad, lat2_rad, lon2_rad):
+    """Great-circle distance in km; all inputs in radians, broadcastable."""
+    dlat = lat2_rad - lat1_rad
+    dlon = lon2_rad - lon1_rad
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+# ---------------------------
+# Normalizers
+# ---------------------------
+class MinMaxNormalizer:
+    """(x - min) / (max - min). A constant input (e.g. a single row) maps to 0, not NaN."""
+
+    @staticmethod
+    def fit(values, axis=None):
+        if values.size == 0:
+            return 0.0, 0.0
+        lo = values.min(axis=axis, keepdims=axis is not None)
+        return lo, values.max(axis=axis, keepdims=axis is not None) - lo
+
+    @staticmethod
+    def apply(values, stats):
+        lo, span = stats
+        return (values - lo) / np.where(span > 0, span, np.inf)
+
+
+class ZScoreNormalizer:
+    """(x - mean) / std. A constant input maps to 0."""
+
+    @staticmethod
+    def fit(values, axis=None):
+        if values.size == 0:
+            return 0.0, 0.0
+        return values.mean(axis=axis, keepdims=axis is not None), values.std(axis=axis, keepdims=axis is not None)
+
+    @staticmethod
+    def apply(values, stats):
+        mean, std = stats
+        return (values - mean) / np.where(std > 0, std, np.inf)
+
+
+NORMALIZERS = {
+    'minmax': MinMaxNormalizer,
+    'zscore': ZScoreNormalizer,
+}
+
+
+def min_max(values, axis=None):
+    return MinMaxNormalizer.apply(values, MinMaxNormalizer.fit(values, axis))
+
+
+def static_terms(rating, sentiment, partition_codes=None, weights=None, normalizer=SCORING_NORMALIZER):
+    """
+    The weighted rating + sentiment part of the score, which does not depend
+    on the user. Returns two per-row arrays: one normalized over all rows, and
+    one normalized within each row's breakdown partition. Rows with partition
+    code -1 get the global value.
+    """
+    weights = SCORING_WEIGHTS if weights is None else weights
+    norm = NORMALIZERS[normalizer]
+
+    def term(rows):
+        r, s = rating[rows], sentiment[rows]
+        return weights['rating'] * norm.apply(r, norm.fit(r)) + weights['sentiment'] * norm.apply(s, norm.fit(s))
+
+    global_static = np.ascontiguousarray(term(slice(None)), dtype=np.float64)
+    partition_static = global_static.copy()
+    if partition_codes is not None:
+        for code in np.unique(partition_codes):
+            if code >= 0:
+                rows = np.flatnonzero(partition_codes == code)
+                partition_static[rows] = term(rows)
+    return global_static, partition_static
+
+
+# ---------------------------
+# Scoring Engine
+# ---------------------------
+class ScoringEngine:
+    """
+    Holds the mechanic table as contiguous float64 arrays so a request can be
+    scored in one batched NumPy pass instead of a row-wise DataFrame.apply.
+
+    Rating and sentiment terms are normalized and weighted once, at build
+    time, per breakdown partition (see static_terms). A request only computes
+    the distance term.
+    """
+
+    def __init__(self, mech_lat, mech_long, rating, sentiment, in_radians=False, partition_codes=None,
+                 weights=None, normalizer=SCORING_NORMALIZER, static=None):
+        if normalizer not in NORMALIZERS:
+            raise ValueError(f"Unknown RECOMMENDER_NORMALIZER '{normalizer}', expected one of {sorted(NORMALIZERS)}")
+        # Coordinates already in radians (e.g. a memory-mapped table) are used without a copy
+        convert = (lambda a: a) if in_radians else np.radians
+        self.lat_rad = np.ascontiguousarray(convert(np.asarray(mech_lat, dtype=np.float64)))
+        self.lon_rad = np.ascontiguousarray(convert(np.asarray(mech_long, dtype=np.float64)))
+        self.rating = np.ascontiguousarray(rating, dtype=np.float64)
+        self.sentiment = np.ascontiguousarray(sentiment, dtype=np.float64)
+        self.weights = SCORING_WEIGHTS if weights is None else weights
+        self.normalizer = NORMALIZERS[normalizer]
+        if static is None:
+            static = static_terms(self.rating, self.sentiment, partition_codes, self.weights, normalizer)
+        self.global_static, self.partition_static = static
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(df['mech_lat'].to_numpy(), df['mech_long'].to_numpy(),
+                   df['rating'].to_numpy(), df['sentiment_score'].to_numpy())
+
+    @classmethod
+    def from_store(cls, store):
+        return cls(store.mech_lat, store.mech_long, store.rating, store.sentiment)
+
+    def __len__(self):
+        return self.lat_rad.shape[0]
+
+    def distances(self, user_lat, user_long, rows=None):
+        lat_rad = self.lat_rad if rows is None else self.lat_rad[rows]
+        lon_rad = self.lon_rad if rows is None else self.lon_rad[rows]
+        return haversine_vec(np.radians(user_lat), np.radians(user_long), lat_rad, lon_rad)
+
+    def _static(self, rows, partitioned):
+        static = self.partition_static if partitioned else self.global_static
+        return static if rows is None else static[rows]
+
+    def score(self, user_lat, user_long, rows=None, distance_only=False, partitioned=False):
+        """
+        Returns (distance_km, score) for the given row positions (all rows if None).
+        The score is the weighted, normalized inverse distance plus the
+        precomputed rating and sentiment terms. Those terms use partition
+        statistics when partitioned is set, and global ones otherwise. With
+        distance_only, the score is the normalized inverse distance alone.
+        """
+        distance_km = self.distances(user_lat, user_long, rows)
+        inv_distance = 1.0 / (distance_km + 1.0)
+        distance_term = self.normalizer.apply(inv_distance, self.normalizer.fit(inv_distance))
+        if distance_only:
+            return distance_km, distance_term
+        return distance_km, self.weights['distance'] * distance_term + self._static(rows, partitioned)
+
+    def score_many(self, user_lats, user_longs, rows=None, distance_only=False, partitioned=False):
+        """
+        score() for a batch of users at once: (B, M) distance and score arrays,
+        each row normalized on its own exactly as score() would.
+        """
+        lat_rad = self.lat_rad if rows is None else self.lat_rad[rows]
+        lon_rad = self.lon_rad if rows is None else self.lon_rad[rows]
+        user_lat_rad = np.radians(np.asarray(user_lats, dtype=np.float64))[:, None]
+        user_lon_rad = np.radians(np.asarray(user_longs, dtype=np.float64))[:, None]
+        distance_km = haversine_vec(user_lat_rad, user_lon_rad, lat_rad[None, :], lon_rad[None, :])
+        inv_distance = 1.0 / (distance_km + 1.0)
+        distance_term = self.normalizer.apply(inv_distance, self.normalizer.fit(inv_distance, axis=1))
+        if distance_only:
+            return distance_km, distance_term
+        return distance_km, self.weights['distance'] * distance_term + self._static(rows, partitioned)[None, :]
+
+
+# ---------------------------
+# Top-k Selection
+# ---------------------------
+def top_k_unique(score, codes, k=None):
+    """
+    Positions of the k best-scoring entries with distinct codes, best first.
+
+    Uses argpartition over a window that doubles until it holds k distinct
+    codes, so the cost is O(n + k log k) instead of a full sort. NaN scores
+    rank last and ties keep the earlier position, like sort + drop_duplicates.
+    """
+    n = score.shape[0]
+    if k is None or k > n:
+        k = n
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+
+    neg = -score
+    take = min(n, 2 * k)
+    while True:
+        if take < n:
+            threshold = neg[np.argpartition(neg, take - 1)[take - 1]]
+            # Keep every row tied with the threshold so ties still resolve by position
+            cand = np.flatnonzero(neg <= threshold) if not np.isnan(threshold) else np.arange(n)
+        else:
+            cand = np.arange(n)
+        cand = cand[np.lexsort((cand, neg[cand]))]
+        # The first occurrence of each code in the window is that code's best row
+        _, first = np.unique(codes[cand], return_index=True)
+        keep = cand[np.sort(first)]
+        if keep.size >= k or take == n:
+            return keep[:k]
+        take = min(n, 2 * take)
@@ -0,0 +1,255 @@
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# torch and transformers are imported inside the backends: they take seconds to
+# import and are only needed when some comment is missing from the cache.
+
+MODEL_ID = "cardiffnlp/twitter-roberta-base-sentiment"
+
+# Bulk inference tuning; 0 threads keeps the backend's default (torch or onnxruntime),
+# or with SENTIMENT_WORKERS > 1 splits the cores so workers x threads fits them
+SENTIMENT_BATCH_SIZE = int(os.getenv('SENTIMENT_BATCH_SIZE', 32))
+SENTIMENT_NUM_THREADS = int(os.getenv('SENTIMENT_NUM_THREADS', 0))
+SENTIMENT_WORKERS = int(os.getenv('SENTIMENT_WORKERS', 1))
+
+# Inference backend: "torch" (fp32), "torch-int8" (dynamic quantization) or "onnx"
+SENTIMENT_BACKEND = os.getenv('SENTIMENT_BACKEND', 'torch')
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SENTIMENT_CACHE_PATH = os.getenv('SENTIMENT_CACHE_PATH', os.path.join(BASE_DIR, 'sentiment_cache.sqlite3'))
+SENTIMENT_ONNX_PATH = os.getenv('SENTIMENT_ONNX_PATH', os.path.join(BASE_DIR, 'sentiment_model.onnx'))
+
+
+def model_tag(backend=SENTIMENT_BACKEND, model_id=MODEL_ID):
+    # Quantized and exported models score slightly differently, so they get their own cache keys
+    return model_id if backend == 'torch' else f"{model_id}@{backend}"
+
+
+# ---------------------------
+# Inference Backends
+# ---------------------------
+class TorchBackend:
+    tensor_type = "pt"
+
+    def __init__(self, model_id, num_threads=0):
+        import torch
+        from transformers import AutoModelForSequenceClassification
+
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.model = AutoModelForSequenceClassification.from_pretrained(model_id)
+        self.model.eval()
+
+    def logits(self, inputs):
+        import torch
+
+        with torch.no_grad():
+            return self.model(**inputs).logits.numpy()
+
+
+class QuantizedTorchBackend(TorchBackend):
+    """fp32 model with its Linear layers dynamically quantized to int8."""
+
+    def __init__(self, model_id, num_threads=0):
+        import torch
+
+        super().__init__(model_id, num_threads)
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend:
+    """
+    ONNX Runtime session over an exported copy of the model. Needs neither
+    torch nor transformers' model code at runtime; only the one-off export
+    (when path does not exist yet) imports torch.
+    """
+
+    tensor_type = "np"
+
+    def __init__(self, model_id, num_threads=0, path=SENTIMENT_ONNX_PATH):
+        try:
+            import onnxruntime
+        except ImportError as exc:
+            raise ImportError("SENTIMENT_BACKEND=onnx requires the onnxruntime package") from exc
+
+        if not os.path.exists(path):
+            export_onnx(model_id, path)
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def logits(self, inputs):
+        feed = {name: np.asarray(value, dtype=np.int64) for name, value in inputs.items() if name in self.input_names}
+        return self.session.run(None, feed)[0]
+
+
+def export_onnx(model_id, path):
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    model = AutoModelForSequenceClassification.from_pretrained(model_id)
+    model.eval()
+    tokenizer = AutoTokenizer.from_pretrained(model_id)
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"]),
+        tmp_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"},
+        },
+        opset_version=14,
+    )
+    os.replace(tmp_path, path)
+
+
+BACKENDS = {
+    "torch": TorchBackend,
+    "torch-int8": QuantizedTorchBackend,
+    "onnx": OnnxBackend,
+}
+
+
+def softmax(logits):
+    shifted = np.exp(logits - logits.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+# ---------------------------
+# Sentiment Analyzer
+# ---------------------------
+class SentimentAnalyzer:
+    def __init__(self, model_id=MODEL_ID, num_threads=SENTIMENT_NUM_THREADS, backend=SENTIMENT_BACKEND,
+                 workers=SENTIMENT_WORKERS, backend_options=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown SENTIMENT_BACKEND '{backend}', expected one of {sorted(BACKENDS)}")
+        from transformers import AutoTokenizer
+
+        self.model_id = model_id
+        self.backend_name = backend
+        self.workers = max(workers, 1)
+        if self.workers > 1 and not num_threads:
+            # Every worker's batch runs on the backend's intra-op threads; more than the cores just contend
+            num_threads = max((os.cpu_count() or 1) // self.workers, 1)
+        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
+        # Each backend applies num_threads to its own runtime (torch or onnxruntime);
+        # backend_options are the rest of its keyword arguments, e.g. the ONNX path
+        self.backend = BACKENDS[backend](model_id, num_threads, **(backend_options or {}))
+
+    def score(self, text):
+        return self._polarity(self.backend.logits(self._encode([text])))[0]
+
+    def _encode(self, texts):
+        # padding=True pads to the longest text in this batch only
+        return self.tokenizer(texts, return_tensors=self.backend.tensor_type,
+                              truncation=True, padding=True, max_length=128)
+
+    @staticmethod
+    def _polarity(logits):
+        probs = softmax(logits)
+        return probs[:, 2] - probs[:, 0]  # pos - neg
+
+    def score_batch(self, texts, batch_size=SENTIMENT_BATCH_SIZE, workers=None):
+        """
+        Scores many texts at once. Texts are sorted by length so each batch pads
+        to a similar size. With workers > 1 (default: the analyzer's) the
+        forward passes run on a thread pool (torch and onnxruntime release the
+        GIL); tokenizing stays in this thread, since a fast tokenizer must not
+        be called from several threads at once.
+        """
+        workers = workers or self.workers
+        texts = list(texts)
+        scores = np.empty(len(texts), dtype=np.float64)
+        # Character length is a cheap stand-in for token length when grouping
+        order = np.argsort([len(t) for t in texts], kind='stable')
+        batches = [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+        encoded = (self._encode([texts[i] for i in idx]) for idx in batches)
+
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                # map submits every batch up front, so the generator is drained in this thread
+                logits = pool.map(self.backend.logits, encoded)
+                for idx, batch_logits in zip(batches, logits):
+                    scores[idx] = self._polarity(batch_logits)
+        else:
+            for idx, inputs in zip(batches, encoded):
+                scores[idx] = self._polarity(self.backend.logits(inputs))
+        return scores
+
+
+# ---------------------------
+# Persistent Score Cache
+# ---------------------------
+class SentimentCache:
+    """
+    SQLite table of sentiment scores keyed by sha256(model id + comment text),
+    so a restart only runs the model on comments it has never seen.
+    """
+
+    CHUNK = 500  # stay well under SQLite's bound-parameter limit
+
+    def __init__(self, path=SENTIMENT_CACHE_PATH, model_id=None):
+        self.path = path
+        self.model_id = model_id or model_tag()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS sentiment (key TEXT PRIMARY KEY, score REAL NOT NULL)")
+
+    def _connect(self):
+        # One short-lived connection per call keeps the cache safe across threads and workers
+        return sqlite3.connect(self.path, timeout=30)
+
+    def key(self, text):
+        return hashlib.sha256(f"{self.model_id}\0{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys):
+        found = {}
+        with self._connect() as conn:
+            for i in range(0, len(keys), self.CHUNK):
+                chunk = keys[i:i + self.CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(conn.execute(
+                    f"SELECT key, score FROM sentiment WHERE key IN ({placeholders})", chunk
+                ).fetchall())
+        return found
+
+    def put_many(self, items):
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO sentiment (key, score) VALUES (?, ?)", items)
+
+
+def score_comments(comments, cache, analyzer_factory=SentimentAnalyzer):
+    """
+    Sentiment score for each comment, reading through the cache. The analyzer
+    is only constructed (and the model only loaded) when there are misses.
+    Every comment is scored exactly as written, like the model saw it before
+    the cache; a missing comment scores as the empty string.
+    """
+    texts = ["" if c is None else str(c) for c in comments]
+
+    keys = {}
+    for text in texts:
+        if text not in keys:
+            keys[text] = cache.key(text)
+
+    cached = cache.get_many(list(keys.values()))
+    missing = [text for text, key in keys.items() if key not in cached]
+    if missing:
+        print(f"Scoring {len(missing)} uncached comments ({len(cached)} cached)")
+        analyzer = analyzer_factory()
+        fresh = [(keys[text], float(score)) for text, score in zip(missing, analyzer.score_batch(missing))]
+        cache.put_many(fresh)
+        cached.update(fresh)
+
+    return np.array([cached[keys[text]] for text in texts], dtype=np.float64)
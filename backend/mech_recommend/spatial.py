@@ -0,0 +1,126 @@
+import numpy as np
+
+from .scoring import EARTH_RADIUS_KM, haversine_vec
+
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180.0
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash(lat, lon, precision=6):
+    """Standard base32 geohash; precision 6 is a cell of roughly 1.2 x 0.6 km."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bit, ch, even = 0, 0, True
+    while len(chars) < precision:
+        # Bits alternate between longitude and latitude, longitude first
+        value, bounds = (lon, lon_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            bounds[0] = mid
+        else:
+            ch <<= 1
+            bounds[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(GEOHASH_ALPHABET[ch])
+            bit, ch = 0, 0
+    return ''.join(chars)
+
+
+# ---------------------------
+# Grid Spatial Index
+# ---------------------------
+class GridIndex:
+    """
+    Fixed lat/lon grid over mechanic coordinates (a geohash-style bucketing).
+
+    Rows are sorted by cell id once at build time, so a cell lookup is a
+    binary search and a radius query only touches the cells that overlap the
+    query's bounding box before the exact haversine check.
+
+    The radians and the sorted cell order can be passed in precomputed (e.g.
+    memory-mapped from a shared store) instead of being derived again.
+    """
+
+    def __init__(self, mech_lat, mech_long, cell_deg=0.25, lat_rad=None, lon_rad=None, order=None, sorted_cells=None):
+        self.cell_deg = float(cell_deg)
+        self.lat = np.ascontiguousarray(mech_lat, dtype=np.float64)
+        self.lon = np.ascontiguousarray(mech_long, dtype=np.float64)
+        self.lat_rad = np.radians(self.lat) if lat_rad is None else lat_rad
+        self.lon_rad = np.radians(self.lon) if lon_rad is None else lon_rad
+        self.n_lon_cells = int(np.ceil(360.0 / self.cell_deg))
+
+        if order is None:
+            cells = self._cell_ids(self.lat, self.lon)
+            order = np.argsort(cells, kind='stable')
+            sorted_cells = cells[order]
+        self.order = order
+        self.sorted_cells = sorted_cells
+
+    def __len__(self):
+        return self.lat.shape[0]
+
+    def _cell_ids(self, lat, lon):
+        lat_idx = np.floor((np.asarray(lat) + 90.0) / self.cell_deg).astype(np.int64)
+        lon_idx = np.floor((np.asarray(lon) + 180.0) / self.cell_deg).astype(np.int64) % self.n_lon_cells
+        return lat_idx * self.n_lon_cells + lon_idx
+
+    def _rows_in_box(self, lat, lon, radius_km):
+        lat_span = radius_km / KM_PER_DEGREE
+        cos_lat = max(np.cos(np.radians(lat)), 1e-6)
+        lon_span = min(radius_km / (KM_PER_DEGREE * cos_lat), 180.0)
+
+        lat_lo = np.floor((max(lat - lat_span, -90.0) + 90.0) / self.cell_deg)
+        lat_hi = np.floor((min(lat + lat_span, 90.0) + 90.0) / self.cell_deg)
+        lon_lo = np.floor((lon - lon_span + 180.0) / self.cell_deg)
+        lon_hi = np.floor((lon + lon_span + 180.0) / self.cell_deg)
+        lon_cells = np.unique(np.arange(lon_lo, lon_hi + 1, dtype=np.int64) % self.n_lon_cells)
+
+        chunks = []
+        for lat_idx in range(int(lat_lo), int(lat_hi) + 1):
+            keys = lat_idx * self.n_lon_cells + lon_cells
+            lo = np.searchsorted(self.sorted_cells, keys, side='left')
+            hi = np.searchsorted(self.sorted_cells, keys, side='right')
+            for a, b in zip(lo, hi):
+                if b > a:
+                    chunks.append(self.order[a:b])
+        if not chunks:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(chunks)
+
+    def query_radius(self, lat, lon, radius_km):
+        """Row positions within radius_km of (lat, lon), in ascending row order."""
+        rows = self._rows_in_box(lat, lon, radius_km)
+        if rows.size == 0:
+            return rows
+        dist = haversine_vec(np.radians(lat), np.radians(lon), self.lat_rad[rows], self.lon_rad[rows])
+        return np.sort(rows[dist <= radius_km])
+
+    def query_knn(self, lat, lon, k):
+        """Row positions of the k nearest mechanics, nearest first."""
+        n = len(self)
+        k = min(int(k), n)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        radius_km = self.cell_deg * KM_PER_DEGREE
+        rows = self._rows_in_box(lat, lon, radius_km)
+        # Grow the search box until it holds k rows; the box is a superset of the
+        # circle, so the exact radius is re-checked below before accepting.
+        while True:
+            if rows.size >= k:
+                dist = haversine_vec(np.radians(lat), np.radians(lon), self.lat_rad[rows], self.lon_rad[rows])
+                part = np.argpartition(dist, k - 1)[:k]
+                if dist[part].max() <= radius_km or rows.size == n:
+                    return rows[part[np.argsort(dist[part], kind='stable')]]
+            if rows.size == n:
+                dist = haversine_vec(np.radians(lat), np.radians(lon), self.lat_rad[rows], self.lon_rad[rows])
+                return rows[np.argsort(dist, kind='stable')[:k]]
+            radius_km *= 2
+            if radius_km >= np.pi * EARTH_RADIUS_KM:
+                rows = np.arange(n)
+            else:
+                rows = self._rows_in_box(lat, lon, radius_km)
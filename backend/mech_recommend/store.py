@@ -0,0 +1,336 @@
+import json
+import math
+import os
+import shutil
+import time
+from collections.abc import Sequence
+
+import numpy as np
+from bson import ObjectId
+
+# find_mech fields the recommender reads; everything else stays in Mongo
+STORE_FIELDS = ['mech_name', 'mech_lat', 'mech_long', 'rating', 'comment', 'breakdown_type']
+
+# Per-row columns and string tables, each saved as .npy files (see StringTable)
+COLUMNS = ['ids', 'mech_lat', 'mech_long', 'rating', 'sentiment', 'name_codes', 'comment_codes', 'breakdown_codes']
+TABLES = ['names', 'comments', 'breakdown_types']
+
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def intern(values, table=None):
+    """int32 codes of values in a string table, which is extended with unseen values."""
+    table = [] if table is None else table
+    index = {v: i for i, v in enumerate(table)}
+    codes = np.empty(len(values), dtype=np.int32)
+    for i, value in enumerate(values):
+        code = index.get(value)
+        if code is None:
+            code = index[value] = len(table)
+            table.append(value)
+        codes[i] = code
+    return codes, table
+
+
+# ---------------------------
+# Shared String Tables
+# ---------------------------
+class StringTable(Sequence):
+    """
+    Read-only string table kept as one UTF-8 byte array plus offsets, with
+    None entries flagged in nulls. Published generations store their names
+    and comments this way, so workers memory-map them like the columns
+    instead of each decoding its own copy; a string is only decoded when a
+    record is built from it. Non-string values are stored as str.
+    """
+
+    def __init__(self, blob, offsets, nulls):
+        self.blob = blob
+        self.offsets = offsets
+        self.nulls = nulls
+
+    @classmethod
+    def from_strings(cls, values):
+        if isinstance(values, StringTable):
+            return values
+        encoded = [b'' if v is None else str(v).encode('utf-8') for v in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8),
+                   offsets, np.array([v is None for v in values], dtype=bool))
+
+    def arrays(self, name):
+        return {f'{name}.blob': self.blob, f'{name}.offsets': self.offsets, f'{name}.nulls': self.nulls}
+
+    @classmethod
+    def from_arrays(cls, arrays, name):
+        return cls(arrays[f'{name}.blob'], arrays[f'{name}.offsets'], arrays[f'{name}.nulls'])
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('string table index out of range')
+        if self.nulls[i]:
+            return None
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+
+# ---------------------------
+# Columnar Mechanic Store
+# ---------------------------
+class MechanicStore:
+    """
+    Column arrays for the mechanics in find_mech. The scored columns
+    (coordinates, rating, sentiment) are contiguous float64 arrays. Names,
+    comments and breakdown types are int32 codes into string tables that
+    hold each distinct value once. _ids are packed as 12-byte strings,
+    which sort in ObjectId order.
+
+    Stores are never modified in place. take(), concat() and
+    with_sentiment() return new stores that share the string tables.
+    """
+
+    def __init__(self, ids, mech_lat, mech_long, rating, sentiment,
+                 name_codes, names, comment_codes, comments, breakdown_codes, breakdown_types):
+        self.ids = ids
+        self.mech_lat = mech_lat
+        self.mech_long = mech_long
+        self.rating = rating
+        self.sentiment = sentiment
+        self.name_codes = name_codes
+        self.names = names
+        self.comment_codes = comment_codes
+        self.comments = comments
+        self.breakdown_codes = breakdown_codes
+        self.breakdown_types = breakdown_types
+
+    def __len__(self):
+        return self.mech_lat.shape[0]
+
+    @classmethod
+    def from_documents(cls, docs, rating_fill=None):
+        """
+        Builds a store from find_mech documents. Rows without coordinates are
+        dropped, a missing comment becomes '', and a missing rating gets
+        rating_fill (the median rating by default).
+        """
+        ids, lat, lon, rating, names, comments, types = [], [], [], [], [], [], []
+        for doc in docs:
+            if _missing(doc.get('mech_lat')) or _missing(doc.get('mech_long')):
+                continue
+            ids.append(doc['_id'].binary if isinstance(doc.get('_id'), ObjectId) else bytes(12))
+            lat.append(float(doc['mech_lat']))
+            lon.append(float(doc['mech_long']))
+            rating.append(np.nan if _missing(doc.get('rating')) else float(doc['rating']))
+            names.append(doc.get('mech_name'))
+            comments.append('' if _missing(doc.get('comment')) else doc['comment'])
+            types.append(None if _missing(doc.get('breakdown_type')) else doc['breakdown_type'])
+
+        rating = np.array(rating, dtype=np.float64)
+        missing = np.isnan(rating)
+        if missing.any():
+            if rating_fill is None:
+                rating_fill = np.median(rating[~missing]) if (~missing).any() else np.nan
+            rating[missing] = rating_fill
+
+        name_codes, names = intern(names)
+        comment_codes, comments = intern(comments)
+        breakdown_codes, types = intern(types)
+        return cls(
+            np.array(ids, dtype='S12'),
+            np.array(lat, dtype=np.float64),
+            np.array(lon, dtype=np.float64),
+            rating,
+            np.zeros(len(rating), dtype=np.float64),
+            name_codes, names, comment_codes, comments, breakdown_codes, types,
+        )
+
+    @property
+    def max_id(self):
+        # numpy drops trailing NUL bytes from 'S' items, so pad back to 12
+        return ObjectId(bytes(self.ids[np.argmax(self.ids)]).ljust(12, b'\0')) if len(self) else None
+
+    def ids_after(self, object_id):
+        """Packed _ids greater than object_id."""
+        return set(self.ids[self.ids > object_id.binary].tolist())
+
+    def with_sentiment(self, comment_scores):
+        """Same rows with sentiment taken from per-comment-table scores."""
+        sentiment = np.asarray(comment_scores, dtype=np.float64)[self.comment_codes]
+        return self._replace(sentiment=sentiment)
+
+    def take(self, rows):
+        return MechanicStore(
+            self.ids[rows], self.mech_lat[rows], self.mech_long[rows], self.rating[rows], self.sentiment[rows],
+            self.name_codes[rows], self.names, self.comment_codes[rows], self.comments,
+            self.breakdown_codes[rows], self.breakdown_types,
+        )
+
+    def concat(self, other):
+        """This store's rows followed by other's, with other's strings re-interned."""
+        def merge(codes, table, other_codes, other_table):
+            mapping, table = intern(other_table, list(table))
+            return np.concatenate([codes, mapping[other_codes]]), table
+
+        name_codes, names = merge(self.name_codes, self.names, other.name_codes, other.names)
+        comment_codes, comments = merge(self.comment_codes, self.comments, other.comment_codes, other.comments)
+        breakdown_codes, types = merge(self.breakdown_codes, self.breakdown_types,
+                                       other.breakdown_codes, other.breakdown_types)
+        return MechanicStore(
+            np.concatenate([self.ids, other.ids]),
+            np.concatenate([self.mech_lat, other.mech_lat]),
+            np.concatenate([self.mech_long, other.mech_long]),
+            np.concatenate([self.rating, other.rating]),
+            np.concatenate([self.sentiment, other.sentiment]),
+            name_codes, names, comment_codes, comments, breakdown_codes, types,
+        )
+
+    def _replace(self, **columns):
+        fields = dict(vars(self), **columns)
+        return MechanicStore(**fields)
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in COLUMNS}, {name: getattr(self, name) for name in TABLES}
+
+    @classmethod
+    def from_arrays(cls, arrays, tables):
+        return cls(**{name: arrays[name] for name in COLUMNS}, **{name: tables[name] for name in TABLES})
+
+    def breakdown_key_table(self):
+        """Code of the case-folded key for each entry of the breakdown type table (-1 if missing), and the keys."""
+        index, keys = {}, []
+        codes = np.empty(len(self.breakdown_types), dtype=np.int32)
+        for i, breakdown_type in enumerate(self.breakdown_types):
+            if breakdown_type is None:
+                codes[i] = -1
+                continue
+            key = str(breakdown_type).lower()
+            if key not in index:
+                index[key] = len(keys)
+                keys.append(key)
+            codes[i] = index[key]
+        return codes, keys
+
+    def breakdown_keys(self):
+        """Per-row code of the case-folded breakdown type (-1 where missing), and the keys."""
+        type_codes, keys = self.breakdown_key_table()
+        return type_codes[self.breakdown_codes], keys
+
+    def records(self, rows):
+        """Plain dicts for the given rows, in the shape the API returns."""
+        return [
+            {
+                'mech_name': self.names[self.name_codes[i]],
+                'mech_lat': self.mech_lat[i].item(),
+                'mech_long': self.mech_long[i].item(),
+                'rating': self.rating[i].item(),
+                'comment': self.comments[self.comment_codes[i]],
+                'breakdown_type': self.breakdown_types[self.breakdown_codes[i]],
+            }
+            for i in rows
+        ]
+
+
+# ---------------------------
+# Shared On-Disk Generations
+# ---------------------------
+class StoreDirectory:
+    """
+    Generations of mechanic arrays on disk, mapped read-only by every worker.
+
+    One process, the builder, holds an exclusive flock on .lock. It writes
+    each new table into a fresh gen-* directory of .npy files, then repoints
+    CURRENT at it with os.replace. Workers load the files with
+    np.load(mmap_mode='r'), so the OS page cache holds a single copy for all
+    of them, and they remap when CURRENT changes. Old generations are
+    removed after KEEP newer ones exist. On POSIX an unlinked file stays
+    valid for anyone who still maps it.
+    """
+
+    POINTER = 'CURRENT'
+    KEEP = 3
+
+    def __init__(self, path):
+        self.path = path
+        self._lock_file = None
+        self._lock_pid = None
+
+    def try_lock(self):
+        """Takes the builder lock without blocking; True if this process holds it."""
+        import fcntl  # POSIX only, like the shared store itself
+
+        # A forked child must not reuse the parent's open file (and with it the parent's lock)
+        if self._lock_pid != os.getpid():
+            os.makedirs(self.path, exist_ok=True)
+            self._lock_file = open(os.path.join(self.path, '.lock'), 'a+')
+            self._lock_pid = os.getpid()
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    def current(self):
+        try:
+            with open(os.path.join(self.path, self.POINTER)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def publish(self, arrays, tables, meta):
+        """Writes a generation and makes it current; returns its name."""
+        name = f"gen-{time.time_ns()}-{os.getpid()}"
+        tmp_dir = os.path.join(self.path, f".{name}.tmp")
+        os.makedirs(tmp_dir)
+        arrays = dict(arrays)
+        for key, table in tables.items():
+            arrays.update(StringTable.from_strings(table).arrays(key))
+        for key, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{key}.npy"), np.ascontiguousarray(array), allow_pickle=False)
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        os.rename(tmp_dir, os.path.join(self.path, name))
+
+        pointer_tmp = os.path.join(self.path, f".{self.POINTER}.{os.getpid()}.tmp")
+        with open(pointer_tmp, 'w') as f:
+            f.write(name)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(pointer_tmp, os.path.join(self.path, self.POINTER))
+        self.prune()
+        return name
+
+    def open(self, name):
+        """(memory-mapped arrays, memory-mapped string tables, meta) of a generation."""
+        gen_dir = os.path.join(self.path, name)
+        arrays = {
+            entry[:-4]: np.load(os.path.join(gen_dir, entry), mmap_mode='r')
+            for entry in os.listdir(gen_dir) if entry.endswith('.npy')
+        }
+        if os.path.exists(os.path.join(gen_dir, 'tables.json')):
+            # Generations published before the string tables were mapped
+            with open(os.path.join(gen_dir, 'tables.json')) as f:
+                tables = json.load(f)
+        else:
+            tables = {key: StringTable.from_arrays(arrays, key) for key in TABLES}
+        with open(os.path.join(gen_dir, 'meta.json')) as f:
+            meta = json.load(f)
+        return arrays, tables, meta
+
+    def prune(self):
+        current = self.current()
+        generations = sorted(
+            (entry for entry in os.listdir(self.path) if entry.startswith('gen-') and entry != current),
+            key=lambda entry: int(entry.split('-')[1]),
+        )
+        for entry in generations[:max(len(generations) - (self.KEEP - 1), 0)]:
+            shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
@@ -1,3 +1,949 @@
-from django.test import TestCase
+import importlib.util
+import json
+import os
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
-# Create your tests here.
+import numpy as np
+from bson import ObjectId
+from django.test import RequestFactory, SimpleTestCase
+from pymongo import MongoClient
+
+from . import counters, expiry
+from .indexes import (assigned_requests_query, ensure_indexes, mechanic_feed_query, pending_requests_query,
+                      user_active_request_query)
+from .scoring import ScoringEngine, min_max, parse_weights, static_terms, top_k_unique
+from .store import MechanicStore
+
+# name, lat, long, rating, sentiment, breakdown_type
+FIXTURE = [
+    ('Shree Auto Works', 23.0300, 72.5800, 4.5, 0.80, 'Engine'),
+    ('Patel Garage', 23.0450, 72.5600, 3.0, 0.10, 'engine'),
+    ('Highway Motors', 23.1000, 72.6500, 5.0, 0.95, 'Engine'),
+    ('City Car Care', 23.0200, 72.5900, 2.0, -0.60, 'engine'),
+    ('Quick Fix', 23.0000, 72.5000, 4.0, 0.30, 'Battery'),
+    ('Volt Point', 23.0600, 72.6000, 3.5, 0.50, 'battery'),
+    ('Shree Auto Works', 23.0310, 72.5810, 4.5, 0.80, 'Battery'),
+    ('Tyre World', 22.9900, 72.6100, 4.8, 0.70, 'Tyre'),
+    ('Puncture Point', 23.0500, 72.5200, 3.2, -0.20, 'tyre'),
+    ('Ring Road Tyres', 23.1200, 72.5400, 4.1, 0.40, 'Tyre'),
+    ('Lone Brake Shop', 23.0400, 72.5700, 3.9, 0.20, 'Brake'),
+]
+
+# Tests that need a real server (array filters, query plans) run only when this is set
+MONGO_TEST_URL = os.getenv('MONGO_TEST_URL')
+MONGO_TEST_DB = os.getenv('MONGO_TEST_DB', 'mechafix_test')
+
+CITY_CENTRE = (23.03, 72.58)
+NORTH_EAST = (23.10, 72.60)
+
+
+def fixture_store():
+    docs = [
+        {'_id': ObjectId(), 'mech_name': name, 'mech_lat': lat, 'mech_long': lon, 'rating': rating,
+         'comment': '', 'breakdown_type': breakdown_type}
+        for name, lat, lon, rating, _, breakdown_type in FIXTURE
+    ]
+    return MechanicStore.from_documents(docs)._replace(sentiment=np.array([f[4] for f in FIXTURE]))
+
+
+class RankingRegressionTests(SimpleTestCase):
+    """Pins rankings on fixture data so scoring changes show up as test diffs."""
+
+    def setUp(self):
+        self.store = fixture_store()
+        self.codes, self.keys = self.store.breakdown_keys()
+
+    def rank(self, user, breakdown_type, normalizer='minmax', k=None):
+        engine = ScoringEngine(self.store.mech_lat, self.store.mech_long, self.store.rating, self.store.sentiment,
+                               partition_codes=self.codes, normalizer=normalizer)
+        rows = np.flatnonzero(self.codes == self.keys.index(breakdown_type))
+        _, score = engine.score(*user, rows, partitioned=True)
+        top = top_k_unique(score, self.store.name_codes[rows], k)
+        return [self.store.names[self.store.name_codes[r]] for r in rows[top]], np.round(score[top], 4).tolist()
+
+    def test_engine_partition(self):
+        self.assertEqual(self.rank(CITY_CENTRE, 'engine'), (
+            ['Shree Auto Works', 'Highway Motors', 'Patel Garage', 'City Car Care'],
+            [0.9306, 0.5, 0.2934, 0.1707],
+        ))
+        self.assertEqual(self.rank(NORTH_EAST, 'engine'), (
+            ['Highway Motors', 'Shree Auto Works', 'Patel Garage', 'City Car Care'],
+            [1.0, 0.5104, 0.3423, 0.0],
+        ))
+
+    def test_battery_partition(self):
+        self.assertEqual(self.rank(CITY_CENTRE, 'battery')[0], ['Shree Auto Works', 'Quick Fix', 'Volt Point'])
+        self.assertEqual(self.rank(NORTH_EAST, 'battery')[0], ['Shree Auto Works', 'Volt Point', 'Quick Fix'])
+
+    def test_tyre_partition(self):
+        self.assertEqual(self.rank(CITY_CENTRE, 'tyre')[0], ['Tyre World', 'Puncture Point', 'Ring Road Tyres'])
+        self.assertEqual(self.rank(NORTH_EAST, 'tyre')[0], ['Ring Road Tyres', 'Tyre World', 'Puncture Point'])
+
+    def test_zscore_normalizer(self):
+        self.assertEqual(self.rank(NORTH_EAST, 'engine', normalizer='zscore'), (
+            ['Highway Motors', 'Shree Auto Works', 'Patel Garage', 'City Car Care'],
+            [1.3836, 0.1077, -0.3072, -1.1841],
+        ))
+
+    def test_single_row_partition_scores_zero_not_nan(self):
+        self.assertEqual(self.rank(CITY_CENTRE, 'brake'), (['Lone Brake Shop'], [0.0]))
+
+    def test_global_ranking_dedups_names(self):
+        engine = ScoringEngine(self.store.mech_lat, self.store.mech_long, self.store.rating, self.store.sentiment)
+        _, score = engine.score(*CITY_CENTRE)
+        top = top_k_unique(score, self.store.name_codes, 5)
+        self.assertEqual([self.store.names[self.store.name_codes[r]] for r in top],
+                         ['Shree Auto Works', 'Highway Motors', 'Tyre World', 'Lone Brake Shop', 'Volt Point'])
+
+    def test_score_many_matches_score(self):
+        engine = ScoringEngine(self.store.mech_lat, self.store.mech_long, self.store.rating, self.store.sentiment,
+                               partition_codes=self.codes)
+        rows = np.flatnonzero(self.codes == self.keys.index('engine'))
+        _, batch = engine.score_many([CITY_CENTRE[0], NORTH_EAST[0]], [CITY_CENTRE[1], NORTH_EAST[1]], rows,
+                                     partitioned=True)
+        for i, user in enumerate((CITY_CENTRE, NORTH_EAST)):
+            np.testing.assert_array_equal(batch[i], engine.score(*user, rows, partitioned=True)[1])
+
+
+class ScoringConfigTests(SimpleTestCase):
+    def test_min_max_guards_constant_input(self):
+        np.testing.assert_array_equal(min_max(np.array([3.0])), [0.0])
+        np.testing.assert_array_equal(min_max(np.array([2.0, 2.0, 2.0])), [0.0, 0.0, 0.0])
+        np.testing.assert_array_equal(min_max(np.array([1.0, 3.0, 2.0])), [0.0, 1.0, 0.5])
+
+    def test_parse_weights(self):
+        self.assertEqual(parse_weights(''), {'distance': 0.5, 'rating': 0.3, 'sentiment': 0.2})
+        self.assertEqual(parse_weights('distance=0.7, sentiment=0'), {'distance': 0.7, 'rating': 0.3, 'sentiment': 0.0})
+        with self.assertRaises(ValueError):
+            parse_weights('price=1')
+
+    def test_partition_stats_are_per_partition(self):
+        rating = np.array([1.0, 5.0, 2.0, 4.0])
+        sentiment = np.zeros(4)
+        codes = np.array([0, 0, 1, 1], dtype=np.int32)
+        global_static, partition_static = static_terms(rating, sentiment, codes, parse_weights(''))
+        np.testing.assert_allclose(global_static, [0.0, 0.3, 0.075, 0.225])
+        np.testing.assert_allclose(partition_static, [0.0, 0.3, 0.0, 0.3])
+
+
+class MechanicTableTests(SimpleTestCase):
+    def test_append_matches_full_rebuild(self):
+        from .recommendation import MechanicTable
+
+        store = fixture_store()
+        head = store.take(np.arange(len(store)) < 6)
+        tail = store.take(np.arange(len(store)) >= 6)
+        appended = MechanicTable(head, sentiment_ready=True).append(tail)
+        rebuilt = MechanicTable(head.concat(tail), sentiment_ready=True)
+        for key in MechanicTable.DERIVED:
+            np.testing.assert_array_equal(appended.derived[key], rebuilt.derived[key], err_msg=key)
+        for user in (CITY_CENTRE, NORTH_EAST):
+            for breakdown_type in ('engine', 'tyre', 'brake'):
+                expected = rebuilt.rank(*user, breakdown_type, k=3)
+                for got, want in zip(appended.rank(*user, breakdown_type, k=3), expected):
+                    np.testing.assert_array_equal(got, want)
+
+    def test_published_generation_maps_string_tables(self):
+        import tempfile
+
+        from .recommendation import MechanicTable
+        from .store import StoreDirectory, StringTable
+
+        docs = [
+            {'_id': ObjectId(), 'mech_name': 'Shree Auto Works', 'mech_lat': 23.03, 'mech_long': 72.58,
+             'rating': 4.5, 'comment': 'बहुत अच्छा', 'breakdown_type': 'Engine'},
+            {'_id': ObjectId(), 'mech_name': None, 'mech_lat': 23.04, 'mech_long': 72.59,
+             'rating': 3.0, 'comment': None, 'breakdown_type': None},
+        ]
+        table = MechanicTable(MechanicStore.from_documents(docs), sentiment_ready=True)
+        with tempfile.TemporaryDirectory() as path:
+            store_dir = StoreDirectory(path)
+            opened = MechanicTable.open(store_dir, table.publish(store_dir, 1))
+            self.assertIsInstance(opened.store.names, StringTable)
+            self.assertIsInstance(opened.store.names.blob, np.memmap)
+            self.assertEqual(opened.store.records([0, 1]), table.store.records([0, 1]))
+            self.assertEqual(list(opened.store.breakdown_types), ['Engine', None])
+
+class ReplayOutputTests(SimpleTestCase):
+    """replay_recommendations' stdout is pure JSONL, whatever the loaders and the ranker print on the way."""
+
+    def test_every_stdout_line_is_json(self):
+        import io
+        import tempfile
+        from unittest import mock
+
+        from django.core.management import call_command
+
+        from .management.commands import replay_recommendations
+        from .recommendation import MechanicTable
+
+        def load_table(command):
+            print("🔌 MongoDB pool ready in pid 1")  # as get_client / score_comments do while loading
+            return MechanicTable(fixture_store(), sentiment_ready=True)
+
+        requests = [{'request_id': i, 'lat': 23.0 + i / 100, 'lon': 72.55, 'breakdown_type': t}
+                    for i, t in enumerate(['engine', 'Tyre', 'hydraulics', None, 'battery'])]
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write('\n'.join(json.dumps(r) for r in requests) + '\n')
+        self.addCleanup(os.remove, f.name)
+
+        for processes in (1, 2):
+            with mock.patch.object(replay_recommendations.Command, 'load_table', load_table), \
+                    mock.patch('sys.stdout', new_callable=io.StringIO) as stdout, \
+                    mock.patch('sys.stderr', new_callable=io.StringIO) as stderr:
+                call_command('replay_recommendations', jsonl=f.name, processes=processes, chunk_size=2)
+
+            lines = [json.loads(line) for line in stdout.getvalue().splitlines()]
+            self.assertEqual(sorted(line['request_id'] for line in lines), list(range(len(requests))))
+            self.assertTrue(all(line['mechanics'] for line in lines))
+            self.assertIn('MongoDB pool ready', stderr.getvalue())
+            if processes == 1:
+                # The unknown type's fallback message, printed by MechanicTable.rank itself
+                self.assertIn("No exact match for breakdown_type 'hydraulics'", stderr.getvalue())
+
+
+class RoadDistanceDeadlineTests(SimpleTestCase):
+    USER = (23.03, 72.58)
+    PAGE = [(23.04, 72.59), (23.05, 72.60)]
+    NEXT_PAGE = [(23.06, 72.61)]
+
+    def service(self, matrix):
+        from .road_distance import RoadDistanceService
+
+        class FakeORS(RoadDistanceService):
+            def fetch_matrix(self, user_lat, user_long, mech_coords):
+                self.matrix_calls += 1
+                self.matrix_coords = list(mech_coords)
+                return matrix(mech_coords)
+
+            def fetch(self, user_lat, user_long, mech_lat, mech_long):
+                self.directions_calls += 1
+                return 7.0
+
+        return FakeORS(mode='matrix', engine='ors', timeout=0.2, workers=2)
+
+    def haversine(self):
+        from .scoring import haversine_distance
+
+        return [haversine_distance(*self.USER, *coords) for coords in self.PAGE]
+
+    def test_matrix_timeout_skips_per_pair_requests(self):
+        service = self.service(lambda coords: time.sleep(0.5) or [1.0] * len(coords))
+        self.assertEqual(service.distances(*self.USER, self.PAGE, self.NEXT_PAGE), self.haversine())
+        self.assertEqual(service.directions_calls, 0)
+        self.assertEqual(service.fallbacks, 2)
+
+    def test_matrix_error_falls_back_per_pair_for_the_page_only(self):
+        def fail(coords):
+            raise OSError('connection refused')
+
+        service = self.service(fail)
+        self.assertEqual(service.distances(*self.USER, self.PAGE, self.NEXT_PAGE), [7.0, 7.0])
+        self.assertEqual(service.directions_calls, 2)
+
+    def test_prefetch_rides_along_and_is_cached(self):
+        service = self.service(lambda coords: [float(i + 1) for i in range(len(coords))])
+        self.assertEqual(service.distances(*self.USER, self.PAGE, self.NEXT_PAGE), [1.0, 2.0])
+        self.assertEqual(service.matrix_coords, self.PAGE + self.NEXT_PAGE)
+        self.assertEqual(service.distances(*self.USER, self.NEXT_PAGE), [3.0])
+        self.assertEqual(service.matrix_calls, 1)
+
+
+# A tiny hand-made road network: a square 0-1-2-3 with a short side 0-3 and
+# a long side 3-2, a one-way spur 4 -> 0 and an isolated node 5.
+ROAD_NODES = 'id,lat,lon\n10,23.00,72.50\n11,23.00,72.51\n12,23.01,72.51\n13,23.01,72.50\n14,22.99,72.49\n15,23.05,72.55\n'
+ROAD_EDGES = 'u,v,length_m,oneway\n10,11,1000,no\n11,12,1000,no\n10,13,500,no\n13,12,3000,no\n14,10,600,yes\n'
+ROAD_POINTS = [(23.00, 72.50), (23.00, 72.51), (23.01, 72.51), (23.01, 72.50), (22.99, 72.49), (23.05, 72.55)]
+
+
+class RoadGraphTests(SimpleTestCase):
+    """The local routing engine on a bundled graph, fully offline."""
+
+    @classmethod
+    def setUpClass(cls):
+        import io
+        import tempfile
+
+        from django.core.management import call_command
+
+        from .routing import RoadGraph
+
+        super().setUpClass()
+        cls.tmp = tempfile.TemporaryDirectory()
+        nodes, edges = os.path.join(cls.tmp.name, 'nodes.csv'), os.path.join(cls.tmp.name, 'edges.csv')
+        with open(nodes, 'w') as f:
+            f.write(ROAD_NODES)
+        with open(edges, 'w') as f:
+            f.write(ROAD_EDGES)
+        cls.path = os.path.join(cls.tmp.name, 'graph.npz')
+        call_command('build_road_graph', nodes=nodes, edges=edges, output=cls.path, stdout=io.StringIO())
+        cls.graph = RoadGraph.load(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+        super().tearDownClass()
+
+    def test_build(self):
+        self.assertEqual(self.graph.n_nodes, 6)
+        self.assertEqual(self.graph.n_edges, 9)  # 4 two-way roads + 1 one-way
+
+    def test_bidirectional_dijkstra(self):
+        self.assertEqual(self.graph.shortest_path_m(0, 2), 2000.0)  # 0-1-2 beats 0-3-2
+        self.assertEqual(self.graph.shortest_path_m(3, 2), 2500.0)  # 3-0-1-2 beats the direct 3000 m road
+        self.assertEqual(self.graph.shortest_path_m(4, 2), 2600.0)
+        self.assertEqual(self.graph.shortest_path_m(1, 1), 0.0)
+        self.assertIsNone(self.graph.shortest_path_m(0, 4))  # against the one-way spur
+        self.assertIsNone(self.graph.shortest_path_m(0, 5))
+
+    def test_one_to_many_matches_pairwise(self):
+        found = self.graph.shortest_paths_m(0, {1, 2, 3, 4, 5})
+        self.assertEqual(found, {1: 1000.0, 2: 2000.0, 3: 500.0})
+        for target, metres in found.items():
+            self.assertEqual(self.graph.shortest_path_m(0, target), metres)
+
+    def test_road_distance_includes_snapping(self):
+        from .scoring import haversine_distance
+
+        self.assertAlmostEqual(self.graph.road_distance_km(*ROAD_POINTS[0], *ROAD_POINTS[2]), 2.0)
+        off_road = (23.001, 72.50)
+        self.assertAlmostEqual(self.graph.road_distance_km(*off_road, *ROAD_POINTS[2]),
+                               haversine_distance(*off_road, *ROAD_POINTS[0]) + 2.0)
+        self.assertEqual(self.graph.road_distances_km(*ROAD_POINTS[0], ROAD_POINTS[1:]),
+                         [1.0, 2.0, 0.5, None, None])
+
+    def test_service_falls_back_to_haversine_where_unreachable(self):
+        from .road_distance import RoadDistanceService
+        from .scoring import haversine_distance
+
+        service = RoadDistanceService(engine='local', graph_path=self.path)
+        user, targets = ROAD_POINTS[0], [ROAD_POINTS[2], ROAD_POINTS[4], ROAD_POINTS[5]]
+        self.assertEqual(service.distances(*user, targets),
+                         [2.0, haversine_distance(*user, *ROAD_POINTS[4]), haversine_distance(*user, *ROAD_POINTS[5])])
+        self.assertEqual((service.local_calls, service.fallbacks), (1, 2))
+        # Routed answers are cached, fallbacks are not
+        service.distances(*user, targets)
+        self.assertEqual((service.local_calls, service.fallbacks), (2, 4))
+
+    def test_service_falls_back_to_haversine_without_graph_file(self):
+        from .road_distance import RoadDistanceService
+        from .scoring import haversine_distance
+
+        service = RoadDistanceService(engine='local', graph_path=os.path.join(self.tmp.name, 'missing.npz'))
+        user = ROAD_POINTS[0]
+        self.assertEqual(service.distances(*user, ROAD_POINTS[1:3]),
+                         [haversine_distance(*user, *p) for p in ROAD_POINTS[1:3]])
+        self.assertEqual(service.fallbacks, 2)
+
+
+class RankingSessionTests(SimpleTestCase):
+    """Cursor pages must never repeat or skip a mechanic, even when a deeper ranking reorders the list."""
+
+    MECHANICS = [{'mech_name': f'M{i}', 'mech_lat': 23.0 + i / 100, 'mech_long': 72.5} for i in range(12)]
+
+    def ranked_records(self, lat, lon, breakdown_type, depth):
+        # Deeper rankings put the list in reverse (as a candidate-set switch or a refresh could)
+        order = self.MECHANICS if depth <= 4 else self.MECHANICS[::-1]
+        return [dict(m) for m in order[:depth]], depth >= len(self.MECHANICS)
+
+    def test_pages_cover_every_mechanic_once_with_their_own_road_distance(self):
+        from unittest import mock
+
+        from . import views
+
+        road = mock.Mock(mode='directions')
+        road.distances.side_effect = lambda lat, lon, coords, prefetch=(): [c[0] * 10 for c in coords]
+        session = {'lat': 23.0, 'lon': 72.5, 'breakdown_type': 'engine', 'complete': False, 'road': {}}
+        session['mechanics'], _ = self.ranked_records(23.0, 72.5, 'engine', 4)
+
+        seen = []
+        with mock.patch.object(views, 'ranked_records', self.ranked_records), \
+                mock.patch.object(views, 'RANKING_SESSION_DEPTH', 4), \
+                mock.patch('mech_recommend.recommendation.road_distances', road):
+            offset, has_more = 0, True
+            while has_more:
+                page, has_more = views._ranking_page(session, offset, 3)
+                offset += 3
+                seen += page
+
+        self.assertEqual(sorted(m['mech_name'] for m in seen), sorted(m['mech_name'] for m in self.MECHANICS))
+        self.assertEqual([m['mech_name'] for m in seen[:4]], ['M0', 'M1', 'M2', 'M3'])
+        for m in seen:
+            self.assertEqual(m['road_distance_km'], m['mech_lat'] * 10)
+
+    def post(self, body):
+        from . import views
+
+        request = RequestFactory().post('/', json.dumps(body), content_type='application/json')
+        response = views.get_mechanics(request)
+        return response.status_code, json.loads(response.content)
+
+    def test_only_first_pages_open_a_session_and_limits_are_clamped(self):
+        from unittest import mock
+
+        from django.core.cache import caches
+
+        from . import views
+
+        road = mock.Mock(mode='directions')
+        road.distances.side_effect = lambda lat, lon, coords, prefetch=(): [1.0] * len(coords)
+        cache = caches.create_connection('default')
+        first = {'lat': 23.0, 'lon': 72.5, 'breakdown_type': 'engine'}
+        with mock.patch.object(views, 'ranked_records', self.ranked_records), \
+                mock.patch.object(views, 'RANKING_SESSION_DEPTH', 4), \
+                mock.patch.object(views, 'cache', cache), \
+                mock.patch.object(cache, 'set', wraps=cache.set) as cache_set, \
+                mock.patch('mech_recommend.recommendation.road_distances', road):
+            # An offset page from a client without cursors: served, but nothing is kept
+            status, body = self.post(dict(first, offset=3, limit=2))
+            self.assertEqual((status, body['cursor']), (200, None))
+            self.assertEqual([m['mech_name'] for m in body['mechanics']], ['M8', 'M7'])
+            cache_set.assert_not_called()
+
+            status, body = self.post(dict(first, limit=-5))
+            self.assertEqual(len(body['mechanics']), 1)
+            cursor = body['cursor']
+            self.assertEqual(cache_set.call_count, 1)
+
+            status, body = self.post({'cursor': cursor, 'limit': 10 ** 6})
+            self.assertEqual([m['mech_name'] for m in body['mechanics']], ['M1', 'M2', 'M3', 'M11'])
+            self.assertEqual(cache.get(f"ranking_{cursor}")['next'], 5)
+
+
+class MechanicFeedCursorTests(SimpleTestCase):
+    """Feed cursors round-trip exactly, reject garbage, and page past requests without a created_at."""
+
+    def test_cursor_round_trip(self):
+        from .views import _decode_feed_cursor, _encode_feed_cursor
+
+        _id = ObjectId()
+        created_at = datetime(2024, 5, 17, 9, 30, 15, 123000)
+        self.assertEqual(_decode_feed_cursor(_encode_feed_cursor({'_id': _id, 'created_at': created_at})),
+                         (created_at, _id))
+        self.assertEqual(_decode_feed_cursor(_encode_feed_cursor({'_id': _id, 'created_at': None})), (None, _id))
+        self.assertEqual(_decode_feed_cursor(_encode_feed_cursor({'_id': _id})), (None, _id))
+        completed_at = datetime(2024, 5, 18, 7, 0)
+        self.assertEqual(_decode_feed_cursor(_encode_feed_cursor(
+            {'_id': _id, 'created_at': created_at, 'completed_at': completed_at}, 'completed_at')), (completed_at, _id))
+
+    def test_invalid_cursor_is_a_bad_request(self):
+        import base64
+
+        from bson.errors import InvalidId
+
+        from . import views
+
+        bad = ['%%%', base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+               base64.urlsafe_b64encode(b'yesterday|' + str(ObjectId()).encode()).decode(),
+               base64.urlsafe_b64encode(b'2024-05-17T09:30:15|not-an-id').decode()]
+        for token in bad:
+            with self.assertRaises((ValueError, TypeError, InvalidId)):
+                views._decode_feed_cursor(token)
+            response = views._mechanic_feed(RequestFactory().get('/', {'cursor': token}), str(ObjectId()), False)
+            self.assertEqual(response.status_code, 400)
+
+    def test_first_page_has_no_cursor_predicate(self):
+        mech_id = str(ObjectId())
+        query, sort = mechanic_feed_query(mech_id)
+        self.assertEqual(query, {'$or': [{'mechanics_list.mech_id': {'$in': [mech_id, ObjectId(mech_id)]}},
+                                         {'assigned_worker.worker_id': mech_id}]})
+        self.assertEqual(sort, [('created_at', -1), ('_id', -1)])
+
+        # Completed requests come most recently completed first, as they always have
+        query, sort = mechanic_feed_query(mech_id, completed=True)
+        self.assertEqual(query['mechanics_list']['$elemMatch']['status'], 'completed')
+        self.assertEqual(sort, [('completed_at', -1), ('_id', -1)])
+
+    def test_page_after_a_dated_request(self):
+        mech_id, last_id = str(ObjectId()), ObjectId()
+        value = datetime(2024, 5, 17, 9, 30)
+        for completed, field in ((False, 'created_at'), (True, 'completed_at')):
+            query, _ = mechanic_feed_query(mech_id, completed=completed, after=(value, last_id))
+            base, page = query['$and']
+            self.assertEqual(base, mechanic_feed_query(mech_id, completed=completed)[0])
+            # Older requests, same-instant ties by _id, then every undated request (they sort last)
+            self.assertEqual(page, {'$or': [
+                {field: {'$lt': value}},
+                {field: value, '_id': {'$lt': last_id}},
+                {field: None},
+            ]})
+
+    def test_next_cursor_continues_from_the_last_sent_request(self):
+        from .views import _decode_feed_cursor, _stream_feed
+
+        class Cursor(list):
+            def close(self):
+                pass
+
+        docs = [{'_id': ObjectId(), 'created_at': datetime(2024, 5, 1), 'completed_at': datetime(2024, 5, 20 - i)}
+                for i in range(3)]
+        body = json.loads(''.join(_stream_feed(Cursor(map(dict, docs)), 2, 'completed_at')))
+        self.assertEqual([r['_id'] for r in body['requests']], [str(d['_id']) for d in docs[:2]])
+        self.assertEqual(_decode_feed_cursor(body['next_cursor']), (docs[1]['completed_at'], docs[1]['_id']))
+
+        body = json.loads(''.join(_stream_feed(Cursor(map(dict, docs)), 3, 'completed_at')))
+        self.assertIsNone(body['next_cursor'])
+
+    def test_page_after_an_undated_request(self):
+        mech_id, last_id = str(ObjectId()), ObjectId()
+        query, _ = mechanic_feed_query(mech_id, after=(None, last_id))
+        self.assertEqual(query['$and'][1], {'created_at': None, '_id': {'$lt': last_id}})
+
+
+class DailyCounterDeltaTests(SimpleTestCase):
+    """Each view transition moves every mechanic's counters by exactly the right amount."""
+
+    def setUp(self):
+        self.created_at = datetime(2024, 5, 17, 22, 45)
+        self.day = '2024-05-17'
+        self.mech_ids = ['a', 'b', 'c']
+
+    def request(self, *statuses):
+        return {'created_at': self.created_at,
+                'mechanics_list': [{'mech_id': m, 'status': s} for m, s in zip(self.mech_ids, statuses)]}
+
+    def deltas(self, deltas):
+        # Zero deltas are not written, so they do not count
+        return {mech_id: {f: n for f, n in fields.items() if n} for (mech_id, day), fields in deltas.items()
+                if day == self.day and any(fields.values())}
+
+    def test_create(self):
+        deltas = counters.status_deltas(self.request('pending', 'pending', 'pending'), {}, created=True)
+        self.assertEqual(self.deltas(deltas), {m: {'total': 1, 'pending': 1} for m in self.mech_ids})
+
+    def test_accept_cancels_the_other_pending_mechanics(self):
+        deltas = counters.transition(self.request('pending', 'pending', 'rejected'), 'a', 'accepted',
+                                     cancel_pending=True)
+        # accepted is still pending work for a; c already rejected and stays so
+        self.assertEqual(self.deltas(deltas), {'b': {'pending': -1, 'cancelled': 1}})
+
+    def test_reject(self):
+        deltas = counters.transition(self.request('pending', 'pending', 'pending'), 'b', 'rejected')
+        self.assertEqual(self.deltas(deltas), {'b': {'pending': -1, 'rejected': 1}})
+
+    def test_complete(self):
+        deltas = counters.transition(self.request('accepted', 'cancelled', 'cancelled'), 'a', 'completed')
+        self.assertEqual(self.deltas(deltas), {'a': {'pending': -1, 'completed': 1}})
+
+    def test_expiry_cancels_every_pending_mechanic(self):
+        deltas = counters.transition(self.request('pending', 'pending', 'pending'), None, cancel_pending=True)
+        self.assertEqual(self.deltas(deltas), {m: {'pending': -1, 'cancelled': 1} for m in self.mech_ids})
+
+    def test_object_id_mechanics_and_missing_ids(self):
+        mech_id = ObjectId()
+        request = {'created_at': self.created_at,
+                   'mechanics_list': [{'mech_id': mech_id, 'status': 'pending'}, {'status': 'pending'}]}
+        deltas = counters.transition(request, str(mech_id), 'rejected')
+        self.assertEqual(self.deltas(deltas), {str(mech_id): {'pending': -1, 'rejected': 1}})
+
+
+class DbMetricsAccessTests(SimpleTestCase):
+    """Pool and command metrics are for staff only."""
+
+    def test_only_staff_see_metrics(self):
+        from types import SimpleNamespace
+
+        from django.contrib.auth.models import AnonymousUser
+
+        from . import views
+
+        for user, status in [(AnonymousUser(), 403), (SimpleNamespace(is_staff=False), 403),
+                             (SimpleNamespace(is_staff=True), 200)]:
+            request = RequestFactory().get('/api/db/metrics/')
+            request.user = user
+            response = views.get_db_metrics(request)
+            self.assertEqual(response.status_code, status)
+            self.assertEqual('mongo' in json.loads(response.content), status == 200)
+
+    def test_wrong_method_is_405_before_auth(self):
+        from django.contrib.auth.models import AnonymousUser
+
+        from . import views
+
+        request = RequestFactory().post('/api/db/metrics/')
+        request.user = AnonymousUser()
+        self.assertEqual(views.get_db_metrics(request).status_code, 405)
+
+
+def installed(*modules):
+    return all(importlib.util.find_spec(m) is not None for m in modules)
+
+
+PARITY_COMMENTS = [
+    'Excellent service, fixed my car in no time!',
+    'Terrible experience, they overcharged and the problem came back.',
+    'It was okay.',
+    'Very polite mechanic, reached quickly on the highway at night.',
+    'Never going there again, rude staff.',
+]
+
+
+class SentimentBatchTests(SimpleTestCase):
+    """score_batch keeps every tokenizer call on the calling thread and only fans the forward passes out."""
+
+    class Tokenizer:
+        def __init__(self):
+            self.threads = set()
+
+        def __call__(self, texts, **kwargs):
+            self.threads.add(threading.get_ident())
+            return {'lengths': np.array([len(t) for t in texts], dtype=np.float64)}
+
+    class Backend:
+        tensor_type = 'np'
+
+        def __init__(self):
+            self.threads = set()
+
+        def logits(self, inputs):
+            self.threads.add(threading.get_ident())
+            time.sleep(0.01)
+            # Positive logit grows with the text length, so each score tells which text it belongs to
+            lengths = inputs['lengths']
+            return np.stack([np.zeros_like(lengths), np.zeros_like(lengths), np.log1p(lengths)], axis=1)
+
+    def analyzer(self):
+        from .sentiment import SentimentAnalyzer
+
+        analyzer = SentimentAnalyzer.__new__(SentimentAnalyzer)
+        analyzer.tokenizer, analyzer.backend, analyzer.workers = self.Tokenizer(), self.Backend(), 1
+        return analyzer
+
+    def test_workers_share_only_the_backend(self):
+        texts = ['x' * n for n in (5, 1, 40, 12, 3, 25, 8, 2, 17)]
+        serial = self.analyzer().score_batch(texts, batch_size=2)
+
+        analyzer = self.analyzer()
+        scores = analyzer.score_batch(texts, batch_size=2, workers=4)
+        np.testing.assert_allclose(scores, serial)
+        self.assertEqual(analyzer.tokenizer.threads, {threading.get_ident()})
+        self.assertNotIn(threading.get_ident(), analyzer.backend.threads)
+        self.assertEqual(np.argsort(scores).tolist(), np.argsort([len(t) for t in texts]).tolist())
+
+
+@unittest.skipUnless(installed('torch', 'transformers'), 'needs torch and transformers')
+class SentimentBackendParityTests(SimpleTestCase):
+    """int8 and ONNX backends must score close to the fp32 model (bench_recommend --suite backends has the full report)."""
+
+    MAX_DIFF = 0.1
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from .sentiment import SentimentAnalyzer
+
+        try:
+            cls.reference = SentimentAnalyzer(backend='torch').score_batch(PARITY_COMMENTS)
+        except OSError as e:  # model not downloadable / not cached
+            raise unittest.SkipTest(f"sentiment model unavailable: {e}")
+
+    def assert_parity(self, backend, **kwargs):
+        from .sentiment import SentimentAnalyzer
+
+        scores = SentimentAnalyzer(backend=backend, **kwargs).score_batch(PARITY_COMMENTS)
+        self.assertLessEqual(np.abs(scores - self.reference).max(), self.MAX_DIFF)
+        # Near-neutral comments may flip sign within MAX_DIFF; clear ones must not
+        polar = np.abs(self.reference) > self.MAX_DIFF
+        np.testing.assert_array_equal(np.sign(scores[polar]), np.sign(self.reference[polar]))
+
+    def test_int8_matches_fp32(self):
+        self.assert_parity('torch-int8')
+
+    @unittest.skipUnless(installed('onnxruntime'), 'needs onnxruntime')
+    def test_onnx_matches_fp32(self):
+        import tempfile
+
+        # Export to a scratch file, not SENTIMENT_ONNX_PATH inside the repo
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assert_parity('onnx', num_threads=1, backend_options={'path': os.path.join(tmp, 'model.onnx')})
+
+
+@unittest.skipUnless(MONGO_TEST_URL, 'set MONGO_TEST_URL to run against a real MongoDB')
+class TransitionConcurrencyTests(SimpleTestCase):
+    """Fires the same state transition from many threads at once and checks no update is lost."""
+
+    MECHANICS = 8
+    ROUNDS = 20
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        from . import views
+
+        cls.views = views
+        cls.saved_db = views.db
+        cls.client = MongoClient(MONGO_TEST_URL)
+        views.db = cls.client[MONGO_TEST_DB]
+        cls.requests = views.db.service_requests
+        cls.factory = RequestFactory()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.requests.drop()
+        cls.views.db = cls.saved_db
+        cls.client.close()
+        super().tearDownClass()
+
+    def new_request(self, **fields):
+        mech_ids = [str(ObjectId()) for _ in range(self.MECHANICS)]
+        doc = {'mechanics_list': [{'mech_id': m, 'status': 'pending'} for m in mech_ids],
+               'accepted_by': None, 'otp_code': '4321'}
+        doc.update(fields)
+        return str(self.requests.insert_one(doc).inserted_id), mech_ids
+
+    def race(self, view, bodies):
+        """Calls view once per body, all threads released together; returns the status codes."""
+        barrier = threading.Barrier(len(bodies))
+
+        def call(body):
+            request = self.factory.post('/', json.dumps(body), content_type='application/json')
+            barrier.wait()
+            return view(request).status_code
+
+        with ThreadPoolExecutor(len(bodies)) as pool:
+            return list(pool.map(call, bodies))
+
+    def test_concurrent_accepts_have_one_winner(self):
+        for _ in range(self.ROUNDS):
+            request_id, mech_ids = self.new_request()
+            codes = self.race(self.views.mechanic_accept_request,
+                              [{'request_id': request_id, 'mech_id': m} for m in mech_ids])
+            self.assertEqual(codes.count(200), 1)
+            self.assertEqual(codes.count(409), self.MECHANICS - 1)
+
+            doc = self.requests.find_one({'_id': ObjectId(request_id)})
+            winner = mech_ids[codes.index(200)]
+            self.assertEqual(doc['accepted_by'], winner)
+            statuses = {m['mech_id']: m['status'] for m in doc['mechanics_list']}
+            self.assertEqual(statuses.pop(winner), 'accepted')
+            self.assertEqual(set(statuses.values()), {'cancelled'})
+
+    def test_concurrent_rejects_are_not_lost(self):
+        for _ in range(self.ROUNDS):
+            request_id, mech_ids = self.new_request(expires_at=datetime.utcnow() + timedelta(minutes=5))
+            codes = self.race(self.views.mechanic_reject_request,
+                              [{'request_id': request_id, 'mech_id': m} for m in mech_ids])
+            self.assertEqual(codes, [200] * self.MECHANICS)
+
+            doc = self.requests.find_one({'_id': ObjectId(request_id)})
+            self.assertEqual({m['status'] for m in doc['mechanics_list']}, {'rejected'})
+            self.assertIn('cancelled_at', doc)
+            self.assertNotIn('expires_at', doc)
+
+    def test_concurrent_otp_submissions_complete_once(self):
+        for _ in range(self.ROUNDS):
+            request_id, mech_ids = self.new_request()
+            self.requests.update_one({'_id': ObjectId(request_id)},
+                                     {'$set': {'mechanics_list.0.status': 'accepted', 'accepted_by': mech_ids[0]}})
+            codes = self.race(self.views.verify_otp_and_complete,
+                              [{'request_id': request_id, 'worker_id': mech_ids[0], 'otp_code': '4321'}] * 4)
+            self.assertEqual(sorted(codes), [200, 400, 400, 400])
+
+            doc = self.requests.find_one({'_id': ObjectId(request_id)})
+            self.assertEqual(doc['mechanics_list'][0]['status'], 'completed')
+            self.assertEqual({m['status'] for m in doc['mechanics_list'][1:]}, {'pending'})
+
+
+@unittest.skipUnless(MONGO_TEST_URL, 'set MONGO_TEST_URL to run against a real MongoDB')
+class ExpirySweepTests(SimpleTestCase):
+    """cancel_expired cancels only overdue untouched requests, batch by batch, and counts each one once."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.client = MongoClient(MONGO_TEST_URL)
+        cls.db = cls.client[MONGO_TEST_DB]
+        cls.requests = cls.db.service_requests
+        cls.counters = cls.db[counters.COUNTERS_COLLECTION]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.requests.drop()
+        cls.counters.drop()
+        cls.client.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.requests.drop()
+        self.counters.drop()
+        # BSON dates keep milliseconds
+        now = datetime.utcnow()
+        self.now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        self.day = counters.day_key(self.now - timedelta(minutes=10))
+        self.mech_ids = [str(ObjectId()) for _ in range(3)]
+
+    def new_request(self, overdue, statuses=('pending', 'pending', 'pending')):
+        doc = {
+            'created_at': self.now - timedelta(minutes=10),
+            'expires_at': self.now - timedelta(seconds=1) if overdue else self.now + timedelta(minutes=5),
+            'mechanics_list': [{'mech_id': m, 'status': s} for m, s in zip(self.mech_ids, statuses)],
+            'accepted_by': None,
+        }
+        doc['_id'] = self.requests.insert_one(doc).inserted_id
+        counters.record(self.counters, counters.status_deltas(doc, {}, created=True))
+        return doc['_id']
+
+    def counter(self, mech_id):
+        return self.counters.find_one({'mech_id': mech_id, 'day': self.day})
+
+    def test_cancels_overdue_pending_requests_in_batches(self):
+        overdue = [self.new_request(overdue=True) for _ in range(5)]
+        acted_on = self.new_request(overdue=True, statuses=('accepted', 'pending', 'pending'))
+        waiting = self.new_request(overdue=False)
+
+        self.assertEqual(expiry.cancel_expired(self.requests, now=self.now, batch_size=2), 5)
+
+        for doc in self.requests.find({'_id': {'$in': overdue}}):
+            self.assertEqual({m['status'] for m in doc['mechanics_list']}, {'cancelled'})
+            self.assertEqual(doc['cancelled_at'], self.now)
+            self.assertNotIn('expires_at', doc)
+
+        doc = self.requests.find_one({'_id': acted_on})
+        self.assertEqual([m['status'] for m in doc['mechanics_list']], ['accepted', 'pending', 'pending'])
+        self.assertNotIn('cancelled_at', doc)
+        self.assertNotIn('expires_at', doc)
+
+        doc = self.requests.find_one({'_id': waiting})
+        self.assertEqual({m['status'] for m in doc['mechanics_list']}, {'pending'})
+        self.assertIn('expires_at', doc)
+
+        # Only the acted-on and the waiting request are still open work
+        for mech_id in self.mech_ids:
+            self.assertEqual((self.counter(mech_id)['cancelled'], self.counter(mech_id)['pending']), (5, 2))
+
+    def test_a_second_sweep_cancels_nothing(self):
+        for _ in range(3):
+            self.new_request(overdue=True)
+        sweeper = expiry.ExpirySweeper(self.requests, interval=0)
+
+        self.assertEqual(sweeper.sweep(), 3)
+        self.assertEqual(sweeper.sweep(), 0)
+        self.assertEqual(sweeper.cancelled, 3)
+        self.assertIsNotNone(sweeper.status()['swept_at'])
+        self.assertEqual(self.counter(self.mech_ids[2])['cancelled'], 3)
+
+
+@unittest.skipUnless(MONGO_TEST_URL, 'set MONGO_TEST_URL to run against a real MongoDB')
+class RebuildDailyCountersTests(SimpleTestCase):
+    """rebuild_daily_counters rewrites counters from the requests and never deletes live ones."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.client = MongoClient(MONGO_TEST_URL)
+        cls.db = cls.client[MONGO_TEST_DB]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.service_requests.drop()
+        cls.db[counters.COUNTERS_COLLECTION].drop()
+        cls.client.close()
+        super().tearDownClass()
+
+    def test_rebuild_keeps_counters_newer_than_the_rebuild(self):
+        from io import StringIO
+        from unittest import mock
+
+        from django.core.management import call_command
+
+        from .management.commands import rebuild_daily_counters
+
+        self.db.service_requests.drop()
+        target = self.db[counters.COUNTERS_COLLECTION]
+        target.drop()
+        yesterday = datetime.utcnow() - timedelta(days=1)
+        self.db.service_requests.insert_one({
+            'created_at': yesterday,
+            'mechanics_list': [{'mech_id': 'a', 'status': 'completed'}, {'mech_id': 'b', 'status': 'cancelled'}],
+        })
+        target.insert_many([
+            # Wrong numbers for a day that has requests
+            {'mech_id': 'a', 'day': counters.day_key(yesterday), 'total': 7, 'completed': 0},
+            # A day whose requests were deleted
+            {'mech_id': 'a', 'day': counters.day_key(yesterday - timedelta(days=3)), 'total': 2},
+            # A request created while the rebuild ran, counted by a live $inc upsert
+            {'mech_id': 'c', 'day': counters.day_key(None), 'total': 1, 'pending': 1},
+        ])
+
+        with mock.patch.object(rebuild_daily_counters, 'db', self.db):
+            call_command('rebuild_daily_counters', stdout=StringIO())
+
+        rows = {(d['mech_id'], d['day']): d for d in target.find({}, {'_id': 0})}
+        self.assertEqual(set(rows), {('a', counters.day_key(yesterday)), ('b', counters.day_key(yesterday)),
+                                     ('c', counters.day_key(None))})
+        self.assertEqual((rows['a', counters.day_key(yesterday)]['total'],
+                          rows['a', counters.day_key(yesterday)]['completed']), (1, 1))
+        self.assertEqual(rows['b', counters.day_key(yesterday)]['cancelled'], 1)
+        self.assertEqual(rows['c', counters.day_key(None)]['pending'], 1)
+
+
+def plan_stages(plan):
+    """Every stage name in an explain() plan tree, for classic and slot-based engines."""
+    if isinstance(plan, dict):
+        stages = [plan['stage']] if isinstance(plan.get('stage'), str) else []
+        return stages + [stage for value in plan.values() for stage in plan_stages(value)]
+    if isinstance(plan, list):
+        return [stage for value in plan for stage in plan_stages(value)]
+    return []
+
+
+@unittest.skipUnless(MONGO_TEST_URL, 'set MONGO_TEST_URL to run against a real MongoDB')
+class QueryPlanTests(SimpleTestCase):
+    """The hot service_requests queries must be answered from the registered indexes."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.client = MongoClient(MONGO_TEST_URL)
+        cls.db = cls.client[MONGO_TEST_DB]
+        cls.db.service_requests.drop()
+        ensure_indexes(cls.db)
+        mech_ids = [str(ObjectId()) for _ in range(20)]
+        statuses = ['pending', 'accepted', 'rejected', 'cancelled', 'completed']
+        now = datetime.utcnow()
+        cls.db.service_requests.insert_many([
+            {
+                'user_id': str(i % 50),
+                'created_at': now - timedelta(minutes=i),
+                'accepted_by': mech_ids[i % 20] if i % 3 else None,
+                'assigned_worker': {'worker_id': str(i % 7)} if i % 4 == 0 else None,
+                'worker_assigned_at': now - timedelta(minutes=i) if i % 4 == 0 else None,
+                'completed_at': now - timedelta(minutes=i) if i % 5 == 4 else None,
+                'mechanics_list': [{'mech_id': mech_ids[(i + j) % 20], 'status': statuses[(i + j) % 5]} for j in range(5)],
+            }
+            for i in range(2000)
+        ])
+        cls.mech_id = mech_ids[3]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.service_requests.drop()
+        cls.client.close()
+        super().tearDownClass()
+
+    def assertUsesIndex(self, query, sort):
+        explain = self.db.service_requests.find(query).sort(sort).explain()
+        stages = plan_stages(explain['queryPlanner']['winningPlan'])
+        self.assertNotIn('COLLSCAN', stages, f"{query} is not indexed: {stages}")
+        self.assertIn('IXSCAN', stages)
+
+    def test_pending_requests(self):
+        self.assertUsesIndex(*pending_requests_query(self.mech_id))
+        self.assertUsesIndex(*pending_requests_query())
+
+    def test_assigned_requests(self):
+        self.assertUsesIndex(*assigned_requests_query(mech_id=self.mech_id))
+        self.assertUsesIndex(*assigned_requests_query(worker_id='3'))
+
+    def test_user_active_request(self):
+        self.assertUsesIndex(*user_active_request_query('7'))
+
+    def test_mechanic_feeds(self):
+        after = (datetime.utcnow() - timedelta(minutes=100), ObjectId())
+        for completed in (False, True):
+            self.assertUsesIndex(*mechanic_feed_query(self.mech_id, completed=completed))
+            self.assertUsesIndex(*mechanic_feed_query(self.mech_id, completed=completed, after=after))
@@ -3,6 +3,8 @@ from . import views
 
 urlpatterns = [
     path('api/recommendations/', views.get_mechanics, name='get_mechanics'),
+    path('api/recommendations/status/', views.get_recommender_status, name='get_recommender_status'),
+    path('api/db/metrics/', views.get_db_metrics, name='get_db_metrics'),
     path('api/service-request/', views.create_service_request, name='create_service_request'),
     path('api/accept-request/', views.mechanic_accept_request, name='mechanic_accept_request'),
     path('api/pending-requests/', views.get_pending_requests, name='get_pending_requests'),
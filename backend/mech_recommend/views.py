@@ -1,29 +1,69 @@
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+import base64
 import json
 import traceback
 import random
+import secrets
 from datetime import datetime
-from threading import Timer
 from bson import ObjectId
-from pymongo import MongoClient
+from bson.errors import InvalidId
 import os
 from dotenv import load_dotenv
-import pandas as pd
 import jwt
 
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.cache import cache
 
+from backend import mongo
+
+from . import counters
+from .expiry import ExpirySweeper, expires_at
+from .indexes import (assigned_requests_query, mech_id_values, mechanic_feed_query, pending_requests_query,
+                      user_active_request_query)
 # Your recommendation import
-from .recommendation import get_top_mechanics
+from .recommendation import (RecommenderNotReady, fill_road_distances, get_top_mechanics, ranked_records,
+                             recommender)
 
 # Load env
 load_dotenv()
-MONGO_URL = os.getenv('MONGO_URL')
-MONGO_DB_NAME = os.getenv('MONGO_DB_NAME')
 
-client = MongoClient(MONGO_URL)
-db = client[MONGO_DB_NAME]
+# Shared, fork-safe connection pool (see backend/mongo.py)
+db = mongo.db
+
+# Cancels broadcast requests nobody accepted in time; started from wsgi/asgi (or the first request)
+expiry_sweeper = ExpirySweeper(mongo.collection('service_requests'))
+
+# "Load more" pages come from a ranked list kept in the cache behind an opaque
+# cursor. Any worker may serve the next page, so with more than one worker
+# process the cache must be shared (CACHE_REDIS_URL, see settings.py); with
+# the default per-process LocMemCache a cursor only works on its own worker.
+RANKING_SESSION_TTL = int(os.getenv('RANKING_SESSION_TTL', 600))
+RANKING_SESSION_DEPTH = int(os.getenv('RANKING_SESSION_DEPTH', 50))
+
+
+def _ranking_page(session, offset, limit):
+    """
+    Slices a page out of a ranking session. When the session runs out it is
+    ranked deeper, but only mechanics it has not listed yet are appended: a
+    deeper ranking can order things differently (another candidate set, or a
+    refreshed table), and the pages already sent must stay as they were.
+    """
+    end = offset + limit
+    if end > len(session['mechanics']) and not session['complete']:
+        deeper, session['complete'] = ranked_records(
+            session['lat'], session['lon'], session['breakdown_type'],
+            max(end, 2 * len(session['mechanics']), RANKING_SESSION_DEPTH),
+        )
+        # Rankings hold one mechanic per name (top_k_unique)
+        listed = {m['mech_name'] for m in session['mechanics']}
+        session['mechanics'] = session['mechanics'] + [m for m in deeper if m['mech_name'] not in listed]
+    mechanics = session['mechanics']
+    road = fill_road_distances(session['lat'], session['lon'], mechanics, session['road'], offset, end)
+    page = [dict(m, road_distance_km=road[(m['mech_lat'], m['mech_long'])]) for m in mechanics[offset:end]]
+    has_more = end < len(mechanics) or not session['complete']
+    return page, has_more
 
 # -----------------------------
 # API: Get mechanics
@@ -36,9 +76,20 @@ def get_mechanics(request):
             lat = data.get("lat")
             lon = data.get("lon")
             breakdown_type = data.get("breakdown_type", "engine")
-            offset = int(data.get("offset", 0))
-            limit = int(data.get("limit", 5))
-            
+            offset = max(int(data.get("offset", 0)), 0)
+            limit = min(max(int(data.get("limit", 5)), 1), RANKING_SESSION_DEPTH)
+            cursor = data.get("cursor")
+
+            # Later pages: read the next slice of the ranked session, no rescoring
+            if cursor:
+                session = cache.get(f"ranking_{cursor}")
+                if session is None:
+                    return JsonResponse({'status': 'error', 'message': 'Cursor expired, request the first page again'}, status=410)
+                mechanic_list, has_more = _ranking_page(session, session['next'], limit)
+                session['next'] += limit
+                cache.set(f"ranking_{cursor}", session, timeout=RANKING_SESSION_TTL)
+                return JsonResponse({'status': 'success', 'mechanics': mechanic_list, 'cursor': cursor, 'has_more': has_more})
+
             if lat is None or lon is None:
                 return JsonResponse({'status': 'error', 'message': 'Latitude and longitude are required'}, status=400)
 
@@ -48,16 +99,28 @@ def get_mechanics(request):
             except (ValueError, TypeError):
                 return JsonResponse({'status': 'error', 'message': 'Invalid latitude or longitude values'}, status=400)
 
-            mechanics_df = get_top_mechanics(lat, lon, breakdown_type, offset, limit)
-
-            if mechanics_df.empty:
-                return JsonResponse({'status': 'success', 'mechanics': []})
+            # First page: rank once and keep the list for the cursor. Offset pages
+            # (clients without cursor support) are ranked on the spot and not kept.
+            mechanics, complete = ranked_records(lat, lon, breakdown_type, max(RANKING_SESSION_DEPTH, offset + limit))
+            session = {
+                'lat': lat,
+                'lon': lon,
+                'breakdown_type': breakdown_type,
+                'mechanics': mechanics,
+                'complete': complete,
+                'road': {},  # (mech_lat, mech_long) -> road distance km, carried across pages
+                'next': offset + limit,
+            }
+            mechanic_list, has_more = _ranking_page(session, offset, limit)
+            cursor = None
+            if offset == 0:
+                cursor = secrets.token_urlsafe(16)
+                cache.set(f"ranking_{cursor}", session, timeout=RANKING_SESSION_TTL)
 
-            mechanics_df = mechanics_df.where(pd.notnull(mechanics_df), None)
-            mechanic_list = mechanics_df.to_dict(orient='records')
+            return JsonResponse({'status': 'success', 'mechanics': mechanic_list, 'cursor': cursor, 'has_more': has_more})
 
-            return JsonResponse({'status': 'success', 'mechanics': mechanic_list})
-            
+        except RecommenderNotReady as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=503)
         except Exception as e:
             return JsonResponse({'status': 'error', 'message': str(e), 'details': traceback.format_exc()}, status=500)
 
@@ -65,7 +128,26 @@ def get_mechanics(request):
 
 
 # -----------------------------
-# API: Create service request (auto-cancel in 60s)
+# API: Recommender readiness
+# -----------------------------
+def get_recommender_status(request):
+    if request.method == 'GET':
+        return JsonResponse({'status': 'success', 'recommender': recommender.status()})
+    return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=405)
+
+
+def get_db_metrics(request):
+    # Per-process: each worker has its own pool, so poll a few to size MONGO_MAX_POOL_SIZE.
+    # Command names and traffic are internal: staff only (log in at /admin/ first).
+    if request.method == 'GET':
+        if not request.user.is_staff:
+            return JsonResponse({'status': 'error', 'message': 'Staff login required'}, status=403)
+        return JsonResponse({'status': 'success', 'pid': os.getpid(), 'mongo': mongo.metrics.snapshot()})
+    return JsonResponse({'status': 'error', 'message': 'Invalid method'}, status=405)
+
+
+# -----------------------------
+# API: Create service request (auto-cancel after REQUEST_EXPIRY_SECONDS)
 # -----------------------------
 @csrf_exempt
 def create_service_request(request):
@@ -112,6 +194,7 @@ def create_service_request(request):
 
                 # Generate unique OTP for this request
                 otp_code = str(random.randint(1000, 9999))
+                created_at = datetime.utcnow()
                 
                 req_id = db.service_requests.insert_one({
                     "user_id": user_id,
@@ -122,7 +205,7 @@ def create_service_request(request):
                     "breakdown_type": breakdown_type,
                     "mechanics_list": mechanic_list,
                     "direct_request": True,
-                    "created_at": datetime.utcnow(),
+                    "created_at": created_at,
                     "accepted_by": None,
                     "car_model": data.get("car_model"),
                     "year": data.get("year"),
@@ -132,6 +215,8 @@ def create_service_request(request):
                     "image_url": data.get("image_url"),
                     "otp_code": otp_code,  # Store the OTP
                 }).inserted_id
+                counters.record(db[counters.COUNTERS_COLLECTION], counters.status_deltas(
+                    {"created_at": created_at, "mechanics_list": mechanic_list}, {}, created=True))
 
                 return JsonResponse({"status": "success", "request_id": str(req_id)})
 
@@ -143,9 +228,7 @@ def create_service_request(request):
                     user_phone = user_doc.get("phone", "N/A")
 
             # Get mechanics with distances
-            mechanics_df = get_top_mechanics(lat, lon, breakdown_type, 0, 5)
-            mechanics_df = mechanics_df.where(pd.notnull(mechanics_df), None)
-            mechanic_list = mechanics_df.to_dict(orient='records')
+            mechanic_list = get_top_mechanics(lat, lon, breakdown_type, 0, 5)
 
             for m in mechanic_list:
                 mech_doc = db.auth_mech.find_one({"garage_name": m["mech_name"]}, {"_id": 1})
@@ -154,6 +237,7 @@ def create_service_request(request):
 
             # Generate unique OTP for this request
             otp_code = str(random.randint(1000, 9999))
+            created_at = datetime.utcnow()
             
             req_id = db.service_requests.insert_one({
                 "user_id": user_id,
@@ -163,7 +247,8 @@ def create_service_request(request):
                 "lon": lon,
                 "breakdown_type": breakdown_type,
                 "mechanics_list": mechanic_list,
-                "created_at": datetime.utcnow(),
+                "created_at": created_at,
+                "expires_at": expires_at(created_at),  # picked up by expiry_sweeper
                 "accepted_by": None,
                 "car_model": data.get("car_model"),
                 "year": data.get("year"),
@@ -174,25 +259,16 @@ def create_service_request(request):
                 "otp_code": otp_code,  # Store the OTP
             }).inserted_id
 
-            # Auto-cancel after 60s
-            def cancel_if_unaccepted(request_id):
-                req = db.service_requests.find_one({"_id": ObjectId(request_id)})
-                if req:
-                    all_pending = all(m.get("status") == "pending" for m in req.get("mechanics_list", []))
-                    if all_pending:
-                        updated_list = []
-                        for m in req.get("mechanics_list", []):
-                            m["status"] = "cancelled"
-                            updated_list.append(m)
-                        db.service_requests.update_one(
-                            {"_id": ObjectId(request_id)},
-                            {"$set": {"mechanics_list": updated_list, "cancelled_at": datetime.utcnow()}}
-                        )
+            counters.record(db[counters.COUNTERS_COLLECTION], counters.status_deltas(
+                {"created_at": created_at, "mechanics_list": mechanic_list}, {}, created=True))
 
-            Timer(120, cancel_if_unaccepted, args=[str(req_id)]).start()
+            # No-op once running; covers processes started without wsgi/asgi
+            expiry_sweeper.start()
 
             return JsonResponse({"status": "success", "request_id": str(req_id)})
 
+        except RecommenderNotReady as e:
+            return JsonResponse({"status": "error", "message": str(e)}, status=503)
         except Exception as e:
             return JsonResponse({"status": "error", "message": str(e)}, status=500)
 
@@ -214,28 +290,41 @@ def mechanic_accept_request(request):
             if not request_id or not mech_id:
                 return JsonResponse({"status": "error", "message": "Missing request_id or mech_id"}, status=400)
 
-            req = db.service_requests.find_one({"_id": ObjectId(request_id)})
-            if not req:
-                return JsonResponse({"status": "error", "message": "Request not found"}, status=404)
-
-            updated_list = []
-            for m in req.get("mechanics_list", []):
-                if str(m.get("mech_id")) == str(mech_id):
-                    m["status"] = "accepted"
-                else:
-                    if m.get("status") == "pending":
-                        m["status"] = "cancelled"
-                updated_list.append(m)
-
-            db.service_requests.update_one(
-                {"_id": ObjectId(request_id)},
-                {"$set": {
-                    "mechanics_list": updated_list,
-                    "accepted_by": str(mech_id),
-                    "accepted_at": datetime.utcnow()
-                }}
+            # One conditional write: only a mechanic still pending on an unaccepted request
+            # wins, so concurrent accepts cannot overwrite each other
+            before = db.service_requests.find_one_and_update(
+                {
+                    "_id": ObjectId(request_id),
+                    "accepted_by": None,
+                    "mechanics_list": {"$elemMatch": {"mech_id": {"$in": mech_id_values(mech_id)}, "status": "pending"}},
+                },
+                {
+                    "$set": {
+                        "mechanics_list.$[me].status": "accepted",
+                        "mechanics_list.$[other].status": "cancelled",
+                        "accepted_by": str(mech_id),
+                        "accepted_at": datetime.utcnow(),
+                    },
+                    "$unset": {"expires_at": ""},
+                },
+                array_filters=[
+                    {"me.mech_id": {"$in": mech_id_values(mech_id)}},
+                    {"other.mech_id": {"$nin": mech_id_values(mech_id)}, "other.status": "pending"},
+                ],
+                projection=counters.TRANSITION_FIELDS,
             )
 
+            if before is None:
+                req = db.service_requests.find_one({"_id": ObjectId(request_id)}, {"accepted_by": 1})
+                if not req:
+                    return JsonResponse({"status": "error", "message": "Request not found"}, status=404)
+                if req.get("accepted_by") and str(req["accepted_by"]) != str(mech_id):
+                    return JsonResponse({"status": "error", "message": "Request already accepted by another mechanic"}, status=409)
+                return JsonResponse({"status": "error", "message": "Request is no longer pending for this mechanic"}, status=409)
+
+            counters.record(db[counters.COUNTERS_COLLECTION],
+                            counters.transition(before, mech_id, "accepted", cancel_pending=True))
+
             db.auth_mech.update_one(
                 {"_id": ObjectId(mech_id)},
                 {"$push": {"user_history": user_details}}
@@ -345,60 +434,76 @@ def get_mechanics_list(request):
 # -----------------------------
 # API: Get pending requests
 # -----------------------------
+# Newest first, offset/limit paged; has_more tells the app to fetch the next
+# page, so a request past the first page is never silently left out
+PENDING_REQUESTS_LIMIT = int(os.getenv('PENDING_REQUESTS_LIMIT', 50))
+PENDING_REQUESTS_MAX_LIMIT = 200
+
+# Fields the request cards render; everything else stays in Mongo
+PENDING_REQUEST_FIELDS = [
+    "user_id", "breakdown_type", "created_at", "car_model", "year", "license_plate",
+    "description", "issue_type", "image_url", "direct_request", "lat", "lon", "accepted_by", "otp_code",
+]
+
+
+def _pending_requests_pipeline(mech_id, offset, limit):
+    query, sort = pending_requests_query(mech_id)
+    missing_name = {"$in": [{"$ifNull": ["$user_name", ""]}, ["", "Unknown User"]]}
+    return [
+        {"$match": query},
+        {"$sort": dict(sort)},
+        {"$skip": offset},
+        {"$limit": limit},
+        # user_id is a string; a malformed one joins nothing instead of failing the page
+        {"$lookup": {
+            "from": "auth_users",
+            "let": {"user_oid": {"$cond": [
+                missing_name,
+                {"$convert": {"input": "$user_id", "to": "objectId", "onError": None, "onNull": None}},
+                None,
+            ]}},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$_id", "$$user_oid"]}}},
+                {"$project": {"_id": 0, "username": 1, "phone": 1}},
+            ],
+            "as": "user",
+        }},
+        {"$set": {"user": {"$arrayElemAt": ["$user", 0]}}},
+        {"$project": {
+            **{field: 1 for field in PENDING_REQUEST_FIELDS},
+            "_id": {"$toString": "$_id"},
+            "user_name": {"$cond": [{"$eq": [{"$type": "$user"}, "missing"]},
+                                    "$user_name", {"$ifNull": ["$user.username", "Unknown User"]}]},
+            "user_phone": {"$cond": [{"$eq": [{"$type": "$user"}, "missing"]},
+                                     "$user_phone", {"$ifNull": ["$user.phone", "N/A"]}]},
+            "mechanics_list": {"$map": {"input": {"$ifNull": ["$mechanics_list", []]}, "as": "m", "in": {
+                "mech_id": {"$toString": "$$m.mech_id"},
+                "mech_name": "$$m.mech_name",
+                "mech_phone": "$$m.mech_phone",
+                "status": "$$m.status",
+                "road_distance_km": {"$cond": [
+                    {"$eq": [{"$ifNull": ["$$m.road_distance_km", None]}, None]},
+                    "$$m.road_distance_km",
+                    {"$round": [{"$toDouble": "$$m.road_distance_km"}, 2]},
+                ]},
+            }}},
+        }},
+    ]
+
+
 @csrf_exempt
 def get_pending_requests(request):
     if request.method == "GET":
         try:
             mech_id = request.GET.get("mech_id")
-            query = {}
+            offset = max(int(request.GET.get("offset", 0)), 0)
+            limit = min(max(int(request.GET.get("limit", PENDING_REQUESTS_LIMIT)), 1), PENDING_REQUESTS_MAX_LIMIT)
 
-            pending = list(db.service_requests.find(
-                query,
-                {
-                    "_id": 1, "user_id": 1, "user_name": 1, "user_phone": 1,
-                    "breakdown_type": 1, "mechanics_list": 1, "created_at": 1,
-                    "car_model": 1, "year": 1, "license_plate": 1,
-                    "description": 1, "issue_type": 1, "image_url": 1,
-                    "direct_request": 1, "lat": 1, "lon": 1,
-                    "accepted_by": 1, "otp_code": 1  # Add OTP to projection
-                }
-            ))
-
-            results = []
-            for req in pending:
-                req["_id"] = str(req["_id"])
-
-                if (not req.get("user_name") or req["user_name"] == "Unknown User") and req.get("user_id"):
-                    user_doc = db.auth_users.find_one({"_id": ObjectId(req["user_id"])}, {"username": 1, "phone": 1})
-                    if user_doc:
-                        req["user_name"] = user_doc.get("username", "Unknown User")
-                        req["user_phone"] = user_doc.get("phone", "N/A")
-
-                mech_list = []
-                for mech in req.get("mechanics_list", []):
-                    if isinstance(mech.get("mech_id"), ObjectId):
-                        mech["mech_id"] = str(mech["mech_id"])
-                    if "road_distance_km" in mech and mech["road_distance_km"] is not None:
-                        mech["road_distance_km"] = round(float(mech["road_distance_km"]), 2)
-                    mech_list.append(mech)
-
-                req["mechanics_list"] = mech_list
-
-                if mech_id:
-                    found = next((m for m in mech_list if str(m.get("mech_id")) == str(mech_id)), None)
-                    if not found or found.get("status") != "pending":
-                        continue
-                    # Also check if this mechanic has already completed this request
-                    if found.get("status") == "completed":
-                        continue
-                else:
-                    has_pending = any(m.get("status") == "pending" for m in mech_list)
-                    if not has_pending:
-                        continue
-
-                results.append(req)
-
-            return JsonResponse({"status": "success", "requests": results})
+            # One page, one round-trip: the match runs on the mechanic_status index, and
+            # names are joined only for the page's requests that are missing them
+            page = list(db.service_requests.aggregate(_pending_requests_pipeline(mech_id, offset, limit + 1)))
+
+            return JsonResponse({"status": "success", "requests": page[:limit], "has_more": len(page) > limit})
 
         except Exception as e:
             return JsonResponse({"status": "error", "message": str(e)}, status=500)
@@ -420,45 +525,42 @@ def mechanic_reject_request(request):
             if not request_id or not mech_id:
                 return JsonResponse({"status": "error", "message": "Missing request_id or mech_id"}, status=400)
 
-            req = db.service_requests.find_one({"_id": ObjectId(request_id)})
-            if not req:
-                return JsonResponse({"status": "error", "message": "Request not found"}, status=404)
+            # Flip only this mechanic's entry, and only while it is still pending
+            req = db.service_requests.find_one_and_update(
+                {
+                    "_id": ObjectId(request_id),
+                    "mechanics_list": {"$elemMatch": {"mech_id": {"$in": mech_id_values(mech_id)}, "status": "pending"}},
+                },
+                {"$set": {
+                    "mechanics_list.$.status": "rejected",
+                    "rejected_by": mech_id,
+                    "rejected_at": datetime.utcnow(),
+                }},
+                projection={"direct_request": 1, **counters.TRANSITION_FIELDS},
+            )
+
+            if req is None:
+                if not db.service_requests.find_one({"_id": ObjectId(request_id)}, {"_id": 1}):
+                    return JsonResponse({"status": "error", "message": "Request not found"}, status=404)
+                return JsonResponse({"status": "error", "message": "Request is no longer pending for this mechanic"}, status=409)
+
+            counters.record(db[counters.COUNTERS_COLLECTION], counters.transition(req, mech_id, "rejected"))
 
             # Direct request: reject closes request
             if req.get("direct_request", False):
-                updated_list = []
-                for mech in req.get("mechanics_list", []):
-                    if str(mech.get("mech_id")) == str(mech_id):
-                        mech["status"] = "rejected"
-                    updated_list.append(mech)
-                db.service_requests.update_one(
-                    {"_id": ObjectId(request_id)},
-                    {"$set": {"mechanics_list": updated_list, "rejected_by": mech_id, "rejected_at": datetime.utcnow()}}
-                )
                 return JsonResponse({"status": "success", "message": "Direct request rejected"})
 
-            # Broadcast: update mechanic’s status
-            updated_list = []
-            all_rejected = True
-            for mech in req.get("mechanics_list", []):
-                if str(mech.get("mech_id")) == str(mech_id):
-                    mech["status"] = "rejected"
-                if mech.get("status") == "pending":
-                    all_rejected = False
-                updated_list.append(mech)
-
-            update_data = {"mechanics_list": updated_list}
-            if all_rejected:
-                for m in updated_list:
-                    if m.get("status") == "pending":
-                        m["status"] = "cancelled"
-                update_data["mechanics_list"] = updated_list
-                update_data["cancelled_at"] = datetime.utcnow()
-
-            db.service_requests.update_one(
-                {"_id": ObjectId(request_id)},
-                {"$set": update_data}
+            # Broadcast: the last rejection cancels the request. Guarded on "nothing
+            # pending" and "not yet cancelled", so concurrent last rejections cancel once.
+            others_pending = any(
+                m.get("status") == "pending" and str(m.get("mech_id")) != str(mech_id)
+                for m in req.get("mechanics_list", [])
             )
+            if not others_pending:
+                db.service_requests.update_one(
+                    {"_id": req["_id"], "mechanics_list.status": {"$ne": "pending"}, "cancelled_at": {"$exists": False}},
+                    {"$set": {"cancelled_at": datetime.utcnow()}, "$unset": {"expires_at": ""}},
+                )
 
             return JsonResponse({"status": "success", "message": "Mechanic rejected request"})
 
@@ -568,31 +670,47 @@ def assign_worker(request):
             "garage_coords": garage.get("coords", {}),
         }
 
-        req = db.service_requests.find_one({"_id": ObjectId(req_id)})
-        if not req:
-            return JsonResponse({"error": "Service request not found"}, status=404)
-
-        updated_list = []
-        for m in req.get("mechanics_list", []):
-            if str(m.get("mech_id")) == str(garage.get("_id")):
-                m["status"] = "accepted"
-            else:
-                if m.get("status") == "pending":
-                    m["status"] = "cancelled"
-            updated_list.append(m)
+        garage_id = str(garage.get("_id"))
 
-        result = db.service_requests.update_one(
-            {"_id": ObjectId(req_id)},
-            {"$set": {
-                "assigned_worker": assigned_worker,
-                "worker_assigned_at": datetime.utcnow(),
-                "mechanics_list": updated_list,
-                "accepted_by": str(garage.get("_id"))
-            }}
+        # The garage must still be pending or already accepted on a request no other
+        # garage holds; its entry becomes accepted and the remaining pending ones cancelled
+        req = db.service_requests.find_one_and_update(
+            {
+                "_id": ObjectId(req_id),
+                "accepted_by": {"$in": [None, garage_id]},
+                "mechanics_list": {"$elemMatch": {
+                    "mech_id": {"$in": mech_id_values(garage_id)},
+                    "status": {"$in": ["pending", "accepted"]},
+                }},
+            },
+            {
+                "$set": {
+                    "assigned_worker": assigned_worker,
+                    "worker_assigned_at": datetime.utcnow(),
+                    "mechanics_list.$[me].status": "accepted",
+                    "mechanics_list.$[other].status": "cancelled",
+                    "accepted_by": garage_id,
+                },
+                "$unset": {"expires_at": ""},
+            },
+            array_filters=[
+                {"me.mech_id": {"$in": mech_id_values(garage_id)}},
+                {"other.mech_id": {"$nin": mech_id_values(garage_id)}, "other.status": "pending"},
+            ],
+            projection={"user_id": 1, "user_name": 1, "user_phone": 1, "breakdown_type": 1,
+                        **counters.TRANSITION_FIELDS},
         )
 
-        if result.matched_count == 0:
-            return JsonResponse({"error": "Service request not found"}, status=404)
+        if req is None:
+            existing = db.service_requests.find_one({"_id": ObjectId(req_id)}, {"accepted_by": 1})
+            if not existing:
+                return JsonResponse({"error": "Service request not found"}, status=404)
+            if existing.get("accepted_by") and str(existing["accepted_by"]) != garage_id:
+                return JsonResponse({"error": "Request already accepted by another mechanic"}, status=409)
+            return JsonResponse({"error": "Request is no longer open for this garage"}, status=409)
+
+        counters.record(db[counters.COUNTERS_COLLECTION],
+                        counters.transition(req, garage_id, "accepted", cancel_pending=True))
 
         # ✅ Append to mechanic's user history for reporting/audit
         try:
@@ -627,25 +745,11 @@ def get_assigned_requests(request):
             if not mech_id and not worker_id:
                 return JsonResponse({"status": "error", "message": "mech_id or worker_id required"}, status=400)
 
-            query = {}
-            if mech_id:
-                query["accepted_by"] = str(mech_id)
-            if worker_id:
-                query["assigned_worker.worker_id"] = str(worker_id)
-
-            docs = list(db.service_requests.find(query).sort("worker_assigned_at", -1))
+            # Requests this mechanic already completed are excluded by the query
+            query, sort = assigned_requests_query(mech_id, worker_id)
+            docs = list(db.service_requests.find(query).sort(sort))
             out = []
             for d in docs:
-                # Filter out requests where this mechanic's status is completed
-                if mech_id:
-                    mech_completed = False
-                    for mech in d.get('mechanics_list', []):
-                        if str(mech.get('mech_id')) == str(mech_id) and mech.get('status') == 'completed':
-                            mech_completed = True
-                            break
-                    if mech_completed:
-                        continue
-                
                 out.append({
                     "id": str(d["_id"]),
                     "_id": str(d["_id"]),  # Add _id for consistency
@@ -676,26 +780,17 @@ def get_user_active_request(request):
             if not user_id:
                 return JsonResponse({"status": "error", "message": "user_id required"}, status=400)
 
-            query = {"user_id": str(user_id)}
-            docs = list(db.service_requests.find(query).sort("created_at", -1))
-
-            for d in docs:
-                # Active if not completed and either assigned_worker exists or any mechanic accepted/assigned
-                # Check if any mechanic has completed this request
-                any_completed = any(m.get("status") == "completed" for m in d.get("mechanics_list", []))
-                if any_completed:
-                    continue
-                    
-                has_assigned_worker = bool(d.get("assigned_worker"))
-                has_accepted = any(m.get("status") in ["accepted", "assigned"] for m in d.get("mechanics_list", []))
-                if (has_assigned_worker or has_accepted):
-                    d["_id"] = str(d["_id"])
-                    if d.get("user_id"):
-                        d["user_id"] = str(d["user_id"])
-                    for m in d.get("mechanics_list", []):
-                        if isinstance(m.get("mech_id"), ObjectId):
-                            m["mech_id"] = str(m["mech_id"])
-                    return JsonResponse({"status": "success", "request": d})
+            # Newest request someone has taken on (assigned worker or accepted) and nobody completed
+            query, sort = user_active_request_query(user_id)
+            d = db.service_requests.find_one(query, sort=sort)
+            if d:
+                d["_id"] = str(d["_id"])
+                if d.get("user_id"):
+                    d["user_id"] = str(d["user_id"])
+                for m in d.get("mechanics_list", []):
+                    if isinstance(m.get("mech_id"), ObjectId):
+                        m["mech_id"] = str(m["mech_id"])
+                return JsonResponse({"status": "success", "request": d})
 
             return JsonResponse({"status": "success", "request": None})
         except Exception as e:
@@ -721,99 +816,67 @@ def verify_otp_and_complete(request):
         if not all([request_id, otp_code, worker_id]):
             return JsonResponse({'error': 'request_id, otp_code, and worker_id required'}, status=400)
         
-        # Find the request
-        req = db.service_requests.find_one({"_id": ObjectId(request_id)})
-        print(f"📄 Found request: {req}")
-        
-        if not req:
-            print(f"❌ Request {request_id} not found in database")
-            return JsonResponse({'error': 'Request not found'}, status=404)
-        
-        print(f"🔍 Request details:")
-        print(f"   _id: {req.get('_id')}")
-        print(f"   user_id: {req.get('user_id')}")
-        print(f"   status: {req.get('status')}")
-        print(f"   assigned_worker: {req.get('assigned_worker')}")
-        print(f"   mechanics_list: {req.get('mechanics_list')}")
-        print(f"   otp_code: {req.get('otp_code')}")
-        
-        # Verify the request is assigned to this worker
-        # Check if worker is either in assigned_worker or in mechanics_list with accepted status
-        worker_authorized = False
-        
-        # Check assigned_worker field
-        if req.get('assigned_worker') and str(req['assigned_worker'].get('worker_id')) == str(worker_id):
-            worker_authorized = True
-        
-        # Check mechanics_list for accepted status
-        if not worker_authorized and req.get('mechanics_list'):
-            for mech in req['mechanics_list']:
-                if str(mech.get('mech_id')) == str(worker_id) and mech.get('status') in ['accepted', 'assigned']:
-                    worker_authorized = True
-                    break
-        
-        if not worker_authorized:
-            print(f"❌ Worker {worker_id} not authorized for request {request_id}")
-            print(f"   assigned_worker: {req.get('assigned_worker')}")
-            print(f"   mechanics_list: {req.get('mechanics_list')}")
-            return JsonResponse({'error': 'Worker not authorized for this request'}, status=403)
-        
-        # Check if request is already completed by this mechanic
-        if req.get('mechanics_list'):
-            for mech in req['mechanics_list']:
-                if str(mech.get('mech_id')) == str(worker_id) and mech.get('status') == 'completed':
-                    return JsonResponse({'error': 'Request already completed by this mechanic'}, status=400)
-        
-        # Verify OTP against stored value
-        stored_otp = req.get('otp_code')
-        if not stored_otp:
-            return JsonResponse({'error': 'No OTP found for this request'}, status=400)
-        
-        if not otp_code or len(otp_code) != 4 or not otp_code.isdigit():
+        if len(otp_code) != 4 or not otp_code.isdigit():
             return JsonResponse({'error': 'Invalid OTP format'}, status=400)
-        
-        if otp_code != stored_otp:
-            return JsonResponse({'error': 'Invalid OTP code'}, status=400)
-        
-        print(f"✅ OTP verified, updating request {request_id} to completed")
-        
-        # Mark request as completed by updating the specific mechanic's status
-        # Find the mechanic in mechanics_list and update their status
-        updated_mechanics_list = []
-        mechanic_updated = False
-        
-        for mech in req.get('mechanics_list', []):
-            if str(mech.get('mech_id')) == str(worker_id):
-                mech['status'] = 'completed'
-                mechanic_updated = True
-            updated_mechanics_list.append(mech)
-        
-        if not mechanic_updated:
-            return JsonResponse({'error': 'Mechanic not found in mechanics list'}, status=500)
-        
-        # Update the request with completed mechanic status and completion details
-        result = db.service_requests.update_one(
-            {"_id": ObjectId(request_id)},
+
+        # Authorization, OTP match and "not completed yet" are all part of the filter,
+        # so two submissions of the same OTP cannot both complete the request
+        worker_ids = mech_id_values(worker_id)
+        before = db.service_requests.find_one_and_update(
             {
-                "$set": {
-                    "mechanics_list": updated_mechanics_list,
-                    "completed_at": datetime.utcnow(),
-                    "otp_verified": True,
-                    "otp_code_used": otp_code
-                }
-            }
+                "_id": ObjectId(request_id),
+                "otp_code": otp_code,
+                "$or": [
+                    # Assigned worker: completes its entry in mechanics_list
+                    {
+                        "assigned_worker.worker_id": str(worker_id),
+                        "mechanics_list": {"$elemMatch": {"mech_id": {"$in": worker_ids}, "status": {"$ne": "completed"}}},
+                    },
+                    # Mechanic that accepted the request itself
+                    {"mechanics_list": {"$elemMatch": {"mech_id": {"$in": worker_ids}, "status": {"$in": ["accepted", "assigned"]}}}},
+                ],
+            },
+            {"$set": {
+                "mechanics_list.$[me].status": "completed",
+                "completed_at": datetime.utcnow(),
+                "otp_verified": True,
+                "otp_code_used": otp_code,
+            }},
+            array_filters=[{"me.mech_id": {"$in": worker_ids}}],
+            projection=counters.TRANSITION_FIELDS,
         )
-        
-        print(f"📝 Update result: {result.modified_count} documents modified")
-        
-        if result.modified_count > 0:
+
+        if before is not None:
+            print(f"✅ OTP verified, request {request_id} completed")
+            counters.record(db[counters.COUNTERS_COLLECTION], counters.transition(before, worker_id, "completed"))
             return JsonResponse({
                 "status": "success", 
                 "message": "Request completed successfully",
                 "request_id": request_id
             })
-        else:
-            return JsonResponse({'error': 'Failed to update request'}, status=500)
+
+        # Only a refused update reads the request back, to say why
+        req = db.service_requests.find_one(
+            {"_id": ObjectId(request_id)}, {"assigned_worker": 1, "mechanics_list": 1, "otp_code": 1}
+        )
+        if not req:
+            print(f"❌ Request {request_id} not found in database")
+            return JsonResponse({'error': 'Request not found'}, status=404)
+
+        entries = [m for m in req.get('mechanics_list', []) if str(m.get('mech_id')) == str(worker_id)]
+        is_assigned_worker = bool(req.get('assigned_worker')) and str(req['assigned_worker'].get('worker_id')) == str(worker_id)
+        if not is_assigned_worker and not any(m.get('status') in ['accepted', 'assigned', 'completed'] for m in entries):
+            print(f"❌ Worker {worker_id} not authorized for request {request_id}")
+            return JsonResponse({'error': 'Worker not authorized for this request'}, status=403)
+        if any(m.get('status') == 'completed' for m in entries):
+            return JsonResponse({'error': 'Request already completed by this mechanic'}, status=400)
+        if not req.get('otp_code'):
+            return JsonResponse({'error': 'No OTP found for this request'}, status=400)
+        if otp_code != req['otp_code']:
+            return JsonResponse({'error': 'Invalid OTP code'}, status=400)
+        if not entries:
+            return JsonResponse({'error': 'Mechanic not found in mechanics list'}, status=500)
+        return JsonResponse({'error': 'Failed to update request'}, status=500)
             
     except Exception as e:
         print(f"❌ Error in OTP verification: {str(e)}")
@@ -860,7 +923,7 @@ def get_today_overview(request):
         # db is already defined at the top of the file
         
         # Get mechanic by username to get their ID
-        mechanic = db['auth_mech'].find_one({'username': username})
+        mechanic = db['auth_mech'].find_one({'username': username}, {'_id': 1})
         if not mechanic:
             print(f"❌ [get_today_overview] Mechanic not found with username: {username}")
             return JsonResponse({'error': 'Mechanic not found'}, status=404)
@@ -868,39 +931,15 @@ def get_today_overview(request):
         mechanic_id = str(mechanic['_id'])
         print(f"🔍 [get_today_overview] Found mechanic ID: {mechanic_id}")
         
-        # Get today's date range
-        from datetime import datetime, timezone
-        today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-        today_end = today_start.replace(hour=23, minute=59, second=59, microsecond=999999)
-        
-        # Get service requests created today
-        today_requests = list(db['service_requests'].find({
-            'created_at': {
-                '$gte': today_start,
-                '$lte': today_end
-            }
-        }))
-        
-        # Calculate overview stats
-        total = len(today_requests)
-        completed = 0
-        pending = 0
-        
-        for request in today_requests:
-            # Check mechanics_list for status
-            if 'mechanics_list' in request:
-                for mechanic in request['mechanics_list']:
-                    if mechanic.get('status') == 'completed':
-                        completed += 1
-                        break
-                    elif mechanic.get('status') in ['pending', 'accepted']:
-                        pending += 1
-                        break
-        
+        # Today's counts for this mechanic, maintained as requests change state (see counters.py)
+        counts = db[counters.COUNTERS_COLLECTION].find_one(
+            {'mech_id': mechanic_id, 'day': counters.day_key(datetime.utcnow())},
+            {'_id': 0, 'total': 1, 'pending': 1, 'completed': 1},
+        ) or {}
         overview = {
-            'total': total,
-            'pending': pending,
-            'completed': completed
+            'total': counts.get('total', 0),
+            'pending': counts.get('pending', 0),
+            'completed': counts.get('completed', 0)
         }
 
         print(f"📊 [get_today_overview] Today's stats: {overview}")
@@ -914,6 +953,79 @@ def get_today_overview(request):
         print(f"❌ [get_today_overview] Error: {str(e)}")
         return JsonResponse({'error': str(e)}, status=500)
 
+# -----------------------------
+# Mechanic request feeds
+# -----------------------------
+# get_recent_requests / get_completed_requests page through the caller's requests
+# newest first. The cursor is the (created_at, _id) of the last request sent, so a
+# page costs the same however much history there is.
+FEED_PAGE_SIZE = int(os.getenv('FEED_PAGE_SIZE', 20))
+FEED_MAX_PAGE_SIZE = 100
+
+FEED_FIELDS = {
+    "user_name": 1, "user_phone": 1, "breakdown_type": 1, "issue_type": 1,
+    "car_model": 1, "license_plate": 1, "created_at": 1, "completed_at": 1, "worker_assigned_at": 1,
+    "assigned_worker.worker_id": 1, "assigned_worker.worker_name": 1,
+    "mechanics_list.mech_id": 1, "mechanics_list.mech_name": 1, "mechanics_list.status": 1,
+    "mechanics_list.distance_km": 1, "mechanics_list.road_distance_km": 1,
+    "mechanics_list.rating": 1, "mechanics_list.comment": 1,
+}
+
+
+def _encode_feed_cursor(doc, field="created_at"):
+    # field is the feed's sort field: created_at, or completed_at for the completed feed
+    value = doc.get(field)
+    raw = f"{value.isoformat() if value else ''}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_feed_cursor(token):
+    value, _, last_id = base64.urlsafe_b64decode(token.encode()).decode().partition("|")
+    return (datetime.fromisoformat(value) if value else None), ObjectId(last_id)
+
+
+def _feed_item(doc):
+    doc["_id"] = str(doc["_id"])
+    for key in ("created_at", "completed_at", "worker_assigned_at"):
+        if isinstance(doc.get(key), datetime):
+            doc[key] = doc[key].isoformat()
+    for m in doc.get("mechanics_list", []):
+        if isinstance(m.get("mech_id"), ObjectId):
+            m["mech_id"] = str(m["mech_id"])
+    return doc
+
+
+def _stream_feed(cursor, limit, field):
+    """The JSON response written one request at a time; next_cursor comes last."""
+    try:
+        yield '{"status": "success", "requests": ['
+        sent, last, more = 0, None, False
+        for doc in cursor:
+            if sent == limit:
+                more = True
+                break
+            last = {"_id": doc["_id"], field: doc.get(field)}
+            yield ("," if sent else "") + json.dumps(_feed_item(doc), cls=DjangoJSONEncoder)
+            sent += 1
+        next_cursor = _encode_feed_cursor(last, field) if more else None
+        yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+    finally:
+        cursor.close()
+
+
+def _mechanic_feed(request, mechanic_id, completed):
+    try:
+        limit = min(max(int(request.GET.get("limit", FEED_PAGE_SIZE)), 1), FEED_MAX_PAGE_SIZE)
+        after = _decode_feed_cursor(request.GET["cursor"]) if request.GET.get("cursor") else None
+    except (ValueError, TypeError, InvalidId):
+        return JsonResponse({'error': 'Invalid cursor or limit'}, status=400)
+
+    query, sort = mechanic_feed_query(mechanic_id, completed=completed, after=after)
+    # One extra document tells whether there is a next page
+    cursor = db['service_requests'].find(query, FEED_FIELDS).sort(sort).limit(limit + 1)
+    return StreamingHttpResponse(_stream_feed(cursor, limit, sort[0][0]), content_type='application/json')
+
+
 # -----------------------------
 # API: Get recent service requests
 # -----------------------------
@@ -955,7 +1067,7 @@ def get_recent_requests(request):
         # db is already defined at the top of the file
         
         # Get mechanic by username to get their ID
-        mechanic = db['auth_mech'].find_one({'username': username})
+        mechanic = db['auth_mech'].find_one({'username': username}, {'_id': 1})
         if not mechanic:
             print(f"❌ [get_recent_requests] Mechanic not found with username: {username}")
             return JsonResponse({'error': 'Mechanic not found'}, status=404)
@@ -963,25 +1075,7 @@ def get_recent_requests(request):
         mechanic_id = str(mechanic['_id'])
         print(f"🔍 [get_recent_requests] Found mechanic ID: {mechanic_id}")
         
-        # Get all service requests from service_requests collection
-        service_requests = list(db['service_requests'].find({}).sort('created_at', -1))
-        
-        # Convert ObjectId to string for JSON serialization
-        for request in service_requests:
-            request['_id'] = str(request['_id'])
-            if 'created_at' in request:
-                request['created_at'] = request['created_at'].isoformat()
-            if 'completed_at' in request:
-                request['completed_at'] = request['completed_at'].isoformat()
-            if 'worker_assigned_at' in request:
-                request['worker_assigned_at'] = request['worker_assigned_at'].isoformat()
-
-        print(f"🔍 [get_recent_requests] Found {len(service_requests)} service requests")
-        
-        return JsonResponse({
-            'status': 'success',
-            'requests': service_requests
-        })
+        return _mechanic_feed(request, mechanic_id, completed=False)
 
     except Exception as e:
         print(f"❌ [get_recent_requests] Error: {str(e)}")
@@ -1030,7 +1124,7 @@ def get_completed_requests(request):
         # db is already defined at the top of the file
         
         # Get mechanic by username to get their ID
-        mechanic = db['auth_mech'].find_one({'username': username})
+        mechanic = db['auth_mech'].find_one({'username': username}, {'_id': 1})
         if not mechanic:
             print(f"❌ [get_completed_requests] Mechanic not found with username: {username}")
             return JsonResponse({'error': 'Mechanic not found'}, status=404)
@@ -1038,32 +1132,7 @@ def get_completed_requests(request):
         mechanic_id = str(mechanic['_id'])
         print(f"🔍 [get_completed_requests] Found mechanic ID: {mechanic_id}")
         
-        # Get completed service requests from service_requests collection
-        # Look for requests where any mechanic in mechanics_list has status 'completed'
-        completed_requests = list(db['service_requests'].find({
-            'mechanics_list': {
-                '$elemMatch': {
-                    'status': 'completed'
-                }
-            }
-        }).sort('completed_at', -1))
-        
-        # Convert ObjectId to string for JSON serialization
-        for request in completed_requests:
-            request['_id'] = str(request['_id'])
-            if 'created_at' in request:
-                request['created_at'] = request['created_at'].isoformat()
-            if 'completed_at' in request:
-                request['completed_at'] = request['completed_at'].isoformat()
-            if 'worker_assigned_at' in request:
-                request['worker_assigned_at'] = request['worker_assigned_at'].isoformat()
-
-        print(f"🔍 [get_completed_requests] Found {len(completed_requests)} completed service requests")
-        
-        return JsonResponse({
-            'status': 'success',
-            'requests': completed_requests
-        })
+        return _mechanic_feed(request, mechanic_id, completed=True)
 
     except Exception as e:
         print(f"❌ [get_completed_requests] Error: {str(e)}")
@@ -1122,6 +1191,8 @@ def submit_rating(request):
         # Insert into find_mech collection
         find_mech_result = db['find_mech'].insert_one(find_mech_doc)
         print(f"📝 Rating stored in find_mech collection with ID: {find_mech_result.inserted_id}")
+        # Let the recommender pick the new rating up without waiting for its next poll
+        recommender.request_refresh()
         
         # 2. Update mech_worker collection with rating
         # First, try to find the worker in mech_worker collection
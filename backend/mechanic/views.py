@@ -1,12 +1,13 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
-from django.db import connection
 import json
 import jwt
 from bson.objectid import ObjectId
 import re
 from dotenv import load_dotenv
+
+from backend.mongo import get_db
 import requests,os
 
 load_dotenv()
@@ -56,7 +57,7 @@ def _auth_mechanic(request):
 
 
 def _get_db():
-    return connection.cursor().db_conn
+    return get_db()
 
 
 def _normalize_phone(phone: str) -> str:
@@ -5,14 +5,13 @@ import requests
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
-from django.db import connection
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.hashers import check_password
 from django.core.mail import send_mail
 from django.core.cache import cache
 import jwt
 from django.conf import settings
-from django.db import connection
+from backend.mongo import get_db
 import os
 from bson import ObjectId
 from twilio.rest import Client
@@ -147,7 +146,7 @@ def signup(request):
             return JsonResponse({'error': 'Invalid email format'}, status=400)
 
         # Optionally, check for existing email/phone in both collections
-        db = connection.cursor().db_conn
+        db = get_db()
         if db['auth_users'].find_one({'email': email}) or db['auth_mech'].find_one({'email': email}):
             return JsonResponse({'error': 'Email already exists'}, status=400)
         if db['auth_users'].find_one({'phone': phone}) or db['auth_mech'].find_one({'phone': phone}):
@@ -200,7 +199,7 @@ def login(request):
         if not password or not user_type or (not phone and not username):
             return JsonResponse({'error': 'All fields required'}, status=400)
 
-        db = connection.cursor().db_conn
+        db = get_db()
         collection_name = 'auth_users' if user_type == 'user' else 'auth_mech'
 
         # Build query for phone or email/username
@@ -255,7 +254,7 @@ def create_password(request):
             return JsonResponse({'error': 'All fields required'}, status=400)
 
         hashed_password = make_password(password)
-        db = connection.cursor().db_conn
+        db = get_db()
         collection = 'auth_users' if user_type == 'user' else 'auth_mech'
 
         # Check if user already exists
@@ -329,7 +328,7 @@ def user_me(request):
         return JsonResponse({'error': 'Invalid token'}, status=401)
     user_type = payload.get('user_type')
     username = payload.get('username')
-    db = connection.cursor().db_conn
+    db = get_db()
     collection = 'auth_users' if user_type == 'user' else 'auth_mech'
     user = db[collection].find_one({'username': username})
     if not user:
@@ -376,7 +375,7 @@ def update_mechanic_availability(request):
     if payload.get('user_type') != 'mechanic':
         return JsonResponse({'error': 'Only mechanics can update availability'}, status=403)
     username = payload.get('username')
-    db = connection.cursor().db_conn
+    db = get_db()
     mech = db['auth_mech'].find_one({'username': username})
     if not mech:
         return JsonResponse({'error': 'Mechanic not found'}, status=404)
@@ -409,7 +408,7 @@ def forgot_password(request):
             return JsonResponse({'error': 'Invalid email format'}, status=400)
 
         # Check if user exists
-        db = connection.cursor().db_conn
+        db = get_db()
         collection_name = 'auth_users' if user_type == 'user' else 'auth_mech'
         user = db[collection_name].find_one({'email': email})
 
@@ -459,7 +458,7 @@ def reset_password(request):
             return JsonResponse({'error': 'Invalid OTP. Try again.'}, status=400)
 
         # Update password
-        db = connection.cursor().db_conn
+        db = get_db()
         collection_name = 'auth_users' if user_type == 'user' else 'auth_mech'
         user = db[collection_name].find_one({'email': email})
 
@@ -494,7 +493,7 @@ def google_login(request):
         if not email or not user_type:
             return JsonResponse({'error': 'Email and user type required'}, status=400)
 
-        db = connection.cursor().db_conn
+        db = get_db()
         collection = 'auth_users' if user_type == 'user' else 'auth_mech'
         user = db[collection].find_one({'email': email})
 
@@ -585,7 +584,7 @@ def get_mechanic(request, mech_id):
     if request.method != 'GET':
         return JsonResponse({'error': 'GET required'}, status=405)
 
-    db = connection.cursor().db_conn
+    db = get_db()
     try:
         mech = db['auth_mech'].find_one({'_id': ObjectId(mech_id)})
         if not mech:
@@ -612,7 +611,7 @@ def get_mechanic_profile(request, mechanic_id):
         print(f"🔍 [DEBUG] Getting mechanic profile for ID: {mechanic_id}")
 
         # Get database connection
-        db = connection.cursor().db_conn
+        db = get_db()
         
         # Fetch mechanic profile from auth_mech collection
         mechanic = db['auth_mech'].find_one({'_id': ObjectId(mechanic_id)})
@@ -660,7 +659,7 @@ def test_user_history(request):
 
     try:
         # Get database connection
-        db = connection.cursor().db_conn
+        db = get_db()
         
         # Query all mechanics with user_history
         mechanics_with_history = list(db['auth_mech'].find(
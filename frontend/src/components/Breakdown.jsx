@@ -206,7 +206,7 @@ useEffect(() => {
     );
   };
 
-  const handleNoMechanicsFound = (fetchedMechanics) => {
+  const handleNoMechanicsFound = (fetchedMechanics, fetchedCursor) => {
     // Show alert first
     Alert.alert(
       "No One Accepted Request",
@@ -223,7 +223,8 @@ useEffect(() => {
                 lon: prevCoords.current?.longitude || 0,
                 breakdown_type: issueType || 'engine',
                 isFallback: true,
-                preFetchedMechanics: fetchedMechanics // Pass the mechanics
+                preFetchedMechanics: fetchedMechanics, // Pass the mechanics
+                preFetchedCursor: fetchedCursor // and the cursor for their next page
               });
             } else {
               // Fallback: fetch mechanics again if none were fetched during radar
@@ -3,7 +3,7 @@ import { View, Text, StyleSheet, TouchableOpacity, Image, ScrollView, ActivityIn
 import LinearGradient from 'react-native-linear-gradient';
 import { useNavigation } from '@react-navigation/native';
 import AsyncStorage from '@react-native-async-storage/async-storage';
-import API from '../services/api';
+import API, { fetchFeed } from '../services/api';
 import backArrowIcon from '../images/arrow.png';
 import phoneIcon from '../images/phone.png';
 import messageIcon from '../images/message.png';
@@ -70,12 +70,13 @@ export default function CustomerHistory() {
 
       // Primary: Try to fetch from service_requests collection
       try {
-        const requestsResponse = await API.get('service-requests/recent/', {
+        // Every page of the feed: the history must not stop at the first one
+        const requestsData = await fetchFeed('service-requests/recent/', {
           headers: { Authorization: `Bearer ${token}` }
         });
 
-        if (requestsResponse.data && requestsResponse.data.requests) {
-          const allRequests = requestsResponse.data.requests;
+        if (requestsData && requestsData.requests) {
+          const allRequests = requestsData.requests;
           console.log('🔍 [CustomerHistory] Found service requests:', allRequests.length, 'items');
           
           // Filter requests where this mechanic is involved (either in mechanics_list or assigned_worker)
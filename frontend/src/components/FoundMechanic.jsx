@@ -7,13 +7,15 @@ import axios from 'axios';
 
 
 const FoundMechanic = ({ route, navigation }) => {
-  const { lat, lon, breakdown_type, isFallback, preFetchedMechanics,carDetails  } = route.params;
+  const { lat, lon, breakdown_type, isFallback, preFetchedMechanics, preFetchedCursor, carDetails  } = route.params;
   
   // Add this logging
   console.log('FoundMechanic received params:', { lat, lon, breakdown_type });
 
   const [mechanics, setMechanics] = useState([]);
   const [offset, setOffset] = useState(0);
+  // Opaque "next page" token from the server; pages after the first read the ranking it keeps
+  const [cursor, setCursor] = useState(null);
   const [loading, setLoading] = useState(false);
   const [allLoaded, setAllLoaded] = useState(false);
   const pollRef = useRef(null);
@@ -49,7 +51,7 @@ const FoundMechanic = ({ route, navigation }) => {
   };
   
 
-  const fetchMechanics = async () => {
+  const fetchMechanics = async (pageCursor = cursor) => {
     if (loading || allLoaded) return;
     setLoading(true);
 
@@ -57,18 +59,21 @@ const FoundMechanic = ({ route, navigation }) => {
       const response = await fetch('http://10.0.2.2:8000/api/recommendations/', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          lat,
-          lon,
-          breakdown_type,
-          offset,
-          limit: 5,
-        }),
+        body: JSON.stringify(pageCursor
+          ? { cursor: pageCursor, limit: 5 }
+          : { lat, lon, breakdown_type, offset, limit: 5 }),
       });
       
       const text = await response.text();
       console.log('Fetch response:', response.status, text);
 
+      if (response.status === 410 && pageCursor) {
+        // The server dropped the ranking; carry on from the offset instead
+        setCursor(null);
+        setLoading(false);
+        return fetchMechanics(null);
+      }
+
       if (!response.ok) {
         console.error('Server error:', response.status, text);
         Alert.alert("Error", `Server error: ${response.status}\n${text}`);
@@ -89,9 +94,10 @@ const FoundMechanic = ({ route, navigation }) => {
       console.log('Fetched mechanics:', result);
       if (result.status === 'success') {
         const newMechs = result.mechanics;
-        if (newMechs.length < 5) setAllLoaded(true);
+        if (result.has_more === false || newMechs.length === 0) setAllLoaded(true);
         setMechanics(prev => [...prev, ...newMechs]);
-        setOffset(prev => prev + 5);
+        setOffset(prev => prev + newMechs.length);
+        setCursor(result.cursor || null);
       } else {
         Alert.alert("Error", result.message || "No mechanics found.");
       }
@@ -182,6 +188,7 @@ const FoundMechanic = ({ route, navigation }) => {
       console.log('✅ Using pre-fetched mechanics from radar scan:', preFetchedMechanics);
       setMechanics(preFetchedMechanics);
       setOffset(preFetchedMechanics.length);
+      setCursor(preFetchedCursor || null);
       if (preFetchedMechanics.length < 5) setAllLoaded(true);
     } else {
       fetchMechanics();
@@ -225,7 +232,7 @@ const FoundMechanic = ({ route, navigation }) => {
               </View>
             ))}
             {!allLoaded && !loading &&(
-              <TouchableOpacity style={styles.loadMoreBtn} onPress={fetchMechanics} activeOpacity={0.85}>
+              <TouchableOpacity style={styles.loadMoreBtn} onPress={() => fetchMechanics()} activeOpacity={0.85}>
                 <Text style={styles.loadMoreText}>Load More</Text>
               </TouchableOpacity>
             )}
@@ -11,7 +11,7 @@ import customerIcon from '../images/customer.png';
 import hiIcon from '../images/hi.png';
 import { useNavigation } from '@react-navigation/native';
 import AsyncStorage from '@react-native-async-storage/async-storage';
-import API from '../services/api';
+import API, { fetchFeed } from '../services/api';
 import axios from 'axios';
 // import customerIcon from '../images/customer.png';
 
@@ -151,12 +151,13 @@ export default function MechHome() {
 
         // Fallback: Fetch service requests and calculate stats
         try {
-          const requestsResponse = await MechAPI.get('service-requests/recent/', {
+          // Totals need every page of the feed, not just the first
+          const requestsData = await fetchFeed('service-requests/recent/', {
             headers: { Authorization: `Bearer ${token}` }
           });
 
-          if (requestsResponse.data && requestsResponse.data.requests) {
-            const allRequests = requestsResponse.data.requests;
+          if (requestsData && requestsData.requests) {
+            const allRequests = requestsData.requests;
             console.log('📊 [MechHome] Found service requests:', allRequests.length, 'items');
             
             // Filter requests where this mechanic is involved (either in mechanics_list or assigned_worker)
@@ -283,8 +284,10 @@ export default function MechHome() {
         // Fetch service requests where this mechanic is involved
         try {
           console.log('🔍 [MechHome] Calling service-requests/recent/ with token:', token.substring(0, 20) + '...');
+          // The feed is this mechanic's requests, newest first: the first 3 are all this card shows
           const requestsResponse = await MechAPI.get('service-requests/recent/', {
-            headers: { Authorization: `Bearer ${token}` }
+            headers: { Authorization: `Bearer ${token}` },
+            params: { limit: 3 }
           });
 
           if (requestsResponse.data && requestsResponse.data.requests) {
@@ -29,6 +29,8 @@ const RadarModal = ({ visible, onClose, onNoMechanicsFound, onAssigned, userLoca
   const dotPulses = useRef([...Array(MECHANIC_COUNT)].map(() => new Animated.Value(1))).current;
   const timerRef = useRef(null);
   const [fetchedMechanics, setFetchedMechanics] = useState([]); // Add this state
+  // Latest scan for the timeout below, which would otherwise see the state from when it was set
+  const fetchedRef = useRef({ mechanics: [], cursor: null });
   const [localUser, setLocalUser] = useState(null);
   const [requestId, setRequestId] = useState(null);
   const pollRef = useRef(null);
@@ -190,6 +192,8 @@ const RadarModal = ({ visible, onClose, onNoMechanicsFound, onAssigned, userLoca
       if (result.status === 'success') {
         const mechanics = result.mechanics;
         setFetchedMechanics(mechanics);
+        // cursor lets FoundMechanic load the next page of this same ranking
+        fetchedRef.current = { mechanics, cursor: result.cursor || null };
         // ✅ Now call service request only after user is loaded
         if (localUser) {
           createServiceRequest(coords, mechanics);
@@ -224,7 +228,7 @@ const RadarModal = ({ visible, onClose, onNoMechanicsFound, onAssigned, userLoca
         
         // Then call onNoMechanicsFound with the fetched mechanics
         if (onNoMechanicsFound) {
-          onNoMechanicsFound(fetchedMechanics);
+          onNoMechanicsFound(fetchedRef.current.mechanics, fetchedRef.current.cursor);
         }
       }, 120000);
 
@@ -7,6 +7,7 @@ import userIcon from '../images/user.png';
 import phoneIcon from '../images/phone.png';
 import axios from 'axios';
 import AsyncStorage from '@react-native-async-storage/async-storage';
+import { fetchPendingRequests } from '../services/api';
 
 export default function Requests() {
   const navigation = useNavigation();
@@ -53,14 +54,14 @@ export default function Requests() {
       }
   
       try {
-        const url = `http://10.0.2.2:8000/api/pending-requests/?mech_id=${mechanicId}`;
-        console.log("📡 Fetching requests from:", url);
+        console.log("📡 Fetching pending requests for mechanic:", mechanicId);
   
-        const res = await axios.get(url);
-        console.log("🔹 Pending requests API response:", res.data);
+        // Every page, not just the first: the count on the tab bar must be the real one
+        const data = await fetchPendingRequests({ mech_id: mechanicId });
+        console.log("🔹 Pending requests API response:", data);
   
-                if (res.data.status === 'success') {
-          const formatted = res.data.requests.map(req => {
+                if (data.status === 'success') {
+          const formatted = data.requests.map(req => {
             let myDistance = "N/A";
 
             if (req.mechanics_list?.length) {
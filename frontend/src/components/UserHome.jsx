@@ -19,7 +19,7 @@ import boltIcon from '../images/bolt.png';
 import messageIcon from '../images/message.png';
 import refreshIcon from '../images/refresh.png';
 import AsyncStorage from '@react-native-async-storage/async-storage';
-import API from '../services/api';
+import API, { fetchPendingRequests } from '../services/api';
 import LiveMap from './LiveMap';
 import { useNavigation } from '@react-navigation/native';
 import MapView, { Marker } from 'react-native-maps';
@@ -408,23 +408,28 @@ const UserHome = ({
         }
       } catch (uae) { /* ignore and continue */ }
 
-      const response = await API.get('pending-requests/', {
-        headers: { Authorization: `Bearer ${token}` }
-      });
+      const isActiveUserRequest = req => {
+        const hasUserMatch = String(req.user_id) === String(user._id);
+        const hasMechanicsList = Array.isArray(req.mechanics_list) && req.mechanics_list.length > 0;
+        const hasAcceptedMechanic = hasMechanicsList && req.mechanics_list.some(mech => mech.status === 'accepted');
+        const hasAssignedWorker = !!req.assigned_worker;
+        const isAssignedStatus = req.status === 'assigned';
+        const notCompleted = !req.mechanics_list.some(mech => mech.status === 'completed');
+        return hasUserMatch && (hasAssignedWorker || hasAcceptedMechanic || isAssignedStatus) && notCompleted;
+      };
+
+      // Page through until this user's request turns up or the pages run out
+      const data = await fetchPendingRequests(
+        {},
+        { headers: { Authorization: `Bearer ${token}` } },
+        requests => requests.some(isActiveUserRequest)
+      );
       
-      console.log('📡 API Response:', response.data);
+      console.log('📡 API Response:', data);
       
-      if (response.data.status === 'success' && response.data.requests) {
-        console.log('✅ Found requests:', response.data.requests.length);
-        const userRequest = response.data.requests.find(req => {
-          const hasUserMatch = String(req.user_id) === String(user._id);
-          const hasMechanicsList = Array.isArray(req.mechanics_list) && req.mechanics_list.length > 0;
-          const hasAcceptedMechanic = hasMechanicsList && req.mechanics_list.some(mech => mech.status === 'accepted');
-          const hasAssignedWorker = !!req.assigned_worker;
-          const isAssignedStatus = req.status === 'assigned';
-          const notCompleted = !req.mechanics_list.some(mech => mech.status === 'completed');
-          return hasUserMatch && (hasAssignedWorker || hasAcceptedMechanic || isAssignedStatus) && notCompleted;
-        });
+      if (data.status === 'success' && data.requests) {
+        console.log('✅ Found requests:', data.requests.length);
+        const userRequest = data.requests.find(isActiveUserRequest);
         
         if (userRequest) {
           const acceptedMechanic = userRequest.mechanics_list.find(mech => mech.status === 'accepted');
@@ -87,8 +87,8 @@ export default function WorkerPage() {
           });
           return;
         }
-        // 2) Fallback: first pending request
-        url = `http://10.0.2.2:8000/api/pending-requests/?mech_id=${mechanicId}`;
+        // 2) Fallback: newest pending request; one is all this needs
+        url = `http://10.0.2.2:8000/api/pending-requests/?mech_id=${mechanicId}&limit=1`;
         res = await axios.get(url);
         if (res.data?.status === 'success' && res.data.requests?.length) {
           const r = res.data.requests[0];
@@ -5,4 +5,64 @@ const API = axios.create({
   // ...other config
 });
 
-export default API;
\ No newline at end of file
+// pending-requests/ returns one page (newest first) plus has_more. This
+// follows has_more until the last page, or until stop(requests) says the
+// caller has what it needs. A request arriving between pages shifts the
+// offsets by one, so repeats are dropped by _id.
+const PENDING_PAGE_SIZE = 200;
+const PENDING_MAX_PAGES = 20;
+
+export const fetchPendingRequests = async (params = {}, config = {}, stop = () => false) => {
+  const requests = [];
+  const seen = new Set();
+  let offset = 0;
+
+  for (let page = 0; page < PENDING_MAX_PAGES; page++) {
+    const res = await API.get('pending-requests/', {
+      ...config,
+      params: { ...params, offset, limit: PENDING_PAGE_SIZE },
+    });
+    if (res.data?.status !== 'success') {
+      return res.data;
+    }
+
+    for (const req of res.data.requests || []) {
+      if (!seen.has(req._id)) {
+        seen.add(req._id);
+        requests.push(req);
+      }
+    }
+    if (!res.data.has_more || stop(requests)) {
+      break;
+    }
+    offset += res.data.requests.length;
+  }
+
+  return { status: 'success', requests };
+};
+
+// service-requests/recent/ and service-requests/completed/ return one page
+// (newest first) plus next_cursor. This follows next_cursor to the end, so
+// history and totals cover every request, not just the first page.
+const FEED_PAGE_SIZE = 100;
+
+export const fetchFeed = async (path, config = {}) => {
+  const requests = [];
+  let cursor = null;
+
+  do {
+    const res = await API.get(path, {
+      ...config,
+      params: { ...(config.params || {}), limit: FEED_PAGE_SIZE, ...(cursor ? { cursor } : {}) },
+    });
+    if (res.data?.status !== 'success') {
+      return res.data;
+    }
+    requests.push(...(res.data.requests || []));
+    cursor = res.data.next_cursor;
+  } while (cursor);
+
+  return { status: 'success', requests, next_cursor: null };
+};
+
+export default API;